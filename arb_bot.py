@@ -27,15 +27,22 @@ import urllib.request, urllib.error, urllib.parse
 # v10-6: ใช้ Turso HTTP REST API ตรงๆ — ไม่พึ่ง libsql_client
 _libsql_mod = None
 HAS_TURSO = True  # จะ check จริงตอน turso_init
-from collections import defaultdict
+from bisect import bisect_left, insort
+from collections import defaultdict, deque
+from contextlib import nullcontext
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal, ROUND_DOWN
+from functools import lru_cache
+from sys import intern
 from dataclasses import dataclass, field, replace
 from typing import Optional
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from socketserver import ThreadingMixIn
 
 import aiohttp
+from aiohttp import web
+try:
+    import numpy as _np  # P8: optional — scan pre-screen ใช้ pure-Python ถ้าไม่มี
+except ImportError:
+    _np = None
 from dotenv import load_dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
@@ -197,6 +204,87 @@ MAX_STAKE_MAP = {
     "cloudbet":  MAX_STAKE_CLOUDBET,
 }
 
+# ── P29: Bookmaker registry ──────────────────────────────────────
+# เดิม: apply_slippage / apply_max_stake / apply_vb_book_cap ไล่ substring `k in bm.lower()` ทุก outcome
+# ตอนนี้: ชื่อ/key ของเว็บ resolve ครั้งเดียว → integer id + BookInfo (fee multiplier, cap, metadata)
+#   hot path index ตรง; COMMISSION / MAX_STAKE_MAP ยังเป็น config ต้นทาง (กฎ substring เดิม ตอน resolve)
+#   norm_bm_key() อ่านจาก registry — alias ชื่อเว็บอยู่ที่ _BOOK_ALIASES ที่เดียว
+_BOOK_ALIASES = {"1xbet": "onexbet", "1x bet": "onexbet", "stake.com": "stake"}
+_BOOK_META = {  # key → (region, kind, native feed)
+    "pinnacle":   ("global", "sharp",    "odds_api"),
+    "onexbet":    ("global", "soft",     "odds_api"),
+    "dafabet":    ("asia",   "soft",     "odds_api"),
+    "stake":      ("global", "soft",     "odds_api"),
+    "cloudbet":   ("global", "soft",     "cloudbet"),
+    "polymarket": ("global", "exchange", "polymarket"),
+    "kalshi":     ("us",     "exchange", "kalshi"),
+}
+
+
+class BookInfo:
+    """P29: ข้อมูลต่อเว็บที่คำนวณไว้แล้ว — อ่านอย่างเดียว"""
+    __slots__ = ("id", "key", "fee", "fee_mult", "fee_mult_f", "cap_thb", "region", "kind", "native")
+
+    def __init__(self, bid: int, key: str, fee: Decimal, cap_thb: Decimal, meta: tuple):
+        self.id         = bid
+        self.key        = key
+        self.fee        = fee
+        self.fee_mult   = Decimal("1") - fee
+        self.fee_mult_f = float(self.fee_mult)
+        self.cap_thb    = cap_thb
+        self.region, self.kind, self.native = meta
+
+    @property
+    def sharp(self) -> bool:
+        return self.kind == "sharp"
+
+
+class BookmakerRegistry:
+    """P29: bookmaker key/title → integer id → BookInfo
+    ชื่อที่ต่างกันแต่ normalize แล้วเป็น key เดียว (เช่น "1xBet" / "onexbet") ได้ id เดียวกัน
+    """
+
+    def __init__(self, fees: dict, caps: dict, meta: dict, aliases: dict):
+        self._fees, self._caps, self._meta, self._aliases = fees, caps, meta, aliases
+        self._infos: list[BookInfo] = []
+        self._by_key:  dict[str, int] = {}   # normalized key → id
+        self._by_name: dict[str, int] = {}   # ชื่อดิบที่เคยเห็น → id
+
+    def norm(self, name: str) -> str:
+        s = (name or "").lower().strip()
+        return self._aliases.get(s, s)
+
+    def id(self, name: str) -> int:
+        bid = self._by_name.get(name)
+        if bid is None:
+            key = self.norm(name)
+            bid = self._by_key.get(key)
+            if bid is None:
+                # กฎเดิม: entry แรกของ COMMISSION / MAX_STAKE_MAP ที่เป็น substring ของชื่อ
+                fee = next((v for k, v in self._fees.items() if k in key), Decimal("0"))
+                cap = next((v for k, v in self._caps.items() if k in key), Decimal("0"))
+                meta = next((v for k, v in self._meta.items() if k in key), ("", "", ""))
+                bid = self._by_key[key] = len(self._infos)
+                self._infos.append(BookInfo(bid, key, fee, cap, meta))
+            self._by_name[name] = bid
+        return bid
+
+    def info(self, name: str) -> BookInfo:
+        return self._infos[self.id(name)]
+
+    def __getitem__(self, bid: int) -> BookInfo:
+        return self._infos[bid]
+
+    def __len__(self):
+        return len(self._infos)
+
+    def snapshot(self) -> list[dict]:
+        return [{"id": b.id, "key": b.key, "fee": float(b.fee), "cap_thb": float(b.cap_thb),
+                 "region": b.region, "kind": b.kind, "native": b.native} for b in self._infos]
+
+
+_books = BookmakerRegistry(COMMISSION, MAX_STAKE_MAP, _BOOK_META, _BOOK_ALIASES)
+
 
 # ══════════════════════════════════════════════════════════════════
 #  DATA MODELS
@@ -269,6 +357,7 @@ class TradeRecord:
     leg3_odds:   Optional[float] = None
     stake3_thb:  Optional[int]   = None
     needs_manual_review: bool = False  # M2: True = ถูกย้ายไป _manual_review_pending (persist ข้าม restart)
+    refetch_ms:  str = ""   # P16: JSON {"leg1": ms, "leg2": ms, ..., "total": ms} — เวลา live refetch ตอน confirm
 
 # ══════════════════════════════════════════════════════════════════
 #  STATE
@@ -340,7 +429,8 @@ CREATE TABLE IF NOT EXISTS trade_records (
     commence_time TEXT DEFAULT '',
     leg3_bm TEXT DEFAULT NULL, leg3_team TEXT DEFAULT NULL,
     leg3_odds REAL DEFAULT NULL, stake3_thb INTEGER DEFAULT NULL,
-    needs_manual_review INTEGER DEFAULT 0
+    needs_manual_review INTEGER DEFAULT 0,
+    refetch_ms TEXT DEFAULT ''
 );
 CREATE TABLE IF NOT EXISTS opportunity_log (
     id TEXT PRIMARY KEY, event TEXT, sport TEXT, profit_pct REAL,
@@ -359,6 +449,17 @@ CREATE TABLE IF NOT EXISTS line_movements (
 CREATE TABLE IF NOT EXISTS bot_state (
     key TEXT PRIMARY KEY, value TEXT
 );
+CREATE TABLE IF NOT EXISTS event_registry (
+    cid TEXT PRIMARY KEY, sport TEXT, home TEXT, away TEXT,
+    commence TEXT, bucket INTEGER, teams TEXT, created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS event_sources (
+    source TEXT, source_id TEXT, cid TEXT,
+    PRIMARY KEY (source, source_id)
+);
+CREATE TABLE IF NOT EXISTS team_aliases (
+    alias TEXT PRIMARY KEY, canonical TEXT, source TEXT, created_at TEXT
+);
 """
 
 # ── Turso HTTP REST API (v10-6) ───────────────────────────────────
@@ -366,28 +467,77 @@ _turso_url:   str = ""
 _turso_token: str = ""
 _turso_ok:    bool = False
 
-def _turso_http(statements: list) -> list:
-    """POST to Turso /v2/pipeline — returns list of result rows per statement"""
-    body = json.dumps({"requests": [
-        {"type": "execute", "stmt": {
-            "sql": s["sql"],
-            "args": [{"type": _turso_val_type(v), "value": _turso_val(v)} for v in s.get("args", [])]
-        }} for s in statements
-    ] + [{"type": "close"}]}).encode()
-    req = urllib.request.Request(
+def _turso_stmt(sql: str, args=()) -> dict:
+    """encode statement เป็น wire format ของ /v2/pipeline (typed args)"""
+    return {
+        "sql": sql,
+        "args": [{"type": _turso_val_type(v), "value": _turso_val(v)} for v in args],
+    }
+
+# P10: native asyncio client — connection pool แยกจาก odds feeds (DB write ไม่ต่อคิวหลัง scan)
+TURSO_TIMEOUT_SEC   = _i("TURSO_TIMEOUT_SEC",   10)
+TURSO_POOL_SIZE     = _i("TURSO_POOL_SIZE",     8)    # keep-alive connections ไป Turso
+TURSO_RETRY_RATIO   = float(_d("TURSO_RETRY_RATIO", "0.2"))  # retry ได้ ≤20% ของ request ที่สำเร็จ
+TURSO_RETRY_RESERVE = _i("TURSO_RETRY_RESERVE", 10)   # retry ขั้นต่ำที่มีให้เสมอ (burst เล็กๆ)
+
+_turso_session: Optional[aiohttp.ClientSession] = None
+
+def _get_turso_session() -> aiohttp.ClientSession:
+    global _turso_session
+    if _turso_session is None or _turso_session.closed:
+        _turso_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=TURSO_POOL_SIZE, keepalive_timeout=60, ttl_dns_cache=300,
+            ),
+            timeout=aiohttp.ClientTimeout(total=TURSO_TIMEOUT_SEC, connect=min(5, TURSO_TIMEOUT_SEC)),
+        )
+    return _turso_session
+
+async def close_turso_session() -> None:
+    global _turso_session
+    s, _turso_session = _turso_session, None
+    if s is not None and not s.closed:
+        await s.close()
+
+class _RetryBudget:
+    """P10: retry budget — กัน retry storm ตอน Turso ล่ม
+    request ที่สำเร็จฝาก ratio token (เต็มที่ reserve), retry แต่ละครั้งถอน 1 token
+    """
+    def __init__(self, ratio: float, reserve: int):
+        self.ratio  = ratio
+        self.cap    = float(reserve)
+        self.tokens = float(reserve)
+
+    def record_success(self):
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+_turso_retry_budget = _RetryBudget(TURSO_RETRY_RATIO, TURSO_RETRY_RESERVE)
+
+async def _turso_pipeline(stmts: list[dict]) -> list:
+    """P9: POST wire-format stmts ใน request เดียว — คืนผลต่อ statement (rows หรือ RuntimeError)
+    raise เฉพาะ transport/HTTP error (ทั้ง batch ไม่แน่ใจว่าเขียนหรือยัง)
+    P10: aiohttp บน pooled keep-alive session — ไม่กิน executor thread
+    """
+    body = {"requests": [
+        {"type": "execute", "stmt": st} for st in stmts
+    ] + [{"type": "close"}]}
+    async with _get_turso_session().post(
         f"{_turso_url}/v2/pipeline",
-        data=body,
-        headers={"Authorization": f"Bearer {_turso_token}", "Content-Type": "application/json"},
-        method="POST"
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            raw = resp.read()
-    except urllib.error.HTTPError as he:
-        err_body = he.read().decode(errors="replace")[:500]
-        log.error(f"[DB] Turso HTTP {he.code}: {err_body}")
-        raise RuntimeError(f"Turso HTTP {he.code}: {err_body[:200]}") from he  # B9: removed raw body log
-    data = json.loads(raw)
+        json=body,
+        headers={"Authorization": f"Bearer {_turso_token}"},
+    ) as resp:
+        if resp.status >= 400:
+            err_body = (await resp.text(errors="replace"))[:500]
+            log.error(f"[DB] Turso HTTP {resp.status}: {err_body}")
+            raise RuntimeError(f"Turso HTTP {resp.status}: {err_body[:200]}")  # B9: removed raw body log
+        data = await resp.json(content_type=None)
+    _turso_retry_budget.record_success()
     # DEBUG: log first response item type to verify format
     if data.get("results"):
         first = data["results"][0]
@@ -397,14 +547,22 @@ def _turso_http(statements: list) -> list:
         itype = item.get("type")
         if itype == "error":
             msg = item.get("error", {}).get("message") or str(item)
-            raise RuntimeError(msg)
+            results.append(RuntimeError(msg))
         # Turso /v2/pipeline returns {"type":"ok","response":{"type":"execute","result":{...}}}
-        if itype == "ok":
+        elif itype == "ok":
             rs = item.get("response", {}).get("result", {})
             rows = [tuple(v.get("value") for v in row) for row in rs.get("rows", [])]
             results.append(rows)
     return results
 
+async def _turso_http(statements: list) -> list:
+    """POST to Turso /v2/pipeline — returns list of result rows per statement"""
+    results = await _turso_pipeline([_turso_stmt(s["sql"], s.get("args", [])) for s in statements])
+    for r in results:
+        if isinstance(r, Exception):
+            raise r
+    return results
+
 def _turso_val_type(v) -> str:
     if v is None:              return "null"
     if isinstance(v, bool):    return "integer"  # bool before int
@@ -424,15 +582,8 @@ def _turso_val(v):
     return str(v)
 
 def norm_bm_key(name: str) -> str:
-    """Normalize bookmaker display name → API key for CLV lookup."""
-    s = (name or "").lower().strip()
-    if s in ("1xbet", "onexbet", "1x bet"):
-        return "onexbet"
-    if s in ("stake", "stake.com"):
-        return "stake"
-    if s in ("cloudbet",):
-        return "cloudbet"
-    return s
+    """Normalize bookmaker display name → API key for CLV lookup. (P29: alias อยู่ใน _books)"""
+    return _books.norm(name)
 
 
 def _turso_val_json(v):
@@ -460,16 +611,14 @@ async def turso_init():
     _turso_token = token
     log.info(f"[DB] Turso endpoint → {_turso_url[:50]}")
     try:
-        loop = asyncio.get_running_loop()
-        def _init():
-            stmts = [{"sql": s.strip()} for s in CREATE_TABLES_SQL.strip().split(";") if s.strip()]
-            stmts.append({"sql": "SELECT COUNT(*) FROM trade_records"})
-            results = _turso_http(stmts)
-            count = results[-1][0][0] if results and results[-1] else 0
-            return count
-        count = await loop.run_in_executor(None, _init)
+        stmts = [{"sql": s.strip()} for s in CREATE_TABLES_SQL.strip().split(";") if s.strip()]
+        stmts.append({"sql": "SELECT COUNT(*) FROM trade_records"})
+        results = await _turso_http(stmts)
+        count = results[-1][0][0] if results and results[-1] else 0
+        await _replay_spill()  # P9: write ที่ค้างจากรอบก่อน (Turso ล่ม/shutdown) — ก่อน write ใหม่
         _turso_ok = True
         _db_write_halted = False  # clear any stale halt from previous runtime
+        await replica_reconcile()  # P11: ดึง Turso → SQLite local ก่อนอ่าน state/records
         auto_scan = True           # re-enable scan after successful (re)connect
         db_save_state("auto_scan", "True")  # overwrite halted-False in DB
         log.info(f"[DB] Turso HTTP connected ✅ | trade_records={count}")
@@ -478,45 +627,53 @@ async def turso_init():
         _turso_ok = False
         db_init_local()
 
+def _halt_db_writes(e: Exception):
+    """Turso เขียนไม่ได้ 3 ครั้ง → safe-mode: หยุด scan + หยุดเขียน DB ทั้งหมด"""
+    global auto_scan, _db_write_halted, _turso_ok
+    auto_scan = False
+    if _app:
+        try:
+            asyncio.get_running_loop().create_task(
+                _app.bot.send_message(
+                    chat_id=CHAT_ID,
+                    text=f"🚨 *DB CRITICAL*: Turso write failed 3x\n`{str(e)[:120]}`\n❌ *Auto scan หยุดแล้ว* — หยุดเขียน DB ทั้งหมด",
+                    parse_mode="Markdown"
+                )
+            )
+        except Exception:
+            pass
+    _db_write_halted = True
+    _turso_ok = False
+
 async def turso_exec(sql: str, params: tuple = ()):
     """Execute write query (Turso HTTP หรือ SQLite fallback)"""
-    global auto_scan, _db_write_halted, _turso_ok
     # C1: early bail if writes are halted — raise so callers know
     if _db_write_halted:
         raise RuntimeError("[DB] writes halted — skipping (safe-mode)")
     if _turso_ok:
         for attempt in range(3):
             try:
-                loop = asyncio.get_running_loop()
-                await loop.run_in_executor(None, lambda: _turso_http(
-                    [{"sql": sql, "args": list(params)}]
-                ))
+                async with _replica_guard():
+                    await _turso_http([{"sql": sql, "args": list(params)}])
+                    _replica_apply([_turso_stmt(sql, params)])  # P11
                 return
             except Exception as e:
                 emsg = str(e).lower()
                 # benign migration errors — skip retry, no warning
                 if "duplicate column" in emsg or "already exists" in emsg:
                     log.debug(f"[DB] turso_exec migration (ok): {e}")
+                    _replica_apply([_turso_stmt(sql, params)])  # replica อาจยังไม่มีคอลัมน์นี้
                     return
+                if attempt < 2 and not _turso_retry_budget.try_spend():
+                    # P10: retry budget หมด — fail-loud เฉพาะ call นี้ ไม่ halt ทั้งระบบ
+                    log.error(f"[DB] turso_exec retry budget exhausted: {e!r}")
+                    raise RuntimeError(f"[DB] turso write failed (retry budget exhausted): {e!r}") from e
                 if attempt < 2:
                     log.warning(f"[DB] turso_exec attempt {attempt+1} failed: {e!r}")
                     await asyncio.sleep(1.5 ** attempt)
                 else:
                     log.error(f"[DB] turso_exec failed 3x: {e!r} — halting writes")
-                    auto_scan = False
-                    if _app:
-                        try:
-                            asyncio.get_running_loop().create_task(
-                                _app.bot.send_message(
-                                    chat_id=CHAT_ID,
-                                    text=f"🚨 *DB CRITICAL*: Turso write failed 3x\n`{str(e)[:120]}`\n❌ *Auto scan หยุดแล้ว* — หยุดเขียน DB ทั้งหมด",
-                                    parse_mode="Markdown"
-                                )
-                            )
-                        except Exception:
-                            pass
-                    _db_write_halted = True
-                    _turso_ok = False
+                    _halt_db_writes(e)
                     # C1: raise so every caller knows the write failed — ห้าม silent return
                     raise RuntimeError(f"[DB] turso write failed 3x: {e!r}") from e
     # SQLite-only mode (ใช้เฉพาะตอน Turso init fail ตั้งแต่แรก หรือไม่ได้ตั้ง Turso)
@@ -541,11 +698,12 @@ async def turso_query(sql: str, params: tuple = ()) -> list:
         log.error("[DB] reads halted after Turso failure — refusing SQLite fallback")
         return []
     if _turso_ok:
+        if _replica_ok:
+            rows = _replica_query(sql, params)  # P11: อ่านจาก replica local — ไม่ต้องยิง Turso
+            if rows is not None:
+                return rows
         try:
-            loop = asyncio.get_running_loop()
-            results = await loop.run_in_executor(None, lambda: _turso_http(
-                [{"sql": sql, "args": list(params)}]
-            ))
+            results = await _turso_http([{"sql": sql, "args": list(params)}])
             return results[0] if results else []
         except Exception as e:
             log.error(f"[DB] turso_query: {e!r}")
@@ -559,6 +717,441 @@ async def turso_query(sql: str, params: tuple = ()) -> list:
         log.error(f"[DB] sqlite_query: {e}")
         return []
 
+# ── Turso write-behind queue (P9) ─────────────────────────────────
+# รวม write หลายตัวเป็น /v2/pipeline request เดียวต่อ flush window
+# FIFO + flusher ตัวเดียว → ลำดับต่อ key คงเดิมเสมอ; queue มี maxsize → back-pressure
+TURSO_FLUSH_MS   = _i("TURSO_FLUSH_MS",   250)   # รอรวม batch สูงสุดกี่ ms หลังได้ write แรก
+TURSO_BATCH_MAX  = _i("TURSO_BATCH_MAX",  200)   # statements ต่อ pipeline request
+TURSO_QUEUE_MAX  = _i("TURSO_QUEUE_MAX",  2000)  # เต็มแล้ว: turso_write รอ / turso_write_nowait ย้ายของค้างลง spill
+TURSO_SPILL_PATH = _s("TURSO_SPILL_PATH", "/tmp/arb_bot_turso_spill.jsonl")  # write ที่ส่งไม่ได้ → replay ก่อน write ใหม่
+TURSO_SPILL_RETRY_SEC = _i("TURSO_SPILL_RETRY_SEC", 30)  # queue ว่างแต่ spill ค้าง → ลอง replay ทุกกี่วินาที
+
+@dataclass
+class _PendingWrite:
+    stmt:  dict                              # wire format จาก _turso_stmt()
+    key:   str = ""                          # coalesce key — write ล่าสุดของ (key, sql) เดียวกันใน batch ชนะ
+    spill: bool = False                      # fire-and-forget → เขียนลง spill file ถ้า Turso ล่ม
+    fut:   Optional[asyncio.Future] = None
+
+_write_queue:   Optional[asyncio.Queue] = None  # สร้างใน post_init() (ต้องอยู่บน main loop)
+_write_flusher: Optional[asyncio.Task]  = None
+
+def _is_benign_db_error(e: Exception) -> bool:
+    emsg = str(e).lower()
+    return "duplicate column" in emsg or "already exists" in emsg
+
+def _write_spill_file(path: str, stmts: list[dict], mode: str = "a"):
+    with open(path, mode, encoding="utf-8") as f:
+        for st in stmts:
+            f.write(json.dumps(st) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _spill_writes(stmts: list[dict]):
+    """append statements ลง spill file (fsync) — replay ตอน Turso กลับมา"""
+    if not stmts: return
+    try:
+        _write_spill_file(TURSO_SPILL_PATH, stmts)
+        log.warning(f"[DB] spilled {len(stmts)} writes → {TURSO_SPILL_PATH}")
+    except Exception as e:
+        log.error(f"[DB] spill failed — {len(stmts)} writes lost: {e}")
+
+def _read_spill(path: str) -> list[dict]:
+    """อ่าน spill ทีละบรรทัด — บรรทัดเสีย (crash กลาง append → บรรทัดสุดท้ายขาด) log แล้วข้าม ไม่ทิ้งทั้งไฟล์"""
+    stmts = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip(): continue
+            try:
+                st = json.loads(line)
+            except ValueError:
+                st = None
+            if not isinstance(st, dict):
+                log.error(f"[DB] spill {path}:{n} unreadable — skipped: {line[:60]!r}")
+                continue
+            stmts.append(st)
+    return stmts
+
+def _spill_backlog() -> bool:
+    return os.path.exists(TURSO_SPILL_PATH) or os.path.exists(TURSO_SPILL_PATH + ".replay")
+
+async def _replay_spill() -> int:
+    """ส่ง spill file เข้า Turso เป็น batch ตามลำดับ; ที่ค้างจะถูกเขียนกลับไว้หน้าสุดของ spill file
+    เรียกทั้งตอน turso_init และจาก flusher ก่อนส่ง write ใหม่ (write เก่าต้องไม่ทับ write ที่ใหม่กว่า)
+    """
+    if not _spill_backlog():
+        return 0
+    work = TURSO_SPILL_PATH + ".replay"
+    stmts, loaded, done = [], False, 0
+    try:
+        if not os.path.exists(work):
+            os.replace(TURSO_SPILL_PATH, work)
+        elif os.path.exists(TURSO_SPILL_PATH):
+            # .replay ค้างจาก process ที่ตายกลาง replay — เก่ากว่า spill ปัจจุบัน ต้องไปก่อน; รวมเป็นไฟล์เดียวก่อนส่ง
+            _write_spill_file(work + ".tmp", _read_spill(work) + _read_spill(TURSO_SPILL_PATH), "w")
+            os.replace(work + ".tmp", work)
+            os.remove(TURSO_SPILL_PATH)
+        stmts = _read_spill(work)
+        loaded = True
+        for i in range(0, len(stmts), TURSO_BATCH_MAX):
+            chunk = stmts[i:i + TURSO_BATCH_MAX]
+            ok = []
+            for st, res in zip(chunk, await _turso_pipeline(chunk)):
+                if isinstance(res, Exception) and not _is_benign_db_error(res):
+                    log.error(f"[DB] spill replay dropped statement: {res} | {st.get('sql','')[:60]}")
+                else:
+                    ok.append(st)
+            _replica_apply(ok)  # P11
+            done += len(chunk)
+    except Exception as e:
+        log.error(f"[DB] spill replay interrupted after {done}/{len(stmts)}: {e!r}")
+        if not loaded:
+            return 0  # .replay ยังอยู่ครบ — รอบหน้าหยิบไปต่อ
+        # ที่เหลือต้องมาก่อน write ที่ถูก spill ระหว่าง replay — เขียนไฟล์ใหม่ตามลำดับเดิม
+        newer = []
+        try:
+            if os.path.exists(TURSO_SPILL_PATH):
+                newer = _read_spill(TURSO_SPILL_PATH)
+                os.remove(TURSO_SPILL_PATH)
+            _write_spill_file(TURSO_SPILL_PATH + ".tmp", stmts[done:] + newer, "w")
+            os.replace(TURSO_SPILL_PATH + ".tmp", TURSO_SPILL_PATH)
+        except Exception as e2:
+            log.error(f"[DB] spill tail write-back failed — keeping {work}: {e2!r}")
+            if newer:
+                _spill_writes(newer)
+            return done  # .replay ยังอยู่ — รอบหน้า adopt (ส่งซ้ำส่วนที่ done แล้วได้ — UPSERT/UPDATE idempotent)
+    os.remove(work)
+    if done:
+        log.info(f"[DB] replayed {done} spilled writes")
+    return done
+
+def _coalesce_key(w: _PendingWrite) -> tuple:
+    # statement ต่างชนิดของแถวเดียวกัน (INSERT OR REPLACE + UPDATE status) ต้องส่งครบตามลำดับ — รวมเฉพาะ sql เดียวกัน
+    return (w.key, w.stmt.get("sql", ""))
+
+async def _flush_writes(batch: list[_PendingWrite]):
+    # coalesce: (key, sql) เดียวกันส่งแค่ตัวล่าสุด — ตัวที่ถูกทับได้ผลลัพธ์เดียวกับตัวที่ทับ
+    last_idx = {_coalesce_key(w): i for i, w in enumerate(batch) if w.key}
+    send = [w for i, w in enumerate(batch) if not w.key or last_idx[_coalesce_key(w)] == i]
+    err: Optional[Exception] = None
+    results: list = []
+    if _db_write_halted:
+        # halt ระหว่างรอใน queue — ไม่ยิงซ้ำ เก็บลง spill แทน
+        _spill_writes([w.stmt for w in send if w.spill])
+        err = RuntimeError("[DB] writes halted — skipping (safe-mode)")
+    elif _spill_backlog():
+        # write ที่ spill ไว้ต้องลง Turso ก่อน — ไม่งั้น replay ทีหลังจะเอาค่าเก่าทับค่าใหม่
+        await _replay_spill()
+        if _spill_backlog():
+            # Turso ยังไม่พร้อม — ต่อท้าย spill (คงลำดับ) แทนส่งแซง, ที่ไม่ spillable fail-loud
+            _spill_writes([w.stmt for w in send if w.spill])
+            err = RuntimeError("[DB] spill backlog not replayed yet — write deferred")
+    for attempt in range(3 if err is None else 0):
+        try:
+            results = await _turso_pipeline([w.stmt for w in send])
+            break
+        except Exception as e:
+            if attempt < 2 and not _turso_retry_budget.try_spend():
+                # P10: retry budget หมด — ไม่ halt; spillable → spill file, ที่เหลือ fail-loud
+                log.error(f"[DB] write batch ({len(send)}) retry budget exhausted: {e!r}")
+                _spill_writes([w.stmt for w in send if w.spill])
+                err = RuntimeError(f"[DB] turso write failed (retry budget exhausted): {e!r}")
+                break
+            if attempt < 2:
+                log.warning(f"[DB] write batch ({len(send)}) attempt {attempt+1} failed: {e!r}")
+                await asyncio.sleep(1.5 ** attempt)
+            else:
+                log.error(f"[DB] write batch failed 3x: {e!r} — halting writes")
+                _spill_writes([w.stmt for w in send if w.spill])
+                _halt_db_writes(e)
+                err = RuntimeError(f"[DB] turso write failed 3x: {e!r}")
+    outcome: dict[int, Optional[Exception]] = {}
+    for i, w in enumerate(send):
+        res = results[i] if i < len(results) else None
+        if err is None and isinstance(res, Exception) and not _is_benign_db_error(res):
+            log.error(f"[DB] write failed: {res} | {w.stmt.get('sql','')[:60]}")
+            outcome[id(w)] = RuntimeError(f"[DB] turso write failed: {res}")
+        else:
+            outcome[id(w)] = err
+    if err is None:
+        _replica_apply([w.stmt for w in send if outcome[id(w)] is None])  # P11
+    by_key = {_coalesce_key(w): w for w in send if w.key}
+    for w in batch:
+        e = outcome[id(by_key[_coalesce_key(w)] if w.key else w)]
+        if err is not None and w.spill:
+            e = None  # อยู่ใน spill file แล้ว — flusher replay ตามลำดับเมื่อ Turso กลับมา
+        if w.fut is not None and not w.fut.done():
+            if e is None: w.fut.set_result(None)
+            else:         w.fut.set_exception(e)
+
+async def _write_flush_loop():
+    """flusher ตัวเดียว — รอ write แรก แล้วรวมต่อจนครบ TURSO_FLUSH_MS หรือ TURSO_BATCH_MAX"""
+    loop = asyncio.get_running_loop()
+    while True:
+        if _spill_backlog() and _turso_ok and not _db_write_halted:
+            try:
+                first = await asyncio.wait_for(_write_queue.get(), TURSO_SPILL_RETRY_SEC)
+            except asyncio.TimeoutError:
+                try:
+                    async with _replica_guard():
+                        await _replay_spill()
+                except Exception as e:
+                    log.error(f"[DB] spill replay crash: {e!r}")
+                continue
+        else:
+            first = await _write_queue.get()
+        batch = [first]
+        deadline = loop.time() + TURSO_FLUSH_MS / 1000
+        while len(batch) < TURSO_BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0: break
+            if not batch[-1].spill:
+                break  # มีคนรอผล (เช่น execute_both) — flush เลยพร้อมของที่ค้างอยู่
+            try:
+                batch.append(await asyncio.wait_for(_write_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        try:
+            async with _replica_guard():  # P11: ไม่ flush ระหว่าง reconcile snapshot
+                await _flush_writes(batch)
+        except Exception as e:
+            log.error(f"[DB] flush crash: {e!r}", exc_info=True)
+            for w in batch:
+                if w.fut is not None and not w.fut.done():
+                    w.fut.set_exception(e)
+
+def start_write_queue():
+    """เรียกใน post_init() — ต้องอยู่บน main loop"""
+    global _write_queue, _write_flusher
+    _write_queue   = asyncio.Queue(maxsize=TURSO_QUEUE_MAX)
+    _write_flusher = asyncio.get_running_loop().create_task(_write_flush_loop())
+
+async def drain_write_queue(timeout: float = 10):
+    """flush ทุกอย่างที่ค้างใน queue (graceful shutdown) — เกิน timeout → spill"""
+    global _write_flusher
+    if _write_queue is None: return
+    pending = []
+    while not _write_queue.empty():
+        pending.append(_write_queue.get_nowait())
+    if pending and _turso_ok:
+        try:
+            for i in range(0, len(pending), TURSO_BATCH_MAX):
+                async with _replica_guard():
+                    await asyncio.wait_for(_flush_writes(pending[i:i + TURSO_BATCH_MAX]), timeout)
+            pending = []
+        except Exception as e:
+            log.error(f"[DB] drain failed: {e!r}")
+    _spill_writes([w.stmt for w in pending if not (w.fut and w.fut.done())])
+    if _write_flusher is not None:
+        _write_flusher.cancel()
+        _write_flusher = None
+
+def spill_write_queue_sync(skip_keys: set[str] = frozenset()):
+    """signal handler (sync) — เขียนของค้างใน queue ลง spill file ก่อน os._exit
+    skip_keys: key ที่ caller เขียนค่าล่าสุดเองแล้ว — กัน replay ค่าเก่าทับ
+    """
+    if _write_queue is None: return
+    stmts = []
+    while True:
+        try: w = _write_queue.get_nowait()
+        except Exception: break
+        if w.key not in skip_keys:
+            stmts.append(w.stmt)
+    _spill_writes(stmts)
+
+async def turso_write(sql: str, params: tuple = (), key: str = "", spill: bool = False):
+    """P9: write ผ่าน write-behind queue — รอจน batch ที่มี statement นี้ flush สำเร็จ
+    raise RuntimeError ถ้าเขียนไม่ได้ (C1 fail-loud เหมือน turso_exec)
+    spill=True (fire-and-forget): ถ้า Turso ล่ม/halted → เก็บลง spill file แทนทิ้ง (ไม่ raise)
+    """
+    if _db_write_halted:
+        if spill and _turso_url:
+            _spill_writes([_turso_stmt(sql, params)])  # durable แล้ว — ไม่ต้อง raise
+            return
+        raise RuntimeError("[DB] writes halted — skipping (safe-mode)")
+    if _write_queue is None or not _turso_ok:
+        return await turso_exec(sql, params)  # SQLite-only mode / ก่อน post_init
+    fut = asyncio.get_running_loop().create_future()
+    await _write_queue.put(_PendingWrite(_turso_stmt(sql, params), key, spill, fut))  # back-pressure
+    await fut
+
+def _spill_overflow(w: _PendingWrite):
+    """queue เต็ม — ย้ายของค้าง (เก่ากว่า) ลง spill ก่อนตัวใหม่ ลำดับคงเดิม; flusher replay spill ก่อน batch ถัดไป
+    write ที่มีคนรอผลแบบ non-spill ถูก fail-loud (caller จัดการ RuntimeError อยู่แล้ว) — ไม่ส่งแซงของที่ spill ไว้
+    """
+    older = []
+    while True:
+        try: older.append(_write_queue.get_nowait())
+        except asyncio.QueueEmpty: break
+    spilled = [o for o in older if o.spill] + [w]
+    _spill_writes([o.stmt for o in spilled])
+    log.warning(f"[DB] write queue full ({TURSO_QUEUE_MAX}) — spilled {len(spilled)} writes")
+    for o in older:
+        if o.fut is not None and not o.fut.done():
+            if o.spill: o.fut.set_result(None)
+            else:       o.fut.set_exception(RuntimeError("[DB] write queue full — write not sent"))
+
+def turso_write_nowait(sql: str, params: tuple = (), key: str = "") -> bool:
+    """P9: fire-and-forget write (spill=True) — enqueue แบบ sync ไม่สร้าง task ต่อ write
+    คืน False = queue เต็ม (back-pressure): write นี้และของค้างลง spill file แทน — ไม่หาย
+    เรียกจาก thread อื่น (dashboard HTTP) → ส่งต่อไป main loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        if _main_loop and not _main_loop.is_closed():
+            _main_loop.call_soon_threadsafe(turso_write_nowait, sql, params, key)
+        else:
+            log.warning("[DB] turso_write_nowait: no event loop available")
+        return True
+    if _db_write_halted:
+        if _turso_url:
+            _spill_writes([_turso_stmt(sql, params)])
+        return True
+    if _write_queue is None or not _turso_ok:
+        _schedule_coro(turso_write(sql, params, key=key, spill=True))  # SQLite-only mode / ก่อน post_init
+        return True
+    w = _PendingWrite(_turso_stmt(sql, params), key, True, None)
+    try:
+        _write_queue.put_nowait(w)
+        return True
+    except asyncio.QueueFull:
+        _spill_overflow(w)
+        return False
+
+# ── Local read replica (P11) ──────────────────────────────────────
+# Turso เป็น primary → SQLite local (DB_PATH) เป็น read replica
+# write ที่ Turso ยืนยันแล้วถูก apply ตามลง local ทันที; reconcile ดึง snapshot เต็มจาก Turso
+# ตอน turso_init และทุก REPLICA_SYNC_SEC — pull ผ่าน WAN โดยไม่ถือ lock, ถือเฉพาะตอน swap
+#   write ที่ apply ระหว่าง pull ถูกจดไว้ (_replica_tail) แล้ว apply ซ้ำบน snapshot ตอน swap
+#   INSERT ธรรมดา (ไม่ idempotent เช่น line_movements) ไม่ apply ซ้ำ — ดึง rowid ที่ใหม่กว่า page สุดท้ายแทน
+REPLICA_SYNC_SEC  = _i("REPLICA_SYNC_SEC",  900)   # reconcile กับ Turso ทุกกี่วินาที
+REPLICA_PAGE_ROWS = _i("REPLICA_PAGE_ROWS", 2000)  # rows ต่อ request ตอนดึง snapshot
+REPLICA_TABLES    = ("trade_records", "opportunity_log", "line_movements", "bot_state",
+                     "event_registry", "event_sources", "team_aliases")
+
+_replica_ok:   bool = False                    # True = reconcile แล้ว อ่าน local ได้
+_replica_lock: Optional[asyncio.Lock] = None   # สร้างใน post_init() (ต้องอยู่บน main loop)
+_replica_tail: Optional[list[dict]] = None     # ไม่ None = reconcile กำลัง pull — write ที่ apply แล้วรอ apply ซ้ำ
+_PLAIN_INSERT_RE = re.compile(r"\s*INSERT\s+INTO\s+(\w+)", re.I)
+
+def _replica_guard():
+    return _replica_lock if _replica_lock is not None else nullcontext()
+
+def _turso_arg_py(a: dict):
+    """decode typed arg (wire format) กลับเป็นค่า Python สำหรับ sqlite3"""
+    t, v = a.get("type"), a.get("value")
+    if t == "null" or v is None: return None
+    if t == "integer":           return int(v)
+    if t == "float":             return float(v)
+    if t == "blob":              return bytes.fromhex(v)
+    return v
+
+def _replica_apply(stmts: list[dict]):
+    """apply write ที่ Turso ยืนยันแล้วลง replica — พังเมื่อไหร่ถอยไปอ่าน Turso จนกว่าจะ reconcile"""
+    global _replica_ok
+    if _replica_tail is not None:
+        _replica_tail.extend(stmts)  # snapshot ที่กำลัง pull อาจไม่มี write นี้
+    if not _replica_ok or not stmts: return
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as con:
+            for st in stmts:
+                try:
+                    con.execute(st["sql"], [_turso_arg_py(a) for a in st.get("args", [])])
+                except sqlite3.OperationalError as e:
+                    if not _is_benign_db_error(e):
+                        raise
+            con.commit()
+    except Exception as e:
+        log.warning(f"[Replica] apply failed: {e} — reads → Turso until next reconcile")
+        _replica_ok = False
+
+def _replica_query(sql: str, params: tuple = ()) -> Optional[list]:
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as con:
+            return con.execute(sql, params).fetchall()
+    except Exception as e:
+        log.warning(f"[Replica] query failed: {e} — falling back to Turso")
+        return None
+
+async def _replica_pull(table: str, local_cols: list[str], after: int = 0) -> tuple[list[str], list[tuple], int]:
+    """ดึง table จาก Turso (page ตาม rowid > after) — เฉพาะคอลัมน์ที่มีทั้งสองฝั่ง
+    Returns: (cols, rows, rowid สุดท้ายที่เห็น)
+    """
+    res = (await _turso_pipeline([_turso_stmt(f"PRAGMA table_info({table})")]))[0]
+    if isinstance(res, Exception):
+        raise res
+    remote = {r[1] for r in res}
+    cols = [c for c in local_cols if c in remote]
+    rows: list[tuple] = []
+    last = after
+    while True:
+        res = (await _turso_pipeline([_turso_stmt(
+            f"SELECT rowid,{','.join(cols)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last, REPLICA_PAGE_ROWS))]))[0]
+        if isinstance(res, Exception):
+            raise res
+        rows.extend(r[1:] for r in res)
+        if res:
+            last = int(res[-1][0])
+        if len(res) < REPLICA_PAGE_ROWS:
+            return cols, rows, last
+
+async def replica_reconcile() -> bool:
+    """snapshot Turso → replica local (แทนที่ทั้ง table ใน transaction เดียว)
+    pull ไม่ถือ _replica_lock (flush / save trade ของ execute_both เดินต่อได้) — ถือเฉพาะ catch-up + swap
+    """
+    global _replica_ok, _replica_tail
+    if not _turso_ok or _db_write_halted or _replica_tail is not None:
+        return False  # _replica_tail ไม่ None = มี reconcile อื่นกำลัง pull
+    t0 = time.monotonic()
+    _replica_tail = []
+    try:
+        with sqlite3.connect(DB_PATH, timeout=10) as con:
+            local_cols = {t: [r[1] for r in con.execute(f"PRAGMA table_info({t})")] for t in REPLICA_TABLES}
+        snap = {t: await _replica_pull(t, local_cols[t]) for t in REPLICA_TABLES}
+        async with _replica_guard():
+            # ถือ lock แล้ว write ของ instance นี้ไม่แทรก — ที่ apply ไประหว่าง pull อยู่ใน tail ครบ
+            tail, _replica_tail = _replica_tail, None
+            appended = {m.group(1) for st in tail if (m := _PLAIN_INSERT_RE.match(st.get("sql", "")))}
+            for t in appended & set(REPLICA_TABLES):
+                cols, rows, last = snap[t]
+                _, more, last = await _replica_pull(t, local_cols[t], after=last)
+                snap[t] = (cols, rows + more, last)
+            with sqlite3.connect(DB_PATH, timeout=10) as con:
+                for t, (cols, rows, _) in snap.items():
+                    con.execute(f"DELETE FROM {t}")
+                    if rows:
+                        con.executemany(
+                            f"INSERT INTO {t} ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})", rows)
+                for st in tail:
+                    if _PLAIN_INSERT_RE.match(st.get("sql", "")):
+                        continue  # มาจาก catch-up pull แล้ว
+                    try:
+                        con.execute(st["sql"], [_turso_arg_py(a) for a in st.get("args", [])])
+                    except sqlite3.OperationalError as e:
+                        if not _is_benign_db_error(e):
+                            raise
+                con.commit()
+    except Exception as e:
+        log.warning(f"[Replica] reconcile failed: {e!r} — reads → Turso")
+        _replica_ok = False
+        return False
+    finally:
+        _replica_tail = None
+    _replica_ok = True
+    log.info(f"[Replica] reconciled in {time.monotonic() - t0:.2f}s | "
+             + ", ".join(f"{t}={len(snap[t][1])}" for t in REPLICA_TABLES)
+             + (f" | tail={len(tail)}" if tail else ""))
+    return True
+
+async def replica_sync_loop():
+    """reconcile เป็นระยะ — กัน drift จาก write ที่ apply local ไม่สำเร็จ / เขียนจาก instance อื่น"""
+    while True:
+        await asyncio.sleep(REPLICA_SYNC_SEC)
+        if _turso_ok and not _db_write_halted:
+            await replica_reconcile()
+
 # ── SQLite local init (fallback) ──────────────────────────────────
 def db_init_local():
     try:
@@ -593,34 +1186,35 @@ def _schedule_coro(coro):
         else:
             log.warning("[DB] _schedule_coro: no event loop available")
 
-def db_save_trade(t: "TradeRecord"):
-    _schedule_coro(_async_save_trade(t))
-
-async def _async_save_trade(t: "TradeRecord"):
-    # D7: named columns — immune to schema drift / migration order changes
-    await turso_exec(
-        """INSERT OR REPLACE INTO trade_records
+# D7: named columns — immune to schema drift / migration order changes
+_TRADE_UPSERT = """INSERT OR REPLACE INTO trade_records
            (signal_id,event,sport,leg1_bm,leg2_bm,leg1_team,leg2_team,
             leg1_odds,leg2_odds,stake1_thb,stake2_thb,profit_pct,status,
             clv_leg1,clv_leg2,actual_profit_thb,settled_at,created_at,
-            commence_time,leg3_bm,leg3_team,leg3_odds,stake3_thb,needs_manual_review)
-           VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-        (t.signal_id,t.event,t.sport,t.leg1_bm,t.leg2_bm,
-         t.leg1_team,t.leg2_team,
-         t.leg1_odds,t.leg2_odds,t.stake1_thb,t.stake2_thb,
-         t.profit_pct,t.status,t.clv_leg1,t.clv_leg2,
-         t.actual_profit_thb,t.settled_at,t.created_at,
-         t.commence_time,
-         t.leg3_bm,t.leg3_team,t.leg3_odds,t.stake3_thb,
-         int(t.needs_manual_review))
-    )
+            commence_time,leg3_bm,leg3_team,leg3_odds,stake3_thb,needs_manual_review,
+            refetch_ms)
+           VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+
+def _trade_params(t: "TradeRecord") -> tuple:
+    return (t.signal_id,t.event,t.sport,t.leg1_bm,t.leg2_bm,
+            t.leg1_team,t.leg2_team,
+            t.leg1_odds,t.leg2_odds,t.stake1_thb,t.stake2_thb,
+            t.profit_pct,t.status,t.clv_leg1,t.clv_leg2,
+            t.actual_profit_thb,t.settled_at,t.created_at,
+            t.commence_time,
+            t.leg3_bm,t.leg3_team,t.leg3_odds,t.stake3_thb,
+            int(t.needs_manual_review),t.refetch_ms)
 
-def db_save_opportunity(opp: dict):
-    _schedule_coro(_async_save_opp(opp))
+def db_save_trade(t: "TradeRecord"):
+    turso_write_nowait(_TRADE_UPSERT, _trade_params(t), key=f"trade:{t.signal_id}")
+
+async def _async_save_trade(t: "TradeRecord", spill: bool = False):
+    await turso_write(_TRADE_UPSERT, _trade_params(t), key=f"trade:{t.signal_id}", spill=spill)
 
-async def _async_save_opp(opp: dict):
+def db_save_opportunity(opp: dict):
     # B5: migration ย้ายไป db_load_all startup แล้ว — ไม่ต้อง ALTER TABLE ทุก insert
-    await turso_exec(
+    # P9: key opp:<id> ร่วมกับ UPDATE status — คนละ sql จึงไม่ถูก coalesce ทิ้ง และส่งตามลำดับใน queue เดียวกัน
+    turso_write_nowait(
         """INSERT OR REPLACE INTO opportunity_log
            (id,event,sport,profit_pct,leg1_bm,leg1_odds,leg2_bm,leg2_odds,
             stake1_thb,stake2_thb,created_at,status,leg3_bm,stake3_thb,total_stake_thb)
@@ -628,28 +1222,53 @@ async def _async_save_opp(opp: dict):
         (opp["id"],opp["event"],opp["sport"],opp["profit_pct"],
          opp["leg1_bm"],opp["leg1_odds"],opp["leg2_bm"],opp["leg2_odds"],
          opp["stake1_thb"],opp["stake2_thb"],opp["created_at"],opp["status"],
-         opp.get("leg3_bm"), opp.get("stake3_thb"), opp.get("total_stake_thb"))
+         opp.get("leg3_bm"), opp.get("stake3_thb"), opp.get("total_stake_thb")),
+        key=f"opp:{opp['id']}",
     )
 
 def db_update_opp_status(signal_id: str, status: str):
-    _schedule_coro(turso_exec("UPDATE opportunity_log SET status=? WHERE id=?", (status, signal_id)))
+    """confirm/reject/expire — ผ่าน queue เดียวกับ INSERT (ห้าม turso_exec ตรง: INSERT ที่ค้างใน queue จะทับ status)"""
+    turso_write_nowait("UPDATE opportunity_log SET status=? WHERE id=?", (status, signal_id), key=f"opp:{signal_id}")
+
+def db_save_event(cid: str, e: dict):
+    """P23: canonical event ใหม่ (fire-and-forget)"""
+    turso_write_nowait(
+        """INSERT OR IGNORE INTO event_registry (cid,sport,home,away,commence,bucket,teams,created_at)
+           VALUES (?,?,?,?,?,?,?,?)""",
+        (cid, e["sport"], e["home"], e["away"], e["commence"], e["bucket"], e["teams"],
+         datetime.now(timezone.utc).isoformat()),
+    )
 
-def db_save_line_movement(lm: "LineMovement"):
-    _schedule_coro(_async_save_lm(lm))
+def db_save_event_source(source: str, source_id: str, cid: str):
+    """P23: source id → canonical id"""
+    turso_write_nowait(
+        "INSERT OR REPLACE INTO event_sources (source,source_id,cid) VALUES (?,?,?)",
+        (source, source_id, cid), key=f"evsrc:{source}:{source_id}",
+    )
+
+def db_save_alias(alias: str, canonical: str, source: str):
+    """P27: learned/operator alias (normalized alias → canonical)"""
+    turso_write_nowait(
+        "INSERT OR REPLACE INTO team_aliases (alias,canonical,source,created_at) VALUES (?,?,?,?)",
+        (alias, canonical, source, datetime.now(timezone.utc).isoformat()), key=f"alias:{alias}",
+    )
 
-async def _async_save_lm(lm: "LineMovement"):
-    await turso_exec(
+def db_delete_alias(alias: str):
+    turso_write_nowait("DELETE FROM team_aliases WHERE alias=?", (alias,), key=f"alias:{alias}")
+
+def db_save_line_movement(lm: "LineMovement"):
+    turso_write_nowait(
         """INSERT INTO line_movements
            (event,sport,bookmaker,outcome,odds_before,odds_after,
             pct_change,direction,is_steam,is_rlm,ts)
            VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
         (lm.event,lm.sport,lm.bookmaker,lm.outcome,
          float(lm.odds_before),float(lm.odds_after),float(lm.pct_change),
-         lm.direction,int(lm.is_steam),int(lm.is_rlm),lm.ts)
+         lm.direction,int(lm.is_steam),int(lm.is_rlm),lm.ts),
     )
 
 def db_save_state(key: str, value: str):
-    _schedule_coro(turso_exec("INSERT OR REPLACE INTO bot_state VALUES (?,?)", (key, value)))
+    turso_write_nowait("INSERT OR REPLACE INTO bot_state VALUES (?,?)", (key, value), key=f"state:{key}")
 
 async def db_load_state_async(key: str, default: str = "") -> str:
     rows = await turso_query("SELECT value FROM bot_state WHERE key=?", (key,))
@@ -675,6 +1294,7 @@ async def db_load_all() -> tuple[list, list, list]:
             ("leg3_odds", "ALTER TABLE trade_records ADD COLUMN leg3_odds REAL DEFAULT NULL"),
             ("stake3_thb","ALTER TABLE trade_records ADD COLUMN stake3_thb INTEGER DEFAULT NULL"),
             ("needs_manual_review", "ALTER TABLE trade_records ADD COLUMN needs_manual_review INTEGER DEFAULT 0"),  # M2
+            ("refetch_ms", "ALTER TABLE trade_records ADD COLUMN refetch_ms TEXT DEFAULT ''"),  # P16
             # B5: opportunity_log 3-way migration ย้ายมาไว้ที่นี่ — ยิงแค่ครั้งเดียวตอน startup
             ("opp_leg3_bm",        "ALTER TABLE opportunity_log ADD COLUMN leg3_bm TEXT DEFAULT NULL"),
             ("opp_stake3_thb",     "ALTER TABLE opportunity_log ADD COLUMN stake3_thb INTEGER DEFAULT NULL"),
@@ -687,7 +1307,7 @@ async def db_load_all() -> tuple[list, list, list]:
             "SELECT signal_id,event,sport,leg1_bm,leg2_bm,leg1_team,leg2_team,"
             "leg1_odds,leg2_odds,stake1_thb,stake2_thb,profit_pct,status,"
             "clv_leg1,clv_leg2,actual_profit_thb,settled_at,created_at,"
-            "commence_time,leg3_bm,leg3_team,leg3_odds,stake3_thb,needs_manual_review"
+            "commence_time,leg3_bm,leg3_team,leg3_odds,stake3_thb,needs_manual_review,refetch_ms"
             " FROM trade_records ORDER BY created_at DESC LIMIT 500")  # C5: named cols — immune to migration order
         trades = []
         for r in trades_rows:
@@ -697,6 +1317,7 @@ async def db_load_all() -> tuple[list, list, list]:
             # 7=leg1_odds,8=leg2_odds,9=stake1_thb,10=stake2_thb,11=profit_pct,12=status,
             # 13=clv_leg1,14=clv_leg2,15=actual_profit_thb,16=settled_at,17=created_at,
             # 18=commence_time,19=leg3_bm,20=leg3_team,21=leg3_odds,22=stake3_thb,23=needs_manual_review
+            # 24=refetch_ms
             if n >= 18:
                 trades.append(TradeRecord(
                     signal_id=r[0],event=r[1],sport=r[2],leg1_bm=r[3],leg2_bm=r[4],
@@ -713,7 +1334,8 @@ async def db_load_all() -> tuple[list, list, list]:
                     leg3_team=r[20] if n >= 21 else None,
                     leg3_odds=float(r[21]) if n >= 22 and r[21] is not None else None,
                     stake3_thb=int(float(r[22])) if n >= 23 and r[22] is not None else None,
-                    needs_manual_review=bool(int(r[23])) if n >= 24 and r[23] is not None else False)  # C5
+                    needs_manual_review=bool(int(r[23])) if n >= 24 and r[23] is not None else False,  # C5
+                    refetch_ms=(r[24] or "") if n >= 25 else "")  # P16
                 )
             else:
                 # DB เก่า — ไม่มี leg1_team/leg2_team
@@ -868,141 +1490,554 @@ TEAM_ALIASES = {
     "vikings":"Minnesota Vikings","saints":"New Orleans Saints",
 }
 
+# P25: regex compile ครั้งเดียว + LRU cache — ชื่อทีมชุดเดิมถูก normalize ซ้ำหลายพันครั้งต่อ scan
+NAME_CACHE_SIZE = _i("NAME_CACHE_SIZE", 50000)
+_RE_NON_WORD    = re.compile(r"[^\w\s]")
+_RE_SPACES      = re.compile(r"\s+")
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def normalize_team(name: str) -> str:
     n = name.lower().strip()
-    return re.sub(r"\s+"," ", re.sub(r"[^\w\s]","",n))
+    return intern(_RE_SPACES.sub(" ", _RE_NON_WORD.sub("", n)))
+
+_FUZZY_STOPWORDS = frozenset({"the","fc","cf","sc","ac","de","city","united","of","and"})
+
+
+class TeamMatcher:
+    """P25: fuzzy_match engine — alias compile เป็น dict normalized → canonical
+    profile ของชื่อ (canonical string interned + token set ตัด stopwords) cache ด้วย LRU
+    match() ผลเหมือน fuzzy_match เดิมทุกกรณี / match_many()/first() = ชื่อเดียวเทียบหลาย candidate
+    """
+
+    def __init__(self, aliases: dict, cache_size: int = NAME_CACHE_SIZE):
+        self._aliases: dict[str, str] = {}
+        self.profile = lru_cache(maxsize=cache_size)(self._profile)
+        self.set_aliases(aliases)
+
+    def set_aliases(self, aliases: dict):
+        """compile alias table ใหม่ — ล้าง profile cache เพราะ canonical name อาจเปลี่ยน"""
+        self._aliases = {normalize_team(k): normalize_team(v) for k, v in aliases.items()}
+        self.profile.cache_clear()
+
+    def _profile(self, name: str) -> tuple[str, frozenset]:
+        n = normalize_team(name)
+        canon = intern(self._aliases.get(n, n))
+        return canon, frozenset(canon.split()) - _FUZZY_STOPWORDS
+
+    def canon(self, name: str) -> str:
+        return self.profile(name)[0]
+
+    @staticmethod
+    def _score(na: str, ta: frozenset, nb: str, tb: frozenset, threshold: float) -> bool:
+        if na == nb: return True
+        if not ta or not tb: return False
+        inter = len(ta & tb)
+        if inter / (len(ta) + len(tb) - inter) >= threshold: return True
+        return (na in nb) or (nb in na) or (na[:5] == nb[:5] and len(na) >= 5)
+
+    def match(self, a: str, b: str, threshold: float = 0.6) -> bool:
+        return self._score(*self.profile(a), *self.profile(b), threshold)
+
+    def match_below(self, a: str, b: str) -> bool:
+        """ผล match เมื่อรู้แล้วว่า Jaccard ต่ำกว่า threshold (P26 prematch) — เหลือแค่กฎ string"""
+        (na, ta), (nb, tb) = self.profile(a), self.profile(b)
+        if na == nb: return True
+        return bool(ta and tb) and ((na in nb) or (nb in na) or (na[:5] == nb[:5] and len(na) >= 5))
+
+    def match_many(self, name: str, candidates, threshold: float = 0.6) -> list[bool]:
+        """ผล match ของ name กับทุก candidate — profile ของ name คำนวณครั้งเดียว"""
+        na, ta = self.profile(name)
+        prof, score = self.profile, self._score
+        return [score(na, ta, *prof(c), threshold) for c in candidates]
+
+    def first(self, name: str, candidates, threshold: float = 0.6, default=None):
+        """candidate แรกที่ match name (ลำดับตาม iterable) — ไม่เจอ → default"""
+        na, ta = self.profile(name)
+        prof, score = self.profile, self._score
+        return next((c for c in candidates if score(na, ta, *prof(c), threshold)), default)
+
+    def cache_info(self) -> dict:
+        p, n = self.profile.cache_info(), normalize_team.cache_info()
+        return {"profile_hits": p.hits, "profile_misses": p.misses, "profile_size": p.currsize,
+                "normalize_hits": n.hits, "normalize_misses": n.misses, "aliases": len(self._aliases)}
+
+
+_team_matcher = TeamMatcher(TEAM_ALIASES)
+
 
 def fuzzy_match(a: str, b: str, threshold: float = 0.6) -> bool:
-    na = normalize_team(TEAM_ALIASES.get(normalize_team(a), a))
-    nb = normalize_team(TEAM_ALIASES.get(normalize_team(b), b))
-    if na == nb: return True
-    sw = {"the","fc","cf","sc","ac","de","city","united","of","and"}
-    ta = set(na.split()) - sw
-    tb = set(nb.split()) - sw
-    if not ta or not tb: return False
-    j = len(ta&tb)/len(ta|tb)
-    return j >= threshold or (na in nb) or (nb in na) or (na[:5]==nb[:5] and len(na)>=5)
+    return _team_matcher.match(a, b, threshold)
+
+
+# ── P27: Learned alias store ─────────────────────────────────────
+# TEAM_ALIASES ครอบคลุมแค่ไม่กี่ลีก — ชื่อที่ต่างกันข้าม source ต้อง fuzzy ทุกครั้ง (หรือ match ไม่ได้เลย)
+# alias ที่ยืนยันแล้วถูกจำลง DB (team_aliases) แล้ว compile รวมกับ TEAM_ALIASES เข้า _team_matcher:
+#   merge — registry ยืนยัน (commence ±1 bucket + fuzzy ≥0.80) และอีกทีมของคู่ตรงกันเป๊ะ → ทีมที่ชื่อต่างคือทีมเดียวกัน
+#   settle — เฉพาะ scores event ที่ผูกกับ cid ของ trade (registry exact); ไม่เรียนจาก fuzzy fallback 0.5
+#            ("New York Islanders" ผ่าน 0.5 กับ "New York Rangers")
+#   confirm — operator กด confirm = ยืนยันว่าชื่อทีมของทุก leg คือ event เดียวกันใน registry
+#   operator — /api/control key=alias_add value="alias=canonical" / key=alias_remove value="alias"
+# alias ใหม่ compile เข้า _team_matcher ระหว่าง scan เท่านั้น (flush) — กลาง scan profile cache / AltMarketIndex
+# ยังใช้ alias ชุดเดิม ถ้า compile กลางทาง index กับ fuzzy_match จะให้ผลไม่ตรงกัน
+ALIAS_LEARN = _s("ALIAS_LEARN", "true").lower() == "true"
+
+
+class AliasStore:
+    """P27: alias ที่เรียนรู้/operator เพิ่ม — alias (normalized) → canonical (normalized)
+    learned ไม่ทับ alias เดิม (built-in หรือที่มีอยู่แล้ว); operator ทับได้
+    """
+
+    def __init__(self, builtin: dict, matcher: TeamMatcher):
+        self._builtin = {normalize_team(k): v for k, v in builtin.items()}
+        self._targets = {normalize_team(v) for v in builtin.values()}
+        self._matcher = matcher
+        self._learned: dict[str, tuple[str, str]] = {}   # alias → (canonical, source)
+        self._dirty = False                               # มี alias เปลี่ยนที่ยังไม่ compile เข้า matcher
+        self.learned = 0
+
+    def __len__(self):
+        return len(self._learned)
+
+    def _compile(self):
+        self._matcher.set_aliases({**self._builtin, **{a: c for a, (c, _) in self._learned.items()}})
+
+    def load(self, rows):
+        for alias, canonical, source in rows:
+            self._learned[alias] = (canonical, source)
+        self._compile()
+
+    def flush(self) -> bool:
+        """compile alias ที่ค้างเข้า matcher — เรียกนอก scan เท่านั้น (ดู _alias_flush_if_idle)"""
+        if not self._dirty:
+            return False
+        self._dirty = False
+        self._compile()
+        return True
+
+    def add(self, alias: str, canonical: str, source: str = "operator") -> tuple[bool, str]:
+        a      = normalize_team(alias)
+        target = self._matcher.canon(canonical)   # canonical อาจเป็น alias อีกที — ชี้ไปปลายทางเลย ไม่ทำ chain
+        if len(a) < 3 or not target:
+            return False, "alias/canonical too short"
+        if a == target or self._matcher.canon(alias) == target:
+            return False, f"'{a}' already maps to '{target}'"
+        if source != "operator" and (a in self._builtin or a in self._learned):
+            return False, f"'{a}' already aliased"
+        if a in self._targets or any(c == a for c, _ in self._learned.values()):
+            return False, f"'{a}' is a canonical name of other aliases"
+        self._learned[a] = (target, source)
+        self._dirty = True
+        db_save_alias(a, target, source)
+        if source != "operator":
+            self.learned += 1
+            log.info(f"[Alias] learned '{a}' → '{target}' ({source})")
+        return True, f"alias '{a}' → '{target}'"
+
+    def remove(self, alias: str) -> tuple[bool, str]:
+        a = normalize_team(alias)
+        if self._learned.pop(a, None) is None:
+            return False, f"'{a}' is not a stored alias"
+        self._dirty = True
+        db_delete_alias(a)
+        return True, f"alias '{a}' removed"
+
+    def learn_pair(self, home: str, away: str, other_home: str, other_away: str, source: str):
+        """ยืนยันจาก event เดียวกัน — ทีมหนึ่งตรงกันเป๊ะ อีกทีมชื่อต่าง → จำ other เป็น alias ของชื่อเรา"""
+        if not ALIAS_LEARN:
+            return
+        canon = self._matcher.canon
+        if canon(home) == canon(other_home) and canon(away) != canon(other_away):
+            self.add(other_away, away, source)
+        elif canon(away) == canon(other_away) and canon(home) != canon(other_home):
+            self.add(other_home, home, source)
+
+    def snapshot(self) -> dict:
+        by_src: dict[str, int] = defaultdict(int)
+        for _, src in self._learned.values():
+            by_src[src] += 1
+        return {"stored": len(self._learned), "learned_session": self.learned, "pending_compile": self._dirty,
+                **by_src}
+
+
+_alias_store = AliasStore(TEAM_ALIASES, _team_matcher)
+
+
+def _alias_flush_if_idle():
+    """P27: ไม่มี scan ค้าง → compile alias ทันที; มี scan → รอ do_scan flush ตอนจบ"""
+    if _scan_lock is None or not _scan_lock.locked():
+        _alias_store.flush()
+
+
+# ── P23: Canonical event registry ────────────────────────────────
+# เดิม: ทุก stage (merge / CLV / refetch / settle) สร้าง "home vs away" แล้ว fuzzy_match ไล่ทั้ง list ซ้ำทุกรอบ
+# ตอนนี้: event ทุก source ผูกกับ canonical id เดียว keyed ด้วย (sport, ชื่อทีม normalize เรียงแล้ว, commence bucket)
+#   source id (Odds API id / Cloudbet id / Polymarket slug / Kalshi ticker) → canonical id ถูกจำไว้ + persist ลง DB
+#   lookup ครั้งถัดไปเป็น dict hit — fuzzy เหลือแค่ตอนเจอ event/ชื่อใหม่ครั้งแรก
+EVENT_BUCKET_SEC     = _i("EVENT_BUCKET_SEC",     7200)  # commence bucket — ค้น ±1 bucket กัน feed เวลาคลาดกัน
+EVENT_REGISTRY_DAYS  = _i("EVENT_REGISTRY_DAYS",  10)    # เก็บ event ย้อนหลัง (settle อาจช้าได้ถึง 72h+)
+
+
+def _team_key(name: str) -> str:
+    return _team_matcher.canon(name)
+
+
+class EventRegistry:
+    """P23: canonical event id ต่อ (sport, teams, commence bucket) — เรียกจาก main loop เท่านั้น"""
+
+    def __init__(self):
+        self._events: dict[str, dict] = {}                  # cid → {"sport","home","away","commence","bucket","teams"}
+        self._by_key: dict[tuple, str] = {}                 # (sport, teams, bucket) → cid
+        self._by_src: dict[tuple[str, str], str] = {}       # (source, source_id) → cid
+        self._sources: dict[str, set[str]] = {}              # cid → {source} — 1 source id ต่อ source ต่อ event
+        self._by_name: dict[tuple[str, str], list[str]] = {}  # (sport, "home vs away") → [cid] — ชื่อซ้ำได้ข้ามวัน
+        self._by_block: dict[tuple[str, str], set[str]] = {}  # P24: (sport, team token / name prefix) → {cid}
+        self.hits = self.fuzzy = self.created = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    @staticmethod
+    def _bucket(commence: str) -> int:
+        try:
+            return int(parse_commence(commence).timestamp()) // EVENT_BUCKET_SEC
+        except Exception:
+            return -1  # ไม่รู้เวลา — ค้นทุก bucket ของ sport นั้น
+
+    @classmethod
+    def same_slot(cls, commence_a: str, commence_b: str) -> bool:
+        """เวลาแข่งห่างไม่เกิน ±1 bucket — ไม่รู้เวลาฝั่งใดฝั่งหนึ่ง = ไม่ตัดทิ้ง"""
+        a, b = cls._bucket(commence_a), cls._bucket(commence_b)
+        return a < 0 or b < 0 or abs(a - b) <= 1
+
+    @staticmethod
+    def _teams(home: str, away: str) -> str:
+        return "|".join(sorted((_team_key(home), _team_key(away))))
+
+    @staticmethod
+    def _blocks(home: str, away: str) -> set[str]:
+        """P24: blocking keys — token ของชื่อทีม (ไม่นับ stop-word) + prefix 5 ตัวของชื่อ event
+        fuzzy_match ≥0.8 ต้องมี token ร่วม (Jaccard) หรือ prefix ร่วม — คู่ที่ไม่มี block ร่วมจึงไม่มีทาง match
+        """
+        blocks = {t for t in f"{_team_key(home)} {_team_key(away)}".split() if t not in _FUZZY_STOPWORDS}
+        blocks.add("~" + normalize_team(f"{home} vs {away}")[:5])
+        return blocks
+
+    def _add(self, cid: str, sport: str, home: str, away: str, commence: str, bucket: int, teams: str):
+        self._events[cid] = {"sport": sport, "home": home, "away": away, "commence": commence,
+                             "bucket": bucket, "teams": teams}
+        self._by_key[(sport, teams, bucket)] = cid
+        for blk in self._blocks(home, away):
+            self._by_block.setdefault((sport, blk), set()).add(cid)
+        self._name_add(sport, f"{home} vs {away}", cid)
+
+    def _name_add(self, sport: str, name: str, cid: str):
+        cids = self._by_name.setdefault((sport, name), [])
+        if cid not in cids:
+            cids.append(cid)
+
+    def _candidates(self, sport: str, bucket: int, home: str, away: str, source: str = "") -> list[str]:
+        """P24: candidate ของ fuzzy fallback = event ที่มี block ร่วม, commence ห่างไม่เกิน ±1 bucket
+        และยังไม่มี id จาก source เดียวกัน — เรียง bucket ใกล้สุดก่อน
+        """
+        cids: set[str] = set()
+        for blk in self._blocks(home, away):
+            cids |= self._by_block.get((sport, blk), set())
+        if source:
+            cids = {c for c in cids if source not in self._sources.get(c, ())}
+        near = [(abs(b - bucket) if bucket >= 0 and b >= 0 else 0, c) for c in cids
+                if bucket < 0 or (b := self._events[c]["bucket"]) < 0 or abs(b - bucket) <= 1]
+        return [c for _, c in sorted(near)]
+
+    def resolve(self, source: str, source_id, sport: str, home: str, away: str, commence: str = "") -> str:
+        """คืน canonical id ของ event — สร้างใหม่ถ้าไม่เคยเห็น; source_id ว่าง = ไม่จำ mapping"""
+        sk = (source, str(source_id)) if source_id else None
+        cid = self._by_src.get(sk) if sk else None
+        if cid is not None:
+            self.hits += 1
+            return cid
+        bucket = self._bucket(commence)
+        teams  = self._teams(home, away)
+        # event ที่มี id จาก source เดียวกันอยู่แล้วคือคนละ event (เช่น doubleheader / feed เดียวกันไม่ซ้ำกันเอง)
+        free = (lambda c: source not in self._sources.get(c, ())) if sk else (lambda c: True)
+        cid = next((c for b in (bucket, bucket - 1, bucket + 1)
+                    if (c := self._by_key.get((sport, teams, b))) and free(c)), None) if bucket >= 0 else None
+        if cid is None:
+            # ชื่อต่างกันข้าม source (alias/สะกด) — fuzzy เฉพาะ event ของ sport เดียวกันในช่วงเวลาใกล้กัน
+            name = f"{home} vs {away}"
+            cid = next((c for c in self._candidates(sport, bucket, home, away, source if sk else "")
+                        if fuzzy_match(name, f"{self._events[c]['home']} vs {self._events[c]['away']}", 0.80)), None)
+            if cid is not None:
+                self.fuzzy += 1
+                e = self._events[cid]
+                _alias_store.learn_pair(e["home"], e["away"], home, away, "merge")  # P27
+        if cid is not None:
+            self._name_add(sport, f"{home} vs {away}", cid)
+        else:
+            cid = uuid.uuid4().hex[:12]
+            self._add(cid, sport, home, away, commence, bucket, teams)
+            self.created += 1
+            db_save_event(cid, self._events[cid])
+        if sk:
+            self._by_src[sk] = cid
+            self._sources.setdefault(cid, set()).add(source)
+            db_save_event_source(source, sk[1], cid)
+        return cid
+
+    def link(self, source: str, source_id, cid: str):
+        """ผูก source id (เช่น Polymarket slug / Kalshi ticker) กับ event ที่ match แล้ว"""
+        if not source_id or cid not in self._events:
+            return
+        sk = (source, str(source_id))
+        if self._by_src.get(sk) != cid:
+            self._by_src[sk] = cid
+            db_save_event_source(source, sk[1], cid)  # alt market ผูกได้หลาย market ต่อ event — ไม่นับใน _sources
+
+    def source_cid(self, source: str, source_id) -> Optional[str]:
+        """lookup อย่างเดียว — ไม่สร้าง event / ไม่ persist mapping / ไม่ merge (path อ่าน: refetch / CLV / settle)"""
+        return self._by_src.get((source, str(source_id))) if source_id else None
+
+    @staticmethod
+    def _src_key(ev: dict, source: str = "") -> tuple[str, str]:
+        return source or ("cloudbet" if ev.get("_cb_id") else "odds_api"), ev.get("_cb_id") or ev.get("id", "")
+
+    def event(self, cid: Optional[str]) -> Optional[dict]:
+        return self._events.get(cid) if cid else None
+
+    def cid_of(self, ev: dict, source: str = "") -> Optional[str]:
+        """canonical id ของ feed event ที่ registry รู้จักแล้ว — None ถ้ายังไม่เคย resolve"""
+        return self.source_cid(*self._src_key(ev, source))
+
+    def lookup_name(self, sport: str, event_name: str, commence: str = "") -> Optional[str]:
+        """cid ของ "home vs away" — มี commence → เฉพาะ event ที่ห่างไม่เกิน ±1 bucket (ชื่อซ้ำข้ามวัน เช่น series)
+        ไม่มี commence (trade เก่าก่อนเก็บเวลา) → event ล่าสุดที่ใช้ชื่อนี้
+        """
+        cids = self._by_name.get((sport, event_name), [])
+        bucket = self._bucket(commence) if commence else -1
+        if bucket < 0:
+            return cids[-1] if cids else None
+        home, sep, away = event_name.partition(" vs ")
+        if sep:
+            teams = self._teams(home, away)
+            cid = next((c for b in (bucket, bucket - 1, bucket + 1)
+                        if (c := self._by_key.get((sport, teams, b)))), None)
+            if cid is not None:
+                return cid
+        near = [(abs(b - bucket), c) for c in cids
+                if (b := self._events[c]["bucket"]) >= 0 and abs(b - bucket) <= 1]
+        return min(near)[1] if near else None
+
+    def event_id(self, sport: str, ev: dict, source: str = "") -> str:
+        """canonical id ของ feed event dict (Odds API / Cloudbet รูปแบบเดียวกัน)"""
+        src, sid = self._src_key(ev, source)
+        return self.resolve(src, sid, ev.get("sport_key", sport) or sport,
+                            ev.get("home_team", ""), ev.get("away_team", ""), ev.get("commence_time", ""))
+
+    def matches(self, events: list, sport: str, event_name: str, threshold: float = 0.7,
+                commence: str = "") -> list[dict]:
+        """feed events ที่เป็น event เดียวกับ event_name — ชื่อที่ registry ไม่รู้จัก → fuzzy_match แบบเดิม
+        commence → ตัด event ที่เวลาแข่งห่างเกิน ±1 bucket ออก (ไม่ปน game อื่นที่ชื่อทีมเดียวกัน)
+        """
+        cid = self.lookup_name(sport, event_name, commence)
+        if cid is not None:
+            hits = [ev for ev in events if self.cid_of(ev) == cid]
+            if hits:
+                return hits
+            # feed นี้ยังไม่เคยผูกกับ cid (เช่น event มาจาก Cloudbet/Polymarket ก่อน) → fuzzy + commence guard
+        if commence:
+            events = [ev for ev in events if self.same_slot(commence, ev.get("commence_time", ""))]
+        flags = _team_matcher.match_many(
+            event_name, [f"{ev.get('home_team','')} vs {ev.get('away_team','')}" for ev in events], threshold)
+        return [ev for ev, ok in zip(events, flags) if ok]
+
+    def load(self, events: list, sources: list):
+        for cid, sport, home, away, commence, bucket, teams in events:
+            self._add(cid, sport, home, away, commence, int(bucket), teams)
+        for source, source_id, cid in sources:
+            if cid in self._events:
+                self._by_src[(source, source_id)] = cid
+                if source in ("odds_api", "cloudbet"):
+                    self._sources.setdefault(cid, set()).add(source)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        cutoff = int((now or time.time()) - EVENT_REGISTRY_DAYS * 86400) // EVENT_BUCKET_SEC
+        old = {cid for cid, e in self._events.items() if 0 <= e["bucket"] < cutoff}
+        if not old:
+            return 0
+        for cid in old:
+            e = self._events.pop(cid)
+            self._by_key.pop((e["sport"], e["teams"], e["bucket"]), None)
+        self._by_src  = {k: c for k, c in self._by_src.items() if c not in old}
+        for cid in old:
+            self._sources.pop(cid, None)
+        self._by_name = {k: v for k, v in ((k, [c for c in v if c not in old]) for k, v in self._by_name.items()) if v}
+        self._by_block = {k: v for k, v in ((k, v - old) for k, v in self._by_block.items()) if v}
+        turso_write_nowait("DELETE FROM event_sources WHERE cid IN "
+                           "(SELECT cid FROM event_registry WHERE bucket >= 0 AND bucket < ?)", (cutoff,))
+        turso_write_nowait("DELETE FROM event_registry WHERE bucket >= 0 AND bucket < ?", (cutoff,))
+        return len(old)
+
+    def snapshot(self) -> dict:
+        return {"events": len(self._events), "sources": len(self._by_src),
+                "hits": self.hits, "fuzzy": self.fuzzy, "created": self.created}
+
+
+_event_registry = EventRegistry()
+
+_NON_TEAM_OUTCOMES = frozenset({"draw", "tie", "x", "yes", "no"})
+
+
+def learn_confirmed_legs(opp: "ArbOpportunity"):
+    """P27: operator confirm ยืนยันว่าทุก leg คือ event เดียวกัน — ชื่อทีมของ leg (ต่าง book) เทียบกับ event ใน registry"""
+    e = _event_registry.event(_event_registry.lookup_name(opp.sport, opp.event, opp.commence))
+    if e is None:
+        return
+    teams = [leg.outcome for leg in (opp.leg1, opp.leg2, opp.leg3)
+             if leg is not None and normalize_team(leg.outcome) not in _NON_TEAM_OUTCOMES]
+    if len(teams) != 2:
+        return
+    for a, b in (teams, teams[::-1]):  # ไม่รู้ว่า leg ไหนเป็นเจ้าบ้าน — learn_pair ต้องมีทีมหนึ่งตรงเป๊ะอยู่แล้ว
+        _alias_store.learn_pair(e["home"], e["away"], a, b, "confirm")
+    _alias_flush_if_idle()
 
 
 # ══════════════════════════════════════════════════════════════════
 #  7/10/11. LINE MOVEMENT DETECTOR
 # ══════════════════════════════════════════════════════════════════
-async def detect_line_movements(odds_by_sport: dict, poly_markets: list | None = None):
+async def detect_line_movements(odds_by_sport: dict, poly_markets: list | None = None,
+                                 pinnacle_seen: set[str] | None = None):
     """
     เปรียบเทียบ odds ใหม่กับ history
     ตรวจจับ: Line Move, Steam Move, Reverse Line Movement
     พร้อมจัดเกรดสัญญาณ (A/B/C) และวิเคราะห์จังหวะเวลา
+    P6: ถ้าส่ง pinnacle_seen มา (streaming ทีละ sport) จะสะสม event ที่เห็น Pinnacle ลง set นั้น
+        และข้าม suspension check — caller ต้องเรียก detect_pinnacle_suspensions() เองหลังครบทุก sport
     """
     new_movements: list[tuple[LineMovement, dict]] = []  # (lm, context)
     now = datetime.now(timezone.utc)
     # F2: track which Pinnacle events are seen THIS scan
-    _pinnacle_seen_this_scan: set[str] = set()
+    _pinnacle_seen_this_scan: set[str] = pinnacle_seen if pinnacle_seen is not None else set()
+    _poly_liq_by_event: dict[str, float] = {}
 
     for sport, events in odds_by_sport.items():
         await asyncio.sleep(0)  # yield ให้ event loop ไปทำงานอื่น (Telegram, etc.) ได้ระหว่างสปอร์ต
         for event in events:
-            home  = event.get("home_team","")
-            away  = event.get("away_team","")
-            ename = f"{home} vs {away}"
-            commence = event.get("commence_time","")
-
-            for bm in event.get("bookmakers",[]):
-                bk = bm.get("key","")
-                bn = bm.get("title", bk)
-                for mkt in bm.get("markets",[]):
-                    if mkt.get("key") != "h2h": continue
-                    for out in mkt.get("outcomes",[]):
-                        outcome  = out.get("name","")
-                        new_odds = Decimal(str(out.get("price",1)))
-                        hist_key = f"{ename}|{outcome}"
-
-                        if bk in odds_history.get(hist_key, {}):
-                            old_odds = odds_history[hist_key][bk]
-                            if old_odds > 0:
-                                pct = (new_odds - old_odds) / old_odds
-                                if abs(pct) >= LINE_MOVE_THRESHOLD:
-                                    direction = "UP 📈" if pct > 0 else "DOWN 📉"
-
-                                    # 11. Steam: หลายเว็บขยับพร้อมกันภายใน 5 นาที
-                                    steam_key = f"{ename}|{outcome}|{direction}"
-                                    steam_tracker[steam_key].append((bk, now))
-                                    # F1: record timestamp of Pinnacle's move for this steam key
-                                    if bk == "pinnacle":
-                                        steam_pinnacle_tracker[steam_key] = now.timestamp()
-                                    # ลบ entry เก่ากว่า 5 นาที
-                                    steam_tracker[steam_key] = [
-                                        (b,t) for b,t in steam_tracker[steam_key]
-                                        if (now-t).total_seconds() < 300
-                                    ]
-                                    # dedupe: นับเฉพาะ unique bookmakers
-                                    unique_bms = {b for b, _ in steam_tracker[steam_key]}
-                                    num_bm_moved = len(unique_bms)
-                                    is_steam = num_bm_moved >= 2
-                                    # F1: Pinnacle-led steam — True only if Pinnacle moved within this window
-                                    pinnacle_moved = steam_key in steam_pinnacle_tracker
-
-                                    # 10. RLM: odds ขยับ反向กับ public bet
-                                    # ถ้า odds ลง (favourite กลายเป็น underdog) = sharp money เดิน
-                                    is_sharp_move = pct < -LINE_MOVE_THRESHOLD and bk == "pinnacle"
-
-                                    lm = LineMovement(
-                                        event=ename, sport=sport,
-                                        bookmaker=bn, outcome=outcome,
-                                        odds_before=old_odds, odds_after=new_odds,
-                                        pct_change=pct, direction=direction,
-                                        is_steam=is_steam, is_rlm=is_sharp_move,
-                                    )
-                                    # C5: liquidity จาก Polymarket จริง
-                                    liq_usd = 0.0
-                                    if poly_markets:
-                                        poly_match = find_polymarket(ename, poly_markets)
-                                        if poly_match:
-                                            liq_usd = float(poly_match.get("_liquidity", 0) or 0)
-
-                                                            # C4: สร้าง all_odds dict — odds ของ outcome นี้จากทุก bm
-                                    _hist_for_outcome = odds_history.get(hist_key, {})
-                                    all_odds_for_ctx: dict[str, float] = {
-                                        norm_bm_key(_bk): float(_o)
-                                        for _bk, _o in _hist_for_outcome.items()
-                                        if isinstance(_o, (int, float, Decimal))
-                                    }
-                                    all_odds_for_ctx[norm_bm_key(bk)] = float(new_odds)  # อัพเดทค่าล่าสุด
-
-                                    # C4: หา sharp_odds (Pinnacle) vs soft_odds (bm นี้)
-                                    sharp_odds_val = float(all_odds_for_ctx.get("pinnacle", 0))
-                                    soft_odds_val  = float(new_odds)
-
-                                    ctx = {
-                                        "commence_time": commence,
-                                        "num_bm_moved": num_bm_moved,
-                                        "bm_key": bk,
-                                        "liquidity_usd": liq_usd,
-                                        "all_odds": all_odds_for_ctx,
-                                        "sharp_odds": sharp_odds_val,
-                                        "soft_odds": soft_odds_val,
-                                        "pinnacle_moved": pinnacle_moved,  # F1
-                                    }
-                                    new_movements.append((lm, ctx))
-                                    with _data_lock:
-                                        line_movements.append(lm)
-                                    db_save_line_movement(lm)  # 💾
-                                    log.info(f"[LineMove] {ename} | {bn} {outcome} {float(old_odds):.3f}→{float(new_odds):.3f} ({pct:.1%}) {'🌊STEAM' if is_steam else ''} {'🔄Sharp' if is_sharp_move else ''}")
-
-                        # อัพเดท history
-                        if hist_key not in odds_history:
-                            odds_history[hist_key] = {}
-                        odds_history[hist_key][bk] = new_odds
-
-                    # F2: track Pinnacle market presence per event
-                    if bk == "pinnacle":
-                        _pinnacle_seen_this_scan.add(ename)
-                        pinnacle_market_presence[ename] = now.timestamp()
-
-    # F2: detect Pinnacle market suspensions — event had Pinnacle last scan but not this scan
+            pe    = parse_event(event)  # P28: ParsedEvent ชุดเดียวกับ scan_all
+            ename = pe.name
+            commence = pe.commence
+
+            for q in pe.quotes:
+                bk, bn   = q.bm_key, q.bm_title
+                outcome  = q.name
+                new_odds = q.odds
+                hist_key = f"{ename}|{outcome}"
+
+                if bk in odds_history.get(hist_key, {}):
+                    old_odds = odds_history[hist_key][bk]
+                    if old_odds > 0:
+                        pct = (new_odds - old_odds) / old_odds
+                        if abs(pct) >= LINE_MOVE_THRESHOLD:
+                            direction = "UP 📈" if pct > 0 else "DOWN 📉"
+
+                            # 11. Steam: หลายเว็บขยับพร้อมกันภายใน 5 นาที
+                            steam_key = f"{ename}|{outcome}|{direction}"
+                            steam_tracker[steam_key].append((bk, now))
+                            # F1: record timestamp of Pinnacle's move for this steam key
+                            if bk == "pinnacle":
+                                steam_pinnacle_tracker[steam_key] = now.timestamp()
+                            # ลบ entry เก่ากว่า 5 นาที
+                            steam_tracker[steam_key] = [
+                                (b,t) for b,t in steam_tracker[steam_key]
+                                if (now-t).total_seconds() < 300
+                            ]
+                            # dedupe: นับเฉพาะ unique bookmakers
+                            unique_bms = {b for b, _ in steam_tracker[steam_key]}
+                            num_bm_moved = len(unique_bms)
+                            is_steam = num_bm_moved >= 2
+                            # F1: Pinnacle-led steam — True only if Pinnacle moved within this window
+                            pinnacle_moved = steam_key in steam_pinnacle_tracker
+
+                            # 10. RLM: odds ขยับ反向กับ public bet
+                            # ถ้า odds ลง (favourite กลายเป็น underdog) = sharp money เดิน
+                            is_sharp_move = pct < -LINE_MOVE_THRESHOLD and bk == "pinnacle"
+
+                            lm = LineMovement(
+                                event=ename, sport=sport,
+                                bookmaker=bn, outcome=outcome,
+                                odds_before=old_odds, odds_after=new_odds,
+                                pct_change=pct, direction=direction,
+                                is_steam=is_steam, is_rlm=is_sharp_move,
+                            )
+                            # C5: liquidity จาก Polymarket จริง
+                            liq_usd = 0.0
+                            if poly_markets:
+                                # P7: lookup ครั้งเดียวต่อ event — หลาย outcome/bm ใช้ผลเดียวกัน
+                                if ename not in _poly_liq_by_event:
+                                    poly_match = find_polymarket(ename, poly_markets)
+                                    _poly_liq_by_event[ename] = float(poly_match.get("_liquidity", 0) or 0) if poly_match else 0.0
+                                liq_usd = _poly_liq_by_event[ename]
+
+                                                    # C4: สร้าง all_odds dict — odds ของ outcome นี้จากทุก bm
+                            _hist_for_outcome = odds_history.get(hist_key, {})
+                            all_odds_for_ctx: dict[str, float] = {
+                                norm_bm_key(_bk): float(_o)
+                                for _bk, _o in _hist_for_outcome.items()
+                                if isinstance(_o, (int, float, Decimal))
+                            }
+                            all_odds_for_ctx[norm_bm_key(bk)] = float(new_odds)  # อัพเดทค่าล่าสุด
+
+                            # C4: หา sharp_odds (Pinnacle) vs soft_odds (bm นี้)
+                            sharp_odds_val = float(all_odds_for_ctx.get("pinnacle", 0))
+                            soft_odds_val  = float(new_odds)
+
+                            ctx = {
+                                "commence_time": commence,
+                                "num_bm_moved": num_bm_moved,
+                                "bm_key": bk,
+                                "liquidity_usd": liq_usd,
+                                "all_odds": all_odds_for_ctx,
+                                "sharp_odds": sharp_odds_val,
+                                "soft_odds": soft_odds_val,
+                                "pinnacle_moved": pinnacle_moved,  # F1
+                            }
+                            new_movements.append((lm, ctx))
+                            with _data_lock:
+                                line_movements.append(lm)
+                                _stats_agg.add_move(lm)  # P12
+                            publish_event("line_movement", _lm_to_dict(lm))  # P13
+                            _sport_sched.note_move(lm.sport)  # P18: volatility
+                            db_save_line_movement(lm)  # 💾
+                            log.info(f"[LineMove] {ename} | {bn} {outcome} {float(old_odds):.3f}→{float(new_odds):.3f} ({pct:.1%}) {'🌊STEAM' if is_steam else ''} {'🔄Sharp' if is_sharp_move else ''}")
+
+                # อัพเดท history
+                if hist_key not in odds_history:
+                    odds_history[hist_key] = {}
+                odds_history[hist_key][bk] = new_odds
+
+            # F2: track Pinnacle market presence per event
+            if "pinnacle" in pe.bm_keys:
+                _pinnacle_seen_this_scan.add(ename)
+                pinnacle_market_presence[ename] = now.timestamp()
+
+    if pinnacle_seen is None:
+        await detect_pinnacle_suspensions(_pinnacle_seen_this_scan)
+
+    # ส่ง Telegram alert สำหรับ line movements
+    if new_movements and _app:
+        await send_line_move_alerts(new_movements)
+
+    # จำกัด history
+    with _data_lock:
+        if len(line_movements) > 200:
+            _stats_agg.remove_moves(line_movements[:-200])  # P12
+            line_movements[:] = line_movements[-200:]
+
+
+async def detect_pinnacle_suspensions(pinnacle_seen_this_scan: set[str]):
+    """F2: detect Pinnacle market suspensions — event had Pinnacle last scan but not this scan"""
     _suspension_alerts: list[str] = []
-    _now_ts = now.timestamp()
+    _now_ts = datetime.now(timezone.utc).timestamp()
     for _ev_name, _last_ts in list(pinnacle_market_presence.items()):
-        if _ev_name not in _pinnacle_seen_this_scan and (_now_ts - _last_ts) < 600:
+        if _ev_name not in pinnacle_seen_this_scan and (_now_ts - _last_ts) < 600:
             # Pinnacle was seen within last 10 min but not now — likely suspended
             _suspension_alerts.append(_ev_name)
             pinnacle_market_presence[_ev_name] = 0  # reset so we don't re-alert
@@ -1018,15 +2053,6 @@ async def detect_line_movements(odds_by_sport: dict, poly_markets: list | None =
         except Exception as _se:
             log.warning(f"[F2/Suspension] alert failed: {_se}")
 
-    # ส่ง Telegram alert สำหรับ line movements
-    if new_movements and _app:
-        await send_line_move_alerts(new_movements)
-
-    # จำกัด history
-    with _data_lock:
-        if len(line_movements) > 200:
-            line_movements[:] = line_movements[-200:]
-
 
 async def send_line_move_alerts(movements: list[tuple[LineMovement, dict]]):
     """
@@ -1193,15 +2219,19 @@ async def send_line_move_alerts(movements: list[tuple[LineMovement, dict]]):
         else:
             keyboard = InlineKeyboardMarkup([[log_btn]])
 
+        _sent = []
         for cid in ALL_CHAT_IDS:
             try:
-                await _app.bot.send_message(
+                _m = await _app.bot.send_message(
                     chat_id=cid, text=msg, parse_mode="Markdown",
                     reply_markup=keyboard if keyboard else None,
                 )
+                _sent.append((cid, _m.message_id, keyboard))
                 await asyncio.sleep(0.3)
             except Exception as e:
                 log.error(f"[LineMove] alert error: {e}")
+        if vb_sid:
+            track_alert(vb_sid, msg, _sent)  # P17: quote refresher แก้ alert ถ้า value หาย
 
 
 # ══════════════════════════════════════════════════════════════════
@@ -1215,6 +2245,7 @@ def update_clv(event: str, outcome: str, bookmaker: str, final_odds: Decimal):
         if key not in closing_odds:
             closing_odds[key] = {}
         closing_odds[key][norm_bm_key(bookmaker)] = final_odds
+        _stats_agg.closing_changed(event)  # P12: CLV ของ trade ใน event นี้เปลี่ยน
 
 
 def calc_clv(trade: TradeRecord,
@@ -1431,6 +2462,46 @@ def build_betting_links(event_name: str, outcome: str, sport: str,
     return "\n".join(links)
 
 
+# ══════════════════════════════════════════════════════════════════
+#  HTTP SESSION POOL — session เดียวทั้ง process (keep-alive + DNS cache)
+# ══════════════════════════════════════════════════════════════════
+HTTP_POOL_LIMIT          = _i("HTTP_POOL_LIMIT",          100)  # total connections
+HTTP_POOL_LIMIT_PER_HOST = _i("HTTP_POOL_LIMIT_PER_HOST", 10)   # ต่อ host (odds-api / gamma / clob / kalshi / cloudbet)
+HTTP_KEEPALIVE_SEC       = _i("HTTP_KEEPALIVE_SEC",       60)
+HTTP_DNS_TTL_SEC         = _i("HTTP_DNS_TTL_SEC",         300)
+
+_http_session: Optional[aiohttp.ClientSession] = None  # P5: สร้างใน post_init(), ปิดใน post_shutdown()
+
+def _new_http_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_SEC,
+        ttl_dns_cache=HTTP_DNS_TTL_SEC,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+def get_http_session() -> aiohttp.ClientSession:
+    """P5: คืน pooled session ตัวเดียวของ process — ห้าม close เอง (ใช้ close_http_session ตอน shutdown)
+    ถ้ายังไม่ถูกสร้าง (เช่นเรียกก่อน post_init) หรือถูกปิดไปแล้ว จะสร้างใหม่ให้อัตโนมัติ
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = _new_http_session()
+    return _http_session
+
+async def close_http_session() -> None:
+    """P5: ปิด pooled session + connector — เรียกครั้งเดียวตอน shutdown"""
+    global _http_session
+    s, _http_session = _http_session, None
+    if s is not None and not s.closed:
+        await s.close()
+        # aiohttp: ให้ SSL transports ปิดจริงก่อน loop หยุด
+        await asyncio.sleep(0.25)
+        log.info("[HTTP] pooled session closed")
+
+
 # ══════════════════════════════════════════════════════════════════
 #  ASYNC FETCH
 # ══════════════════════════════════════════════════════════════════
@@ -1446,6 +2517,7 @@ async def async_fetch_odds(session: aiohttp.ClientSession, sport_key: str) -> li
             remaining = int(r.headers.get("x-requests-remaining", api_remaining))
             data = await r.json(content_type=None)
             await update_quota(remaining)
+            _sport_sched.note_call_cost("odds", sport_key, int(r.headers.get("x-requests-last", 1)))  # P18
             if isinstance(data, list):
                 log.info(f"[OddsAPI] {sport_key} | events={len(data)} | remaining={remaining}")
                 return data
@@ -1466,13 +2538,15 @@ async def fetch_poly_market_detail(session: aiohttp.ClientSession, condition_id:
         ) as r:
             if r.status != 200: return {}
             book = await r.json(content_type=None)
-            bids = book.get("bids", [])
-            asks = book.get("asks", [])
+            # P21: เก็บ ladder เต็ม [(price, size)] best-first — CLOB ไม่รับประกันลำดับ
+            bids = sorted(((float(b.get("price", 0)), float(b.get("size", 0))) for b in book.get("bids", [])),
+                          reverse=True)
+            asks = sorted((float(a.get("price", 0)), float(a.get("size", 0))) for a in book.get("asks", []))
             # คำนวณ liquidity top 3 levels
-            bid_liq = sum(float(b.get("size",0)) for b in bids[:3])
-            ask_liq = sum(float(a.get("size",0)) for a in asks[:3])
-            best_bid = float(bids[0]["price"]) if bids else 0
-            best_ask = float(asks[0]["price"]) if asks else 0
+            bid_liq = sum(sz for _, sz in bids[:3])
+            ask_liq = sum(sz for _, sz in asks[:3])
+            best_bid = bids[0][0] if bids else 0
+            best_ask = asks[0][0] if asks else 0
             spread   = best_ask - best_bid if best_bid and best_ask else 0
             return {
                 "bid_liquidity": bid_liq,
@@ -1481,6 +2555,8 @@ async def fetch_poly_market_detail(session: aiohttp.ClientSession, condition_id:
                 "best_ask":      best_ask,
                 "spread":        spread,
                 "mid_price":     (best_bid + best_ask) / 2 if best_bid and best_ask else 0,
+                "bids":          bids,
+                "asks":          asks,
             }
     except Exception as e:
         log.debug(f"[Poly orderbook] {condition_id}: {e}")
@@ -1516,21 +2592,552 @@ async def _http_get_with_retry(session: aiohttp.ClientSession, url: str,
     return 0, None
 
 
-async def async_fetch_polymarket(session: aiohttp.ClientSession) -> list[dict]:
-    """ดึง Polymarket sports events ผ่าน Gamma API (แม่นยำกว่า CLOB /markets)"""
-    try:
-        # Step 1: ดึง sports series list จาก Gamma API
-        gamma_markets: list[dict] = []
-        _st, _data = await _http_get_with_retry(
-            session, "https://gamma-api.polymarket.com/events",
-            params={"active": "true", "closed": "false", "limit": 100,
-                    "tag_slug": "sports", "order": "volume24hr", "ascending": "false"},
-            label="Polymarket/Gamma",
+# ── P20: Polymarket catalog ──────────────────────────────────────
+# เดิม: ทุก scan ดึง Gamma 100 events ใหม่ทั้งก้อน + derive token/sport/fee ใหม่ + ยิง /book 20 ตัวไม่มี cache
+# ตอนนี้: catalog ถาวรใน memory keyed ด้วย conditionId (หรือ slug)
+#   full refresh (Gamma list) ทุก POLY_CATALOG_REFRESH_SEC — derive ใหม่เฉพาะ market ที่ใหม่/โครงสร้างเปลี่ยน
+#   ระหว่างนั้น price-only refresh ผ่าน CLOB /midpoints (batch) ทุก POLY_PRICE_REFRESH_SEC
+#   orderbook ของ top market cache ราย token POLY_BOOK_TTL_SEC
+#   Gamma ล้ม → ใช้ catalog เดิม (ราคายัง refresh ผ่าน midpoints) ได้ไม่เกิน POLY_CATALOG_MAX_AGE_SEC แล้วถอยไป CLOB fallback
+POLY_CATALOG_REFRESH_SEC = _i("POLY_CATALOG_REFRESH_SEC", 300)
+POLY_CATALOG_MAX_AGE_SEC = _i("POLY_CATALOG_MAX_AGE_SEC", 1800)
+POLY_PRICE_REFRESH_SEC   = _i("POLY_PRICE_REFRESH_SEC",   20)
+POLY_BOOK_TTL_SEC        = _i("POLY_BOOK_TTL_SEC",        60)
+POLY_MIDPOINT_BATCH      = 100
+_POLY_TAG_SPORTS  = ("soccer", "football", "basketball", "mma", "tennis", "baseball", "hockey", "rugby")
+_POLY_SLUG_SPORTS = ("soccer", "football", "basketball", "mma", "tennis")
+# E2: allowlist approach — only accept clear outright winner propositions (blocklist ของคำที่ไม่ใช่ H2H)
+_POLY_NON_H2H_TERMS = (
+    "cover", "spread", "handicap", "over", "under", "total",
+    "advance", "qualify", "series", "map ", "set ", "quarter",
+    "period", "first half", "game 1", "game 2", "lift the trophy",
+)
+
+
+def _poly_proposition(question: str) -> dict:
+    """G2/H5: ส่วนของ Yes/No proposition ที่ไม่ขึ้นกับ event — cache ไว้ใน market["_prop"]
+    subject = ทีมที่ Yes หมายถึง ('Will X beat Y?' / 'Will X win?') หรือ None ถ้า parse ไม่ได้
+    """
+    q = question.lower()
+    pat = (re.search(r'will\s+(.*?)\s+(?:beat|defeat|win against)', q)
+           or re.search(r'will\s+(.*?)\s+win\b', q))  # G4: fallback 'Will X win?'
+    return {
+        "subject": pat.group(1).strip() if pat else None,
+        "non_h2h": any(x in q for x in _POLY_NON_H2H_TERMS),
+    }
+
+
+class PolyCatalog:
+    """P20: Polymarket market catalog — เรียกจาก main loop เท่านั้น
+    market dict ใน catalog เป็นของ catalog — markets() คืน copy ให้ scan ใช้ (index/อ่านได้อิสระ)
+    """
+
+    def __init__(self):
+        self._entries: dict[str, dict] = {}                 # key → {"sig", "market", "vol24", "vol"}
+        self._books:   dict[str, tuple[float, dict]] = {}   # token_id → (ts, book)
+        self.last_full  = 0.0
+        self.last_price = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _sig(ev: dict, m: dict) -> tuple:
+        """โครงสร้างที่ derived fields ขึ้นกับ — ราคา/volume ไม่อยู่ใน sig (เปลี่ยนทุกรอบ)"""
+        return (
+            m.get("question", ev.get("title", ev.get("question", ""))),
+            m.get("slug", ev.get("slug", "")),
+            tuple(m.get("outcomes", []) or ()),
+            tuple(m.get("clobTokenIds", []) or ()),
+            tuple(t.get("token_id", "") for t in m.get("tokens", []) or ()),
+            tuple(t.get("slug", "") for t in ev.get("tags", []) or ()),
+            m.get("makerBaseFee"), m.get("takerBaseFee"),
         )
-        if _st == 200 and isinstance(_data, list):
-            gamma_markets = _data
 
-        if not gamma_markets:
+    @staticmethod
+    def _tokens(m: dict) -> list[dict]:
+        tokens = m.get("tokens", [])
+        # Gamma API: tokens อาจอยู่ที่ market level หรือ event level
+        if not tokens:
+            # สร้าง synthetic tokens จาก outcomes + prices
+            outcomes = m.get("outcomes", [])
+            out_prices = m.get("outcomePrices", m.get("outcome_prices", []))
+            if len(outcomes) == 2 and len(out_prices) == 2:
+                tokens = [
+                    {"outcome": outcomes[0], "price": out_prices[0],
+                     "token_id": m.get("clobTokenIds", ["",""])[0] if m.get("clobTokenIds") else ""},
+                    {"outcome": outcomes[1], "price": out_prices[1],
+                     "token_id": m.get("clobTokenIds", ["",""])[1] if m.get("clobTokenIds") else ""},
+                ]
+        return [dict(t) for t in tokens]
+
+    @staticmethod
+    def _derive(ev: dict, m: dict, tokens: list[dict]) -> dict:
+        fee_rate = float(m.get("makerBaseFee", 0) or 0) + float(m.get("takerBaseFee", 200) or 200)
+        # Infer sport from event tags or slug for Yes/No guard
+        ev_tags = [t.get("slug", "") for t in ev.get("tags", [])]
+        ev_sport = next((tg for tg in ev_tags if tg in _POLY_TAG_SPORTS), "")
+        if not ev_sport:
+            _slug = m.get("slug", ev.get("slug", "")).lower()
+            ev_sport = next((sp for sp in _POLY_SLUG_SPORTS if sp in _slug), "")
+        question = m.get("question", ev.get("title", ev.get("question", "")))
+        return {
+            "question": question,
+            "slug":     m.get("slug", ev.get("slug", "")),
+            "tokens":   tokens,
+            "_fee_pct": fee_rate / 10000,
+            "_gamma":   True,
+            "_sport":   ev_sport,
+            "_prop":    _poly_proposition(question),
+        }
+
+    def ingest(self, events: list[dict]) -> tuple[int, int]:
+        """Gamma events → catalog; คืน (derived, reused) — market ที่หายจาก listing ถูกลบ"""
+        seen: set[str] = set()
+        derived = reused = 0
+        for ev in events[:100]:
+            markets_in_ev = ev.get("markets", [])
+            # เอาเฉพาะ binary market (2 outcomes)
+            binary = [m for m in markets_in_ev if len(m.get("outcomes", [])) == 2
+                      or len(m.get("tokens", [])) == 2]
+            if not binary and len(ev.get("tokens", [])) == 2:
+                binary = [ev]  # Gamma event อาจเก็บ tokens ที่ระดับ event
+            for m in binary:
+                key = m.get("conditionId") or m.get("condition_id") or m.get("slug", ev.get("slug", ""))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                sig = self._sig(ev, m)
+                entry = self._entries.get(key)
+                fresh = self._tokens(m)
+                if entry is None or entry["sig"] != sig:
+                    if len(fresh) < 2:
+                        self._entries.pop(key, None)
+                        continue
+                    entry = {"sig": sig, "market": self._derive(ev, m, fresh)}
+                    self._entries[key] = entry
+                    derived += 1
+                else:
+                    # โครงสร้างเดิม — อัปเดตแค่ราคา (ตำแหน่ง token เดิมตาม sig)
+                    for tok, new in zip(entry["market"]["tokens"], fresh):
+                        tok["price"] = new.get("price", tok.get("price", 0))
+                    reused += 1
+                entry["vol24"] = float(m.get("volume24hr", ev.get("volume24hr", 0)) or 0)
+                entry["vol"]   = float(m.get("volume",    ev.get("volume",    0)) or 0)
+        for key in [k for k in self._entries if k not in seen]:
+            del self._entries[key]
+        self.last_full = self.last_price = time.time()
+        return derived, reused
+
+    def token_ids(self) -> list[str]:
+        return [t["token_id"] for e in self._entries.values()
+                for t in e["market"]["tokens"] if t.get("token_id")]
+
+    def update_prices(self, mids: dict[str, float]) -> int:
+        n = 0
+        for e in self._entries.values():
+            for tok in e["market"]["tokens"]:
+                p = mids.get(tok.get("token_id", ""))
+                if p is not None:
+                    tok["price"] = p
+                    n += 1
+        self.last_price = time.time()
+        return n
+
+    def book(self, token_id: str) -> Optional[dict]:
+        hit = self._books.get(token_id)
+        return hit[1] if hit and time.time() - hit[0] < POLY_BOOK_TTL_SEC else None
+
+    def put_book(self, token_id: str, book: dict):
+        self._books[token_id] = (time.time(), book)
+
+    def markets(self) -> list[dict]:
+        """market ที่ผ่าน filter ราคา/volume — copy เรียงตาม liquidity (เหมือน enriched list เดิม)"""
+        out = []
+        for e in self._entries.values():
+            m = e["market"]
+            tokens = m["tokens"]
+            p_a = float(tokens[0].get("price", 0) or 0)
+            p_b = float(tokens[1].get("price", 0) or 0)
+            if p_a <= 0.01 or p_b <= 0.01: continue
+            volume_24h, total_vol = e["vol24"], e["vol"]
+            if volume_24h < 200 and total_vol < 2000: continue
+            out.append({**m, "tokens": [dict(t) for t in tokens],
+                        "_volume_24h": volume_24h, "_liquidity": max(volume_24h, total_vol / 30)})
+        out.sort(key=lambda x: x.get("_liquidity", 0), reverse=True)
+        # book cache ที่หมดอายุแล้วทิ้ง — token ที่ไม่อยู่ใน catalog จะไม่ถูกถามอีก
+        now = time.time()
+        for tid in [t for t, (ts, _) in self._books.items() if now - ts >= POLY_BOOK_TTL_SEC]:
+            del self._books[tid]
+        return out
+
+
+_poly_catalog = PolyCatalog()
+
+
+async def _poly_refresh_prices(session: aiohttp.ClientSession) -> int:
+    """P20: price-only refresh — CLOB POST /midpoints เป็น batch ต่อ token ที่รู้จักแล้ว"""
+    ids = _poly_catalog.token_ids()
+    mids: dict[str, float] = {}
+    for i in range(0, len(ids), POLY_MIDPOINT_BATCH):
+        chunk = ids[i:i + POLY_MIDPOINT_BATCH]
+        try:
+            async with session.post("https://clob.polymarket.com/midpoints",
+                                    json=[{"token_id": t} for t in chunk],
+                                    timeout=aiohttp.ClientTimeout(total=10)) as r:
+                if r.status != 200:
+                    log.debug(f"[Polymarket] midpoints HTTP {r.status}")
+                    return 0
+                data = await r.json(content_type=None)
+        except Exception as e:
+            log.debug(f"[Polymarket] midpoints: {e}")
+            return 0
+        if isinstance(data, dict):
+            for tid, p in data.items():
+                try: mids[tid] = float(p)
+                except (TypeError, ValueError): pass
+    return _poly_catalog.update_prices(mids)
+
+
+async def _poly_refresh_catalog(session: aiohttp.ClientSession) -> bool:
+    """P20: full/price/orderbook refresh ตามอายุ catalog
+    คืน False ถ้า Gamma ล้มและ catalog ว่างหรือเก่าเกิน POLY_CATALOG_MAX_AGE_SEC (ให้ใช้ CLOB fallback)
+    """
+    now = time.time()
+    if not len(_poly_catalog) or now - _poly_catalog.last_full >= POLY_CATALOG_REFRESH_SEC:
+        _st, _data = await _http_get_with_retry(
+            session, "https://gamma-api.polymarket.com/events",
+            params={"active": "true", "closed": "false", "limit": 100,
+                    "tag_slug": "sports", "order": "volume24hr", "ascending": "false"},
+            label="Polymarket/Gamma",
+        )
+        if _st == 200 and isinstance(_data, list) and _data:
+            derived, reused = _poly_catalog.ingest(_data)
+            log.info(f"[Polymarket] catalog refresh: events={len(_data)} | markets={len(_poly_catalog)} "
+                     f"| derived={derived} reused={reused}")
+        elif not len(_poly_catalog):
+            return False
+        elif now - _poly_catalog.last_full >= POLY_CATALOG_MAX_AGE_SEC:
+            log.warning(f"[Polymarket] Gamma refresh failed — catalog อายุ {now - _poly_catalog.last_full:.0f}s "
+                        f"เกิน {POLY_CATALOG_MAX_AGE_SEC}s ไม่ใช้ต่อ")
+            return False
+        else:
+            log.warning("[Polymarket] Gamma refresh failed — ใช้ catalog เดิม (ราคา refresh ผ่าน midpoints)")
+    if time.time() - _poly_catalog.last_price >= POLY_PRICE_REFRESH_SEC:
+        n = await _poly_refresh_prices(session)
+        log.debug(f"[Polymarket] price refresh: tokens={n}")
+    if USE_POLY_STREAM:
+        # P22: mirror token ใน catalog — market ที่ scan ใช้เรียงตาม liquidity ก่อน ที่เหลือตามหลัง (cap ตัดจากท้าย)
+        _book_stream.subscribe([t.get("token_id") for m in _poly_catalog.markets() for t in m["tokens"]]
+                               + _poly_catalog.token_ids())
+    # top 20 ตาม liquidity — ดึง orderbook เฉพาะ token ที่ cache หมดอายุ และ stream ยังไม่มี book สด (P22)
+    need = [tid for m in _poly_catalog.markets()[:20]
+            if (tid := m["tokens"][0].get("token_id")) and _poly_catalog.book(tid) is None
+            and _book_stream.book(tid) is None]
+    books = await asyncio.gather(*(fetch_poly_market_detail(session, tid) for tid in need),
+                                 return_exceptions=True)
+    for tid, book in zip(need, books):
+        if isinstance(book, dict) and book:
+            _poly_catalog.put_book(tid, book)
+    if need:
+        log.debug(f"[Polymarket] orderbooks fetched={len(need)}")
+    return True
+
+
+# ── P22: Polymarket order-book stream ────────────────────────────
+# เดิม: book ของ Polymarket มาจาก REST /book เฉพาะ top 20 ตอน scan + อีกรอบตอน confirm
+# ตอนนี้: mirror ของ book ต่อ token จาก CLOB market channel (websocket) — scan/confirm อ่าน mirror โดยไม่ยิง request
+#   transport เสียบเปลี่ยนได้ (BookStream(transport_factory=...) หรือ POLY_WS_URL → replay server ใน local)
+#   mirror ของ stream ที่ตาย (ไม่มี frame เกิน POLY_STREAM_STALE_SEC) ถือว่า stale → ไม่ใช้ mirror, fallback REST
+#   (scan: _depth/midpoint ของ catalog ที่มี TTL ของตัวเอง · confirm: is_stale(book_token=...) → /book)
+#   gap (delta ก่อน snapshot / timestamp ย้อนหลัง) → ทิ้ง book ของ token นั้นแล้ว subscribe ใหม่เพื่อขอ snapshot
+#   token ที่หลุดจากชุด → ส่ง unsubscribe บน connection เดิม
+USE_POLY_STREAM        = _s("USE_POLY_STREAM", "true").lower() == "true"
+POLY_WS_URL            = _s("POLY_WS_URL", "wss://ws-subscriptions-clob.polymarket.com/ws/market")
+POLY_STREAM_STALE_SEC  = _i("POLY_STREAM_STALE_SEC",  30)
+POLY_STREAM_PING_SEC   = _i("POLY_STREAM_PING_SEC",   10)
+POLY_STREAM_MAX_TOKENS = _i("POLY_STREAM_MAX_TOKENS", 500)
+
+
+class WsTransport:
+    """P22: transport เริ่มต้น — aiohttp websocket บน pooled session
+    interface ที่ BookStream ใช้: connect() / send(text) / recv() → str ("" = frame ที่ไม่ใช่ text, None = ปิด) / close()
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+
+    async def connect(self):
+        self._ws = await get_http_session().ws_connect(self.url, autoping=True)
+
+    async def send(self, text: str):
+        await self._ws.send_str(text)
+
+    async def recv(self) -> Optional[str]:
+        msg = await self._ws.receive()
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            return msg.data
+        if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
+                        aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+            return None
+        return ""
+
+    async def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None and not ws.closed:
+            await ws.close()
+
+
+class BookStream:
+    """P22: live order-book mirror ต่อ token — เรียกจาก main loop เท่านั้น
+    book(token) คืน dict รูปแบบเดียวกับ fetch_poly_market_detail (รวม bids/asks ladder) หรือ None ถ้า stale
+    """
+
+    def __init__(self, transport_factory=None):
+        self._factory = transport_factory or (lambda: WsTransport(POLY_WS_URL))
+        self._transport = None
+        self._wanted: set[str] = set()
+        self._sent:   set[str] = set()       # token ที่ subscribe บน connection ปัจจุบันแล้ว
+        self._resync: set[str] = set()       # token ที่เจอ gap — รอส่ง subscribe ใหม่
+        self._awaiting: set[str] = set()     # subscribe ส่งแล้ว รอ snapshot — delta ระหว่างนี้ไม่นับเป็น gap ซ้ำ
+        self._books:  dict[str, dict] = {}   # token → {"bids", "asks": {price: size}, "ts": float, "mts": server ms}
+        self._wake = asyncio.Event()         # subscribe() ปลุก loop ให้ส่ง subscription ทันที
+        self.connected  = False
+        self.last_frame = 0.0
+        self.reconnects = 0
+        self.frames     = 0
+        self.resyncs    = 0
+
+    # ── subscriptions ──
+    def subscribe(self, token_ids: list[str]):
+        """ตั้งชุด token ที่ต้องการ (แทนชุดเดิม) — loop รอบถัดไปส่ง subscribe token ใหม่ / unsubscribe token ที่หลุด
+        เกิน POLY_STREAM_MAX_TOKENS → เก็บ N ตัวแรกตามลำดับที่ caller ส่งมา (caller เรียงตาม liquidity)
+        """
+        wanted = set(list(dict.fromkeys(t for t in token_ids if t))[:POLY_STREAM_MAX_TOKENS])
+        for t in self._wanted - wanted:
+            self._books.pop(t, None)
+        self._resync &= wanted
+        self._awaiting &= wanted
+        if wanted != self._wanted:
+            self._wake.set()
+        self._wanted = wanted
+
+    def tracks(self, token_id: str) -> bool:
+        return token_id in self._wanted
+
+    # ── staleness ──
+    def age(self, token_id: str) -> float:
+        """วินาทีตั้งแต่ stream ยืนยันว่า book ของ token นี้ยังปัจจุบัน — inf ถ้าไม่มี/connection ตาย"""
+        b = self._books.get(token_id)
+        if not self.connected or b is None:
+            return float("inf")
+        return time.time() - max(b["ts"], self.last_frame)
+
+    def is_stale(self, token_id: str) -> bool:
+        return self.age(token_id) > POLY_STREAM_STALE_SEC
+
+    # ── reads ──
+    def book(self, token_id: str) -> Optional[dict]:
+        if self.is_stale(token_id):
+            return None
+        b = self._books[token_id]
+        bids = sorted(((p, sz) for p, sz in b["bids"].items() if sz > 0), reverse=True)
+        asks = sorted((p, sz) for p, sz in b["asks"].items() if sz > 0)
+        best_bid = bids[0][0] if bids else 0
+        best_ask = asks[0][0] if asks else 0
+        return {
+            "bid_liquidity": sum(sz for _, sz in bids[:3]),
+            "ask_liquidity": sum(sz for _, sz in asks[:3]),
+            "best_bid":      best_bid,
+            "best_ask":      best_ask,
+            "spread":        best_ask - best_bid if best_bid and best_ask else 0,
+            "mid_price":     (best_bid + best_ask) / 2 if best_bid and best_ask else 0,
+            "bids":          bids,
+            "asks":          asks,
+        }
+
+    def snapshot(self) -> dict:
+        live = sum(1 for t in self._wanted if not self.is_stale(t))
+        return {"connected": self.connected, "subscribed": len(self._wanted), "live": live,
+                "frames": self.frames, "reconnects": self.reconnects, "resyncs": self.resyncs,
+                "last_frame_age": round(time.time() - self.last_frame, 1) if self.last_frame else None}
+
+    # ── ingest ──
+    @staticmethod
+    def _levels(raw) -> dict[float, float]:
+        out = {}
+        for lv in raw or ():
+            try:
+                out[float(lv["price"])] = float(lv["size"])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return out
+
+    @staticmethod
+    def _mts(msg: dict) -> int:
+        try:
+            return int(msg.get("timestamp") or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _gap(self, tid: str):
+        """delta ต่อกับ book ไม่ได้ — ทิ้ง book (ไม่ให้ scan อ่านของผิด) แล้วขอ snapshot ใหม่"""
+        self._books.pop(tid, None)
+        if tid in self._awaiting:
+            return  # ขอ snapshot ไปแล้ว ยังไม่มา
+        self._resync.add(tid)
+        self.resyncs += 1
+        self._wake.set()
+        log.debug(f"[BookStream] gap on {tid[:12]} — resync")
+
+    def apply(self, msg):
+        """message จาก market channel: book (snapshot) / price_change (delta) — ประเภทอื่นข้าม"""
+        if isinstance(msg, list):
+            for m in msg:
+                self.apply(m)
+            return
+        if not isinstance(msg, dict):
+            return
+        now = time.time()
+        et = msg.get("event_type", "")
+        if et == "book":
+            tid = msg.get("asset_id", "")
+            if tid in self._wanted:
+                self._books[tid] = {"bids": self._levels(msg.get("bids", msg.get("buys"))),
+                                    "asks": self._levels(msg.get("asks", msg.get("sells"))),
+                                    "ts": now, "mts": self._mts(msg)}
+                self._awaiting.discard(tid)
+                self._resync.discard(tid)
+        elif et == "price_change":
+            # schema เก่า: asset_id + changes[]; ใหม่: price_changes[] ที่มี asset_id ต่อรายการ
+            changes = msg.get("price_changes") or [{**c, "asset_id": msg.get("asset_id", "")}
+                                                    for c in msg.get("changes", [])]
+            mts = self._mts(msg)
+            for c in changes:
+                tid = c.get("asset_id", "")
+                if tid not in self._wanted:
+                    continue
+                b = self._books.get(tid)
+                if b is None or (mts and mts < b["mts"]):
+                    self._gap(tid)  # ไม่มี snapshot ให้ต่อ / delta ย้อนเวลา (หลุดลำดับ)
+                    continue
+                try:
+                    price, size = float(c["price"]), float(c["size"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                side = b["bids"] if str(c.get("side", "")).upper() == "BUY" else b["asks"]
+                if size > 0:
+                    side[price] = size
+                else:
+                    side.pop(price, None)
+                b["ts"] = now
+                b["mts"] = max(b["mts"], mts)
+
+    # ── connection loop ──
+    async def _sync_subscriptions(self):
+        gone = sorted(self._sent - self._wanted)
+        if gone:
+            await self._transport.send(json.dumps({"assets_ids": gone, "operation": "unsubscribe"}))
+            self._sent -= set(gone)
+        new = sorted(self._wanted - self._sent)
+        if new:
+            await self._transport.send(json.dumps({"assets_ids": new, "type": "market"} if not self._sent
+                                                  else {"assets_ids": new, "operation": "subscribe"}))
+            self._sent |= set(new)
+            self._awaiting |= set(new)
+        redo = sorted(self._resync & self._sent)
+        if redo:
+            # subscribe ซ้ำ → server ส่ง book snapshot ของ token นั้นใหม่
+            await self._transport.send(json.dumps({"assets_ids": redo, "operation": "subscribe"}))
+            self._resync -= set(redo)
+            self._awaiting |= set(redo)
+
+    async def run(self):
+        backoff = 1
+        while not _shutdown_event.is_set():
+            if not self._wanted:
+                await asyncio.sleep(1)
+                continue
+            self._transport = self._factory()
+            self._sent = set()
+            self._resync.clear()
+            self._awaiting.clear()
+            recv_t = None
+            try:
+                await self._transport.connect()
+                self.connected = True
+                self.last_frame = time.time()
+                log.info(f"[BookStream] connected | tokens={len(self._wanted)}")
+                while not _shutdown_event.is_set():
+                    self._wake.clear()
+                    await self._sync_subscriptions()
+                    if recv_t is None:
+                        recv_t = asyncio.ensure_future(self._transport.recv())
+                    wake_t = asyncio.ensure_future(self._wake.wait())
+                    done, _ = await asyncio.wait({recv_t, wake_t}, timeout=POLY_STREAM_PING_SEC,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    wake_t.cancel()
+                    if recv_t not in done:
+                        if not self._wake.is_set():
+                            await self._transport.send("PING")  # server ตอบ PONG → last_frame ขยับ
+                        continue
+                    text, recv_t = recv_t.result(), None
+                    if text is None:
+                        break
+                    self.last_frame = time.time()
+                    self.frames += 1
+                    backoff = 1
+                    if not text or text == "PONG":
+                        continue
+                    try:
+                        self.apply(json.loads(text))
+                    except ValueError:
+                        log.debug(f"[BookStream] bad frame: {text[:80]}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"[BookStream] {type(e).__name__}: {e}")
+            finally:
+                if recv_t is not None:
+                    recv_t.cancel()
+                self.connected = False
+                self._books.clear()  # snapshot ใหม่ทุก connection — delta ข้าม connection ไม่ต่อเนื่อง
+                try:
+                    await self._transport.close()
+                except Exception:
+                    pass
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    async def close(self):
+        if self._transport is not None:
+            await self._transport.close()
+
+
+_book_stream = BookStream()
+
+
+def _alt_depth(market: dict, token_id: str) -> tuple[Optional[list], bool]:
+    """P22: ask ladder ของ token — stream mirror ก่อน (ปัจจุบันกว่า) แล้วค่อย _depth จาก REST ตอน fetch
+    mirror ที่ stale ไม่ถูกคืนเลย (book() → None) — from_stream=True จึงแปลว่าสดเสมอ ไม่ต้องเช็คซ้ำที่ caller
+    Returns: (ladder | None, from_stream)
+    """
+    if token_id and _book_stream.tracks(token_id):
+        book = _book_stream.book(token_id)
+        if book and book["asks"]:
+            return book["asks"], True
+    return (market.get("_depth") or {}).get(token_id), False
+
+
+async def async_fetch_polymarket(session: aiohttp.ClientSession) -> list[dict]:
+    """ดึง Polymarket sports events ผ่าน Gamma API (แม่นยำกว่า CLOB /markets)
+    P20: อ่านจาก _poly_catalog — Gamma/ราคา/orderbook refresh ตามอายุ ไม่ยิงใหม่ทุก scan
+    """
+    try:
+        # Step 1: refresh catalog (singleflight — caller พร้อมกันใช้ refresh เดียว)
+        if not await singleflight(("polymarket", "catalog", ""), lambda: _poly_refresh_catalog(session)):
             # fallback ถ้า Gamma ไม่ตอบ — ลอง CLOB เดิม (with retry)
             _st2, _data2 = await _http_get_with_retry(
                 session, "https://clob.polymarket.com/markets",
@@ -1564,86 +3171,25 @@ async def async_fetch_polymarket(session: aiohttp.ClientSession) -> list[dict]:
             log.info(f"[Polymarket] CLOB fallback: {len(enriched)} markets")
             return enriched
 
-        # Step 2: แปลง Gamma events → format เดิมที่ find_polymarket ใช้
-        enriched = []
-        for ev in gamma_markets[:100]:
-            markets_in_ev = ev.get("markets", [])
-            # เอาเฉพาะ binary market (2 outcomes)
-            binary = [m for m in markets_in_ev if len(m.get("outcomes", [])) == 2
-                      or len(m.get("tokens", [])) == 2]
-            if not binary:
-                # Gamma event อาจเก็บ tokens ที่ระดับ event
-                tokens = ev.get("tokens", [])
-                if len(tokens) == 2:
-                    binary = [ev]
-            for m in binary:
-                tokens = m.get("tokens", [])
-                # Gamma API: tokens อาจอยู่ที่ market level หรือ event level
-                if not tokens:
-                    # สร้าง synthetic tokens จาก outcomes + prices
-                    outcomes = m.get("outcomes", [])
-                    out_prices = m.get("outcomePrices", m.get("outcome_prices", []))
-                    if len(outcomes) == 2 and len(out_prices) == 2:
-                        tokens = [
-                            {"outcome": outcomes[0], "price": out_prices[0],
-                             "token_id": m.get("clobTokenIds", ["",""])[0] if m.get("clobTokenIds") else ""},
-                            {"outcome": outcomes[1], "price": out_prices[1],
-                             "token_id": m.get("clobTokenIds", ["",""])[1] if m.get("clobTokenIds") else ""},
-                        ]
-                if len(tokens) < 2: continue
-
-                p_a = float(tokens[0].get("price", 0) or 0)
-                p_b = float(tokens[1].get("price", 0) or 0)
-                if p_a <= 0.01 or p_b <= 0.01: continue
+        # Step 2: market จาก catalog (derived fields cache แล้ว) เรียงตาม liquidity
+        enriched = _poly_catalog.markets()
 
-                volume_24h = float(m.get("volume24hr", ev.get("volume24hr", 0)) or 0)
-                total_vol  = float(m.get("volume",    ev.get("volume",    0)) or 0)
-                if volume_24h < 200 and total_vol < 2000: continue
-
-                fee_rate = float(m.get("makerBaseFee", 0) or 0) + float(m.get("takerBaseFee", 200) or 200)
-
-                # Infer sport from event tags or slug for Yes/No guard
-                ev_tags = [t.get("slug", "") for t in ev.get("tags", [])]
-                ev_sport = next((tg for tg in ev_tags if tg in (
-                    "soccer", "football", "basketball", "mma", "tennis",
-                    "baseball", "hockey", "rugby",
-                )), "")
-                if not ev_sport:
-                    _slug = m.get("slug", ev.get("slug", "")).lower()
-                    for _sp in ("soccer", "football", "basketball", "mma", "tennis"):
-                        if _sp in _slug:
-                            ev_sport = _sp
-                            break
-                enriched.append({
-                    "question":        m.get("question", ev.get("title", ev.get("question", ""))),
-                    "slug":            m.get("slug", ev.get("slug", "")),
-                    "tokens":          tokens,
-                    "_fee_pct":        fee_rate / 10000,
-                    "_volume_24h":     volume_24h,
-                    "_liquidity":      max(volume_24h, total_vol / 30),
-                    "_gamma":          True,
-                    "_sport":          ev_sport,
-                })
-
-        # Step 3: enrich top 20 ด้วย real orderbook liquidity
-        enriched.sort(key=lambda x: x.get("_liquidity", 0), reverse=True)
+        # Step 3: enrich top 20 ด้วย real orderbook liquidity — P20: book cache เติมใน refresh แล้ว
         top, rest = enriched[:20], enriched[20:]
-        async def _empty_book(): return {}
-        book_tasks = [
-            fetch_poly_market_detail(session, m["tokens"][0].get("token_id", ""))
-            if m["tokens"][0].get("token_id") else _empty_book()
-            for m in top
-        ]
-        books = await asyncio.gather(*book_tasks, return_exceptions=True)
-        for m, book in zip(top, books):
-            if isinstance(book, dict) and book:
+        for m in top:
+            tid0 = m["tokens"][0].get("token_id", "")
+            book = _book_stream.book(tid0) or _poly_catalog.book(tid0)  # P22: stream ก่อน REST cache
+            if book:
                 real_liq = book.get("bid_liquidity", 0) + book.get("ask_liquidity", 0)
                 if real_liq > 0:
                     m["_liquidity"] = real_liq
                 m["_orderbook"] = book
+                # P21: ladder ทั้งสอง token จาก book เดียว — token ตรงข้ามของ binary: ask = 1 - bid
+                m["_depth"] = {m["tokens"][0].get("token_id", ""): book_asks(book),
+                               m["tokens"][1].get("token_id", ""): book_asks(book, complement=True)}
         enriched = top + rest
 
-        log.info(f"[Polymarket] Gamma API: events={len(gamma_markets)} | filtered={len(enriched)} | enriched={len(top)}")
+        log.info(f"[Polymarket] catalog={len(_poly_catalog)} | filtered={len(enriched)}")
         return enriched
 
     except Exception as e:
@@ -1681,10 +3227,39 @@ async def fetch_kalshi_market_detail(session: aiohttp.ClientSession, ticker: str
             "best_bid":      yes_bid,
             "best_ask":      yes_ask,
             "spread":        yes_ask - yes_bid,
+            **await fetch_kalshi_orderbook(session, real_ticker),  # P21: ladder (ว่างถ้าดึงไม่ได้)
         }
     except Exception as e:
         log.debug(f"[Kalshi/detail] {real_ticker}: {e}")
         return {}
+
+
+async def fetch_kalshi_orderbook(session: aiohttp.ClientSession, ticker: str) -> dict:
+    """P21: Kalshi orderbook → ladder ฝั่ง Yes รูปแบบเดียวกับ fetch_poly_market_detail
+    Kalshi ส่งแค่ bids ของ yes/no (cents, qty) — Yes ask = 1 - No bid
+    """
+    try:
+        _st, _data = await _http_get_with_retry(
+            session,
+            f"https://trading-api.kalshi.com/trade-api/v2/markets/{ticker}/orderbook",
+            label=f"Kalshi/book/{ticker}",
+        )
+        if _st != 200 or not isinstance(_data, dict): return {}
+        ob = _data.get("orderbook", _data) or {}
+        yes = [(float(p) / 100, float(q)) for p, q in (ob.get("yes") or [])]
+        no  = [(float(p) / 100, float(q)) for p, q in (ob.get("no") or [])]
+        return {
+            "bids": sorted(yes, reverse=True),
+            "asks": sorted((round(1 - p, 6), q) for p, q in no),
+        }
+    except Exception as e:
+        log.debug(f"[Kalshi/book] {ticker}: {e}")
+        return {}
+
+
+_kalshi_books: dict[str, tuple[float, dict]] = {}  # P21: ticker → (ts, orderbook)
+
+
 async def async_fetch_kalshi(session: aiohttp.ClientSession) -> list[dict]:
     """ดึง Kalshi sports markets — binary prediction markets (US regulated)
     Docs: https://trading-api.kalshi.com/trade-api/v2
@@ -1740,7 +3315,7 @@ async def async_fetch_kalshi(session: aiohttp.ClientSession) -> list[dict]:
                     {"outcome": "Yes", "price": yes_mid, "token_id": f"{mid}_yes"},
                     {"outcome": "No",  "price": no_mid,  "token_id": f"{mid}_no"},
                 ],
-                "_fee_pct":    float(COMMISSION.get("kalshi", Decimal("0.07"))),
+                "_fee_pct":    float(_books.info("kalshi").fee),
                 "_volume_24h": float(m.get("volume_24h", 0) or 0),
                 "_liquidity":  liquidity,
                 "_kalshi":     True,
@@ -1748,7 +3323,24 @@ async def async_fetch_kalshi(session: aiohttp.ClientSession) -> list[dict]:
                 "_ticker":     mid,
             })
 
-        log.info(f"[Kalshi] markets={len(all_markets)} | filtered={len(enriched)}")
+        # P21: orderbook ของ top market ตาม liquidity (cache POLY_BOOK_TTL_SEC) → _depth สำหรับ walk_book
+        top = sorted(enriched, key=lambda x: x["_liquidity"], reverse=True)[:20]
+        now = time.time()
+        need = [m["_ticker"] for m in top
+                if now - _kalshi_books.get(m["_ticker"], (0, {}))[0] >= POLY_BOOK_TTL_SEC]
+        books = await asyncio.gather(*(fetch_kalshi_orderbook(session, t) for t in need),
+                                     return_exceptions=True)
+        for t, book in zip(need, books):
+            _kalshi_books[t] = (now, book if isinstance(book, dict) else {})
+        for m in top:
+            book = _kalshi_books.get(m["_ticker"], (0, {}))[1]
+            if book.get("asks") or book.get("bids"):
+                m["_depth"] = {f"{m['_ticker']}_yes": book_asks(book),
+                               f"{m['_ticker']}_no":  book_asks(book, complement=True)}
+        for t in [t for t, (ts, _) in _kalshi_books.items() if now - ts >= POLY_BOOK_TTL_SEC]:
+            del _kalshi_books[t]
+
+        log.info(f"[Kalshi] markets={len(all_markets)} | filtered={len(enriched)} | books fetched={len(need)}")
         return enriched
 
     except Exception as e:
@@ -1830,6 +3422,7 @@ def _parse_cloudbet_event(ev: dict, sport_key: str) -> Optional[dict]:
             "away_team":  away,
             "commence_time": commence,
             "last_update":   commence,   # C3b fix: ใส่ field นี้เพื่อกัน is_stale()
+            "_cb_id":     str(ev.get("id", "") or ""),  # P23: source id สำหรับ event registry
             "sport_key":  sport_key,
             "bookmakers": [{
                 "key":     "cloudbet",
@@ -1923,6 +3516,7 @@ async def async_fetch_extra_books(session: aiohttp.ClientSession, sport_key: str
             # J2: อัปเดต quota เหมือน main odds
             remaining = int(r.headers.get("x-requests-remaining", api_remaining))
             await update_quota(remaining)
+            _sport_sched.note_call_cost("extra", sport_key, int(r.headers.get("x-requests-last", 1)))  # P18
             if r.status != 200: return []
             data = await r.json(content_type=None)
             if isinstance(data, list):
@@ -1934,80 +3528,187 @@ async def async_fetch_extra_books(session: aiohttp.ClientSession, sport_key: str
         return []
 
 
+# ── P15: Request coalescing (singleflight) ───────────────────────
+# caller หลายตัว (scanner, refetch_valuebet_odds, _refetch_leg, watch_closing_lines) ขอ feed เดียวกัน
+# พร้อมกันได้ — _refetch_cache ช่วยแค่หลัง response แรกกลับมา ระหว่างนั้นทุกตัวยิงเอง = เสีย credit ซ้ำ
+# key = (endpoint, sport, bookmaker set) → ตัวแรกยิงจริง ตัวที่มาทีหลังรอ task เดียวกันแล้วแชร์ผล
+# ผลที่แชร์เป็น object เดียวกัน — caller ห้าม mutate (merge ใช้ copy-on-write ดู _merge_extra_events)
+_inflight: dict[tuple, asyncio.Future] = {}
+
+
+async def singleflight(key: tuple, factory):
+    """P15: รวม request ที่ key เหมือนกันและยัง in-flight ให้เหลือ upstream call เดียว
+    factory: callable ที่คืน coroutine — เรียกเฉพาะเมื่อไม่มี flight ของ key นี้อยู่
+    shield: caller ที่ถูก cancel ไม่ทำให้ caller อื่นที่รอ flight เดียวกันพังตาม
+    """
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(factory())
+        _inflight[key] = fut
+
+        def _done(f: asyncio.Future, _key=key) -> None:
+            if _inflight.get(_key) is f:
+                del _inflight[_key]
+            if not f.cancelled():
+                f.exception()  # mark retrieved — ไม่ให้ asyncio log "exception was never retrieved"
+        fut.add_done_callback(_done)
+    else:
+        log.debug(f"[Singleflight] join in-flight {key[0]}/{key[1]}")
+    return await asyncio.shield(fut)
+
+
 async def _fetch_extra_books_sem(session: aiohttp.ClientSession, sport: str) -> list[dict]:
-    """J2: wrap async_fetch_extra_books ด้วย Semaphore ตัวเดียวกับ main odds"""
-    sem = _ODDS_API_SEM
-    if sem is None:
-        return await async_fetch_extra_books(session, sport)
-    async with sem:
-        return await async_fetch_extra_books(session, sport)
+    """J2: wrap async_fetch_extra_books ด้วย Semaphore ตัวเดียวกับ main odds
+    P15: singleflight อยู่นอก semaphore — caller ที่ join flight ไม่กิน slot
+    """
+    async def _run() -> list[dict]:
+        sem = _ODDS_API_SEM
+        if sem is None:
+            return await async_fetch_extra_books(session, sport)
+        async with sem:
+            return await async_fetch_extra_books(session, sport)
+    return await singleflight(("odds", sport, _EXTRA_ODDS_API_BMS), _run)
 
 _ODDS_API_SEM: Optional[asyncio.Semaphore] = None  # B8: จำกัด concurrent Odds API requests
 
 async def _fetch_odds_sem(session: aiohttp.ClientSession, sport: str) -> list[dict]:
-    """B8: wrap async_fetch_odds ด้วย Semaphore เพื่อไม่ให้ burst เกิน 5 concurrent"""
-    sem = _ODDS_API_SEM
-    if sem is None:
-        return await async_fetch_odds(session, sport)
-    async with sem:
-        return await async_fetch_odds(session, sport)
+    """B8: wrap async_fetch_odds ด้วย Semaphore เพื่อไม่ให้ burst เกิน 5 concurrent
+    P15: coalesce ผ่าน singleflight — key รวม BOOKMAKERS เพราะเป็น param ของ request
+    """
+    async def _run() -> list[dict]:
+        sem = _ODDS_API_SEM
+        if sem is None:
+            return await async_fetch_odds(session, sport)
+        async with sem:
+            return await async_fetch_odds(session, sport)
+    return await singleflight(("odds", sport, BOOKMAKERS), _run)
+
+
+async def _fetch_cloudbet_sf(session: aiohttp.ClientSession, sports: list[str]) -> list[dict]:
+    """P15: async_fetch_cloudbet ผ่าน singleflight — refetch/CLV ของ sport เดียวกันใช้ call เดียว"""
+    return await singleflight(("cloudbet", ",".join(sports), "cloudbet"),
+                              lambda: async_fetch_cloudbet(session, sports))
+
 
 def _merge_extra_events(odds_by_sport: dict, extra_events_by_sport: dict[str, list]) -> None:
-    """Q4/C4: merge extra/native bookmaker events into odds_by_sport by fuzzy name match"""
+    """Q4/C4: merge extra/native bookmaker events into odds_by_sport
+    P23: จับคู่ด้วย canonical id จาก _event_registry — dict hit แทน fuzzy ไล่ทุกคู่
+    """
     for s, extra_events in extra_events_by_sport.items():
         if not extra_events: continue
-        std_events = odds_by_sport.get(s, [])
+        # P15: list/event จาก singleflight แชร์กับ caller อื่น — copy ก่อนแก้ (copy-on-write)
+        std_events = list(odds_by_sport.get(s, []))
+        pos = {_event_registry.event_id(s, ev): i for i, ev in enumerate(std_events)}
         for ev in extra_events:
-            ev_name = f"{ev.get('home_team','')} vs {ev.get('away_team','')}"
-            merged = False
-            for std_ev in std_events:
-                std_name = f"{std_ev.get('home_team','')} vs {std_ev.get('away_team','')}"
-                if fuzzy_match(ev_name, std_name, 0.80):
-                    existing_bms = {bm["key"] for bm in std_ev.get("bookmakers", [])}
-                    for bm in ev.get("bookmakers", []):
-                        if bm["key"] not in existing_bms:
-                            std_ev.setdefault("bookmakers", []).append(bm)
-                    merged = True
-                    break
-            if not merged:
+            cid = _event_registry.event_id(s, ev)
+            i = pos.get(cid)
+            if i is None:
+                pos[cid] = len(std_events)
                 std_events.append(ev)
+                continue
+            std_ev = std_events[i]
+            existing_bms = {bm["key"] for bm in std_ev.get("bookmakers", [])}
+            new_bms = [bm for bm in ev.get("bookmakers", []) if bm["key"] not in existing_bms]
+            if new_bms:
+                std_events[i] = {**std_ev, "bookmakers": [*std_ev.get("bookmakers", []), *new_bms]}
         odds_by_sport[s] = std_events
 
 
-async def fetch_all_async(sports: list[str]) -> tuple[dict, list]:
-    # F5: _ODDS_API_SEM สร้างใน post_init() แล้ว — lazy-init ออก
-    async with aiohttp.ClientSession() as session:
-        n = len(sports)
-        results = await asyncio.gather(
-            *[_fetch_odds_sem(session, s) for s in sports],
-            async_fetch_polymarket(session),
-            async_fetch_kalshi(session),
+async def _fetch_alt_markets(session: aiohttp.ClientSession) -> list[dict]:
+    """Combine Polymarket + Kalshi into single alt-markets list
+    P7: คืนเป็น AltMarketIndex — index สร้างครั้งเดียวต่อ scan แล้วแชร์ให้ทุก sport
+    """
+    poly_markets, kalshi_markets = await asyncio.gather(
+        async_fetch_polymarket(session),
+        async_fetch_kalshi(session),
+    )
+    return AltMarketIndex(list(poly_markets) + list(kalshi_markets))
+
+
+async def stream_fetch_async(sports: list[str]):
+    """P6: async generator — yield (sport, events, alt_markets, final) ทันทีที่ sport นั้นพร้อม
+    ไม่รอ feed ที่ช้าที่สุดเหมือน gather เดิม → detect-to-alert latency ตาม feed ที่เร็วที่สุด
+    Polymarket+Kalshi และ Cloudbet (1 call ครอบทุก sport) เป็น shared future ที่ทุก sport ใช้ร่วมกัน
+    Odds API ของ sport มาก่อน shared future → yield (sport, events, [], False) ทันที — ใช้หา arb ระหว่าง book เท่านั้น
+    แล้ว yield sport เดิมอีกครั้ง final=True พร้อม Cloudbet + alt markets เมื่อ shared future มาถึง
+    ทุก sport ที่ fetch สำเร็จได้ final=True ครั้งเดียวเสมอ; shared future เสร็จก่อน → yield ครั้งเดียวแบบเดิม
+    """
+    session = get_http_session()
+    alt_fut = asyncio.ensure_future(_fetch_alt_markets(session))
+    # C4: Cloudbet native API — 1 call per unique cb_sport (ไม่ซ้ำตาม league)
+    cb_fut  = asyncio.ensure_future(_fetch_cloudbet_sf(session, sports))
+    shared  = asyncio.ensure_future(asyncio.gather(cb_fut, alt_fut, return_exceptions=True))
+
+    async def _odds_ready(s: str) -> tuple[str, list]:
+        # F5: _ODDS_API_SEM สร้างใน post_init() แล้ว — lazy-init ออก
+        if _EXTRA_ODDS_API_BMS:
             # J2: Odds API extra books (stake) — C10: กรอง cloudbet ออก เพราะใช้ native API แล้ว
-            *([_fetch_extra_books_sem(session, s) for s in sports] if _EXTRA_ODDS_API_BMS else []),
-            # C4: Cloudbet native API — 1 call per unique cb_sport (ไม่ซ้ำตาม league)
-            async_fetch_cloudbet(session, sports),
-        )
-    odds_by_sport = {s: results[i] for i, s in enumerate(sports)}
-    poly_markets   = results[n]       # Polymarket
-    kalshi_markets = results[n + 1]   # Kalshi
-    n_extra = len(sports) if _EXTRA_ODDS_API_BMS else 0
-    cloudbet_events: list[dict] = results[n + 2 + n_extra]  # C4: native Cloudbet
-
-    # Q4: Merge Odds-API extra books (stake only — cloudbet via native)
-    if _EXTRA_ODDS_API_BMS:
-        extra_by_sport = {sports[i]: results[n + 2 + i] for i in range(len(sports))}
-        _merge_extra_events(odds_by_sport, extra_by_sport)
-
-    # C4: Merge native Cloudbet events
-    if cloudbet_events:
-        cb_by_sport: dict[str, list] = {}
-        for ev in cloudbet_events:
-            sk = ev.get("sport_key", sports[0])
-            cb_by_sport.setdefault(sk, []).append(ev)
-        _merge_extra_events(odds_by_sport, cb_by_sport)
-
-    # Combine Polymarket + Kalshi into single alt-markets list
-    all_alt_markets = list(poly_markets) + list(kalshi_markets)
+            std_ev, extra_ev = await asyncio.gather(
+                _fetch_odds_sem(session, s), _fetch_extra_books_sem(session, s),
+            )
+        else:
+            std_ev, extra_ev = await _fetch_odds_sem(session, s), []
+        by_sport = {s: std_ev}
+        # Q4: Merge Odds-API extra books (stake only — cloudbet via native)
+        if extra_ev:
+            _merge_extra_events(by_sport, {s: extra_ev})
+        return s, by_sport[s]
+
+    def _with_shared(s: str, events: list, cloudbet_events: list, alt: list) -> tuple[str, list, list]:
+        by_sport = {s: events}  # merge เป็น copy-on-write — events ที่ yield ไปแล้วไม่ถูกแก้
+        cb_events = [ev for ev in cloudbet_events if ev.get("sport_key", sports[0]) == s]
+        if cb_events:
+            _merge_extra_events(by_sport, {s: cb_events})
+        return s, by_sport[s], alt
+
+    tasks = [asyncio.ensure_future(_odds_ready(s)) for s in sports]
+    waiting: dict[str, list] = {}            # sport ที่ yield แบบ Odds API อย่างเดียวไปแล้ว — รอ shared
+    shared_res: Optional[tuple[list, list]] = None
+    todo = {*tasks, shared}
+    try:
+        while todo:
+            done, todo = await asyncio.wait(todo, return_when=asyncio.FIRST_COMPLETED)
+            if shared in done:
+                cb_res, alt_res = shared.result()
+                if isinstance(cb_res, BaseException):
+                    log.error(f"[Stream] Cloudbet fetch failed: {cb_res!r}")
+                    cb_res = []
+                if isinstance(alt_res, BaseException):
+                    log.error(f"[Stream] alt markets fetch failed: {alt_res!r}")
+                    alt_res = []
+                shared_res = (cb_res, alt_res)
+            for fut in done:
+                if fut is shared:
+                    continue
+                try:
+                    s, events = fut.result()
+                except Exception as e:
+                    log.error(f"[Stream] sport fetch failed: {e}", exc_info=True)
+                    continue
+                if shared_res is None:
+                    waiting[s] = events
+                    yield s, events, [], False
+                else:
+                    yield (*_with_shared(s, events, *shared_res), True)
+            if shared_res is not None and waiting:
+                for s, events in waiting.items():
+                    yield (*_with_shared(s, events, *shared_res), True)
+                waiting.clear()
+    finally:
+        for t in (*tasks, shared, alt_fut, cb_fut):
+            if not t.done():
+                t.cancel()
+
+
+async def fetch_all_async(sports: list[str]) -> tuple[dict, list]:
+    """รวมผลจาก stream_fetch_async เป็น (odds_by_sport, alt_markets) แบบเดิม — สำหรับ caller ที่ต้องการทั้งชุด"""
+    got: dict[str, list] = {}
+    all_alt_markets: list = []
+    async for sport, events, alt, final in stream_fetch_async(sports):
+        if final:  # yield ก่อนหน้า (Odds API อย่างเดียว) ถูกแทนด้วยชุดที่รวม Cloudbet แล้ว
+            got[sport] = events
+            all_alt_markets = alt
+    odds_by_sport = {s: got.get(s, []) for s in sports}
     return odds_by_sport, all_alt_markets
 
 
@@ -2015,8 +3716,7 @@ async def fetch_all_async(sports: list[str]) -> tuple[dict, list]:
 #  SLIPPAGE + ARB
 # ══════════════════════════════════════════════════════════════════
 def apply_slippage(odds: Decimal, bm: str) -> Decimal:
-    com = next((v for k,v in COMMISSION.items() if k in bm.lower()), Decimal("0"))
-    return (odds * (Decimal("1") - com)).quantize(Decimal("0.001"))
+    return (odds * _books.info(bm).fee_mult).quantize(Decimal("0.001"))  # P29
 
 def calc_arb(odds_a: Decimal, odds_b: Decimal):
     inv_a, inv_b = Decimal("1")/odds_a, Decimal("1")/odds_b
@@ -2176,8 +3876,7 @@ def calc_valuebet_kelly(true_odds: float, soft_odds: float, grade: str) -> tuple
 
 def apply_vb_book_cap(stake_thb: Decimal, bookmaker: str) -> Decimal:
     """G5: apply per-bookmaker max stake cap สำหรับ Value Bet (stake เป็น THB)"""
-    bm  = bookmaker.lower()
-    cap = next((v for k, v in MAX_STAKE_MAP.items() if k in bm), Decimal("0"))
+    cap = _books.info(bookmaker).cap_thb  # P29
     if cap > 0 and stake_thb > cap:
         log.debug(f"[VB-BookCap] {bookmaker}: ฿{int(stake_thb):,} → capped ฿{int(cap):,}")
         return cap
@@ -2186,8 +3885,7 @@ def apply_vb_book_cap(stake_thb: Decimal, bookmaker: str) -> Decimal:
 
 def apply_max_stake(stake: Decimal, bookmaker: str) -> Decimal:
     """5. จำกัด stake ตาม MAX_STAKE ของแต่ละเว็บ"""
-    bm  = bookmaker.lower()
-    cap = next((v for k,v in MAX_STAKE_MAP.items() if k in bm), Decimal("0"))
+    cap = _books.info(bookmaker).cap_thb  # P29
     if cap > 0:
         stake_thb = stake * USD_TO_THB
         if stake_thb > cap:
@@ -2195,29 +3893,181 @@ def apply_max_stake(stake: Decimal, bookmaker: str) -> Decimal:
     return stake
 
 
+# ── Executable price (order-book walk) ───────────────────────────
+# P21: เดิม find_polymarket/find_draw_market ลด odds ด้วย impact_adj heuristic (MIN_KELLY_STAKE / _liquidity)
+# arb ที่ top-of-book ดูดีแต่ book บางหายไปตอน size จริง → เสีย refetch + เวลา operator
+# ตอนนี้: ladder เต็มต่อ token → VWAP ที่ stake จริงของ leg (scan_all หลัง Kelly, execute_both, quote refresher)
+BOOK_MIN_FILL = float(_d("BOOK_MIN_FILL", "0.5"))  # book fill ได้ < สัดส่วนนี้ของ total ที่ Kelly ต้องการ → ทิ้ง arb
+
+
+def book_asks(book: dict, complement: bool = False) -> list[tuple[float, float]]:
+    """ask ladder [(price, size)] ถูก→แพง — complement=True คือฝั่งตรงข้ามของ binary (ask = 1 - bid)"""
+    if complement:
+        return [(round(1 - p, 6), sz) for p, sz in book.get("bids", ()) if 0 < p < 1]
+    return list(book.get("asks", ()))
+
+
+def walk_book(asks: list[tuple[float, float]], stake_usd: float) -> tuple[float, float]:
+    """ซื้อไล่ ladder ด้วย stake_usd → (vwap, filled_usd) — vwap=0 ถ้า book ว่าง"""
+    spent = shares = 0.0
+    for price, size in asks:
+        if price <= 0 or size <= 0: continue
+        take = min(size, (stake_usd - spent) / price)
+        spent  += take * price
+        shares += take
+        if spent >= stake_usd * 0.9999: break
+    return (spent / shares if shares else 0.0), spent
+
+
+def exec_odds(asks: list[tuple[float, float]], stake_usd: float,
+              fee_pct: float) -> Optional[tuple[Decimal, Decimal, float]]:
+    """(odds_raw, odds_eff, fill_ratio) ที่ stake นี้ — None ถ้า book ว่าง/ราคาไม่สมเหตุผล"""
+    vwap, filled = walk_book(asks, stake_usd)
+    if vwap <= 0.01: return None
+    odds_raw = (Decimal("1") / Decimal(str(vwap))).quantize(Decimal("0.001"))
+    odds_eff = (odds_raw * (Decimal("1") - Decimal(str(fee_pct)))).quantize(Decimal("0.001"))
+    return odds_raw, odds_eff, (filled / stake_usd if stake_usd > 0 else 1.0)
+
+
+def _has_depth(*legs: Optional[OddsLine]) -> bool:
+    return any(l is not None and l.raw and l.raw.get("depth") for l in legs)
+
+
+def depth_reprice(legs: list[OddsLine], stakes: list[Decimal]
+                  ) -> Optional[tuple[list[OddsLine], list[Decimal], Decimal]]:
+    """P21: reprice leg ที่มี ladder ด้วย VWAP ที่ stake จริง แล้วแบ่ง stake ใหม่ (equal payout)
+    book ไม่ลึกพอ/ชน cap → ลด total; คืน None ถ้า fill ได้ < BOOK_MIN_FILL ของ total เดิม
+    Returns: (legs, stakes, profit) — leg ที่ไม่มี depth คงราคาเดิม
+    """
+    orig_total = total = sum(stakes)
+    if orig_total <= 0: return None
+    cur, priced = list(stakes), list(legs)
+    for _ in range(4):
+        shrink = Decimal("1")
+        priced = []
+        for leg, st in zip(legs, cur):
+            depth = leg.raw.get("depth") if leg.raw else None
+            if not depth or st <= 0:
+                priced.append(leg)
+                continue
+            q = exec_odds(depth, float(st), leg.raw.get("fee_pct", 0))
+            if q is None: return None
+            odds_raw, odds_eff, fill = q
+            if odds_eff <= 1: return None
+            shrink = min(shrink, Decimal(str(fill)))
+            priced.append(replace(leg, odds=odds_eff, odds_raw=odds_raw))
+        if shrink < Decimal("0.999"):
+            total = (total * shrink).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+        margin = sum(Decimal("1") / l.odds for l in priced)
+        new = [(total / l.odds / margin).quantize(Decimal("0.01"), rounding=ROUND_DOWN) for l in priced]
+        # per-book cap ยังต้องถือ — stake อาจย้ายระหว่าง leg หลัง reprice
+        cap = min((apply_max_stake(n, l.bookmaker) / n for l, n in zip(priced, new) if n > 0), default=Decimal("1"))
+        if cap < 1:
+            total = (total * cap).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+            new = [(n * cap).quantize(Decimal("0.01"), rounding=ROUND_DOWN) for n in new]
+        settled = shrink >= Decimal("0.999") and all(abs(n - c) <= c * Decimal("0.01") for n, c in zip(new, cur))
+        cur = new
+        if settled: break
+    if total < orig_total * Decimal(str(BOOK_MIN_FILL)):
+        return None
+    tt = sum(cur)
+    if tt <= 0: return None
+    profit = (min(st * l.odds for st, l in zip(cur, priced)) - tt) / tt
+    return priced, cur, profit
+
+
 # ══════════════════════════════════════════════════════════════════
 #  SCAN
 # ══════════════════════════════════════════════════════════════════
-def is_stale(commence_time: str, last_update: str = "") -> bool:
+# ── P28: Parsed event model ──────────────────────────────────────
+# เดิม: detect_line_movements / prescreen / scan_all / CLV / refetch เดิน JSON dict ชุดเดียวกันซ้ำ
+#   ทุกรอบ Decimal(str(price)) ใหม่, is_stale fromisoformat ซ้ำทุก outcome, สร้าง "home vs away" ซ้ำ
+# ตอนนี้: parse_event() แปลง event ครั้งเดียว → ParsedEvent (__slots__) เก็บใน event["_parsed"]
+#   (แบบเดียวกับ market["_prop"]) — feed ที่ cache/singleflight แชร์กันจึง parse ครั้งเดียวต่อ fetch
+#   event ที่ merge แล้ว (bookmakers list ใหม่) ถูก parse ใหม่อัตโนมัติ
+def _iso_utc(raw: str) -> Optional[datetime]:
+    """ISO → aware datetime — None ถ้าว่าง/parse ไม่ได้/ไม่มี tz (เท่ากับ is_stale เดิมที่ข้ามไป)"""
+    if not raw:
+        return None
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except Exception:
+        return None
+    return dt if dt.tzinfo else None
+
+
+class Quote:
+    """P28: h2h outcome เดียวของ bookmaker เดียว — price parse แล้วทั้ง float และ Decimal"""
+    __slots__ = ("bm_key", "bm_title", "bm", "name", "name_lc", "price", "odds", "last_update", "updated")
+
+    def __init__(self, bm_key: str, bm_title: str, name: str, raw_price, last_update: str):
+        self.bm_key      = bm_key
+        self.bm_title    = bm_title
+        self.bm          = _books.id(bm_key)  # P29
+        self.name        = name
+        self.name_lc     = name.lower()
+        self.price       = float(raw_price)
+        self.odds        = Decimal(str(raw_price))
+        self.last_update = last_update
+        self.updated     = _iso_utc(last_update)
+
+
+class ParsedEvent:
+    """P28: event จาก feed (Odds API / Cloudbet / extra) ที่ normalize แล้ว — อ่านอย่างเดียว"""
+    __slots__ = ("id", "home", "away", "name", "commence", "commence_dt", "bm_keys", "quotes", "_src")
+
+    def __init__(self, event: dict):
+        self.id          = event.get("id", "")
+        self.home        = event.get("home_team", "")
+        self.away        = event.get("away_team", "")
+        self.name        = f"{self.home} vs {self.away}"
+        self.commence    = event.get("commence_time", "")
+        self.commence_dt = _iso_utc(self.commence)
+        self._src        = event.get("bookmakers")
+        quotes: list[Quote] = []
+        keys: list[str] = []
+        for bm in self._src or ():
+            bk = bm.get("key", "")
+            keys.append(bk)
+            for mkt in bm.get("markets", []):
+                if mkt.get("key") != "h2h": continue
+                lu = mkt.get("last_update", "")
+                for out in mkt.get("outcomes", []):
+                    try:
+                        quotes.append(Quote(bk, bm.get("title", bk), out.get("name", ""), out.get("price"), lu))
+                    except (TypeError, ValueError, ArithmeticError):
+                        continue  # ไม่มี price / price เสีย — ข้าม outcome นี้
+        self.bm_keys = tuple(keys)
+        self.quotes  = tuple(quotes)
+
+
+def parse_event(event: dict) -> ParsedEvent:
+    """ParsedEvent ของ event — cache ใน event["_parsed"]; bookmakers list เปลี่ยน (merge) → parse ใหม่"""
+    pe = event.get("_parsed")
+    if pe is None or pe._src is not event.get("bookmakers"):
+        pe = event["_parsed"] = ParsedEvent(event)
+    return pe
+
+
+def is_stale(commence_time: str, last_update: str = "", book_token: str = "") -> bool:
     """1. เช็ค odds staleness
     - แมตช์เริ่มไปแล้วเกิน 3 ชั่วโมง → stale
     - last_update ของ odds เก่าเกิน MAX_ODDS_AGE_MIN นาที → stale
+    - P22: book_token ที่ BookStream subscribe ไว้ แต่ mirror stale (stream ตาย) → stale
     """
+    return stale_at(_iso_utc(commence_time), _iso_utc(last_update), book_token)
+
+
+def stale_at(commence_dt: Optional[datetime], updated: Optional[datetime] = None, book_token: str = "") -> bool:
+    """P28: is_stale บน datetime ที่ parse แล้ว (ParsedEvent.commence_dt / Quote.updated)"""
+    if book_token and _book_stream.tracks(book_token) and _book_stream.is_stale(book_token):
+        return True
     now = datetime.now(timezone.utc)
-    try:
-        ct = datetime.fromisoformat(commence_time.replace("Z","+00:00"))
-        if ct < now - timedelta(hours=3):
-            return True
-    except Exception:
-        pass
+    if commence_dt is not None and commence_dt < now - timedelta(hours=3):
+        return True
     # ตรวจ odds age จาก last_update (OddsAPI ส่งมาใน market/outcome)
-    if last_update:
-        try:
-            lu = datetime.fromisoformat(last_update.replace("Z","+00:00"))
-            if (now - lu).total_seconds() > MAX_ODDS_AGE_MIN * 60:
-                return True
-        except Exception:
-            pass
+    if updated is not None and (now - updated).total_seconds() > MAX_ODDS_AGE_MIN * 60:
+        return True
     return False
 
 def is_valid_odds(odds: Decimal) -> bool:
@@ -2240,6 +4090,173 @@ def is_on_cooldown(event: str, bm1: str, bm2: str, market_type: str = "2way", bm
         return True
     return False
 
+# ── Alt-market token index ─────────────────────────────────────────
+ALT_MATCH_THRESHOLD = 0.3                                  # fuzzy ทีม ↔ question ของ find_polymarket/find_draw_market
+ALT_MATRIX_CELLS    = _i("ALT_MATRIX_CELLS", 4_000_000)    # P26: ขนาด chunk (แถว×market) ของ prematch — คุม RAM
+def _match_keys(text: str) -> set[str]:
+    """P7: index keys ที่ fuzzy_match ต้องใช้ร่วมกันถึงจะ match ได้
+    — ทุก token (รวม stopwords) + prefix 5 ตัวแรกของทั้ง string (กฎ na[:5]==nb[:5])
+    """
+    n = _team_matcher.canon(text)
+    keys = set(n.split())
+    if len(n) >= 5:
+        keys.add("^" + n[:5])
+    return keys
+
+
+class AltMarketIndex(list):
+    """P7: list ของ Polymarket/Kalshi markets + inverted index token → market positions
+    สร้างครั้งเดียวต่อ scan — find_polymarket/find_draw_market จะ fuzzy_match เฉพาะ market
+    ที่มี token ร่วมกับทั้งสองทีม แทนการวนทุก market ต่อทุก event
+    ยังเป็น list ปกติ — code เดิมที่ iterate/len/concat ใช้ได้เหมือนเดิม
+    """
+    def __init__(self, markets=()):
+        super().__init__(markets)
+        self._postings: dict[str, list[int]] = defaultdict(list)
+        # กฎ substring ของ fuzzy_match (na in nb / nb in na) ไม่ต้องมี token ร่วม — "gladbach" อยู่กลางคำ
+        # "monchengladbach" — index แยก: trigram ของ canonical question + canonical เต็ม → positions
+        self._canon: list[str] = []
+        self._grams: dict[str, list[int]] = defaultdict(list)
+        self._by_canon: dict[str, list[int]] = defaultdict(list)
+        for pos, m in enumerate(self):
+            q = m.get("question", "")
+            for k in _match_keys(q):
+                self._postings[k].append(pos)
+            c = _team_matcher.canon(q)
+            self._canon.append(c)
+            self._by_canon[c].append(pos)
+            for g in {c[i:i + 3] for i in range(len(c) - 2)}:
+                self._grams[g].append(pos)
+        self._pairs: dict[tuple[str, str], list[tuple]] = {}  # P26: (ta, tb) → [(pos, sure_a, sure_b)]
+        self._subs: dict[str, set[int]] = {}                  # canonical ทีม → positions ที่ผ่านกฎ substring
+        self._canon_lens = sorted({len(c) for c in self._by_canon if c})
+        self._csr = None
+
+    def _substr_positions(self, team: str) -> set[int]:
+        """markets ที่ canonical ทีมอยู่ใน question หรือ question อยู่ในชื่อทีม — ตรงกฎ substring ของ fuzzy_match"""
+        na = _team_matcher.canon(team)
+        hit = self._subs.get(na)
+        if hit is None:
+            grams = {na[i:i + 3] for i in range(len(na) - 2)}
+            # na ยาว ≥3 → question ที่มี na ต้องมีทุก trigram ของ na — ไล่เฉพาะ posting ที่สั้นสุด
+            pool = min((self._grams.get(g, ()) for g in grams), key=len) if grams else range(len(self) if na else 0)
+            hit = {p for p in pool if na in self._canon[p]}
+            # question สั้นกว่าชื่อทีม (ไม่บ่อย) — ไล่ substring ของ na เฉพาะความยาวที่มี question จริง
+            for w in self._canon_lens:
+                if w > len(na):
+                    break
+                for i in range(len(na) - w + 1):
+                    hit.update(self._by_canon.get(na[i:i + w], ()))
+            self._subs[na] = hit
+        return hit
+
+    def _positions(self, team: str) -> set[int]:
+        out = set(self._substr_positions(team))
+        for k in _match_keys(team):
+            out.update(self._postings.get(k, ()))
+        return out
+
+    def _pair(self, ta: str, tb: str) -> list[tuple]:
+        """(position, sure_a, sure_b) — sure: True = Jaccard ผ่าน, False = Jaccard ไม่ผ่าน, None = ยังไม่รู้"""
+        hit = self._pairs.get((ta, tb))
+        if hit is None:
+            hit = self._pairs[(ta, tb)] = [(p, None, None)
+                                           for p in sorted(self._positions(ta) & self._positions(tb))]
+        return hit
+
+    @staticmethod
+    def _hit(team: str, question: str, sure) -> bool:
+        if sure is None:
+            return fuzzy_match(team, question, ALT_MATCH_THRESHOLD)
+        return sure or _team_matcher.match_below(team, question)
+
+    def candidates(self, ta: str, tb: str) -> list[dict]:
+        """markets ที่อาจ match ทั้ง ta และ tb — คงลำดับเดิม (tie-break score เหมือน linear scan)"""
+        return [self[p] for p, _, _ in self._pair(ta, tb)]
+
+    def matches(self, ta: str, tb: str) -> list[dict]:
+        """markets ที่ fuzzy_match(ta/tb, question, ALT_MATCH_THRESHOLD) ผ่านทั้งคู่ — ผลเหมือน linear scan"""
+        out = []
+        for p, sa, sb in self._pair(ta, tb):
+            q = self[p].get("question", "")
+            if self._hit(ta, q, sa) and self._hit(tb, q, sb):
+                out.append(self[p])
+        return out
+
+    def _build_csr(self):
+        vocab = list(self._postings)
+        lens = _np.fromiter((len(self._postings[k]) for k in vocab), dtype=_np.int64, count=len(vocab))
+        indptr = _np.zeros(len(vocab) + 1, dtype=_np.int64)
+        _np.cumsum(lens, out=indptr[1:])
+        indices = _np.fromiter((p for k in vocab for p in self._postings[k]), dtype=_np.int64, count=int(indptr[-1]))
+        # column ที่นับใน Jaccard = token ที่ไม่ใช่ stopword และไม่ใช่ prefix key
+        is_tok = _np.array([not k.startswith("^") and k not in _FUZZY_STOPWORDS for k in vocab], dtype=_np.float64)
+        qlen = _np.array([len(_team_matcher.profile(m.get("question", ""))[1]) for m in self], dtype=_np.float64)
+        self._csr = ({k: i for i, k in enumerate(vocab)}, indptr, indices, is_tok, qlen)
+
+    def prematch(self, pairs) -> int:
+        """P26: candidate + Jaccard ของทุก (ta, tb) คำนวณพร้อมกัน — sparse token product ด้วย NumPy
+        rows = ทีม (2 แถวต่อ pair), cols = market: shared key → candidate, Jaccard ≥ threshold → sure
+        ไม่มี numpy → คำนวณทีละ pair ตอนเรียก candidates()/matches() เหมือนเดิม
+        """
+        todo = [p for p in dict.fromkeys(pairs) if p not in self._pairs]
+        if _np is None or not todo or not self:
+            return 0
+        if self._csr is None:
+            self._build_csr()
+        vocab, indptr, indices, is_tok, qlen = self._csr
+        n = len(self)
+        step = max(1, ALT_MATRIX_CELLS // (2 * n))
+        for i in range(0, len(todo), step):
+            chunk = todo[i:i + step]
+            rows, cols, tlen = [], [], []
+            for r, team in enumerate(t for pair in chunk for t in pair):
+                tlen.append(len(_team_matcher.profile(team)[1]))
+                for k in _match_keys(team):
+                    c = vocab.get(k)
+                    if c is not None:
+                        rows.append(r); cols.append(c)
+            nrow = 2 * len(chunk)
+            shared = _np.zeros(nrow * n, dtype=bool)
+            inter  = _np.zeros(nrow * n, dtype=_np.float64)
+            if cols:
+                c = _np.asarray(cols, dtype=_np.int64)
+                lens = indptr[c + 1] - indptr[c]
+                gather = _np.repeat(indptr[c] - (_np.cumsum(lens) - lens), lens) + _np.arange(int(lens.sum()))
+                flat = _np.repeat(_np.asarray(rows, dtype=_np.int64) * n, lens) + indices[gather]
+                shared = _np.bincount(flat, minlength=nrow * n) > 0
+                inter  = _np.bincount(flat, weights=_np.repeat(is_tok[c], lens), minlength=nrow * n)
+            shared = shared.reshape(nrow, n)
+            inter  = inter.reshape(nrow, n)
+            for r, team in enumerate(t for pair in chunk for t in pair):
+                sub = self._substr_positions(team)
+                if sub:
+                    shared[r, list(sub)] = True
+            ta = _np.asarray(tlen, dtype=_np.float64)[:, None]
+            with _np.errstate(divide="ignore", invalid="ignore"):
+                sure = (inter > 0) & (inter / (ta + qlen[None, :] - inter) >= ALT_MATCH_THRESHOLD)
+            both = shared[0::2] & shared[1::2]
+            pi, pos = _np.nonzero(both)
+            sa = sure[2 * pi, pos].tolist()
+            sb = sure[2 * pi + 1, pos].tolist()
+            bounds = _np.cumsum(both.sum(axis=1)).tolist()
+            pos = pos.tolist()
+            lo = 0
+            for pair, hi in zip(chunk, bounds):
+                self._pairs[pair] = list(zip(pos[lo:hi], sa[lo:hi], sb[lo:hi]))
+                lo = hi
+        return len(todo)
+
+
+def _alt_matches(alt_markets: list, ta: str, tb: str) -> list:
+    """markets ที่พูดถึงทั้ง ta และ tb (fuzzy ≥ ALT_MATCH_THRESHOLD) — P26: index ใช้ผล prematch ถ้ามี"""
+    if isinstance(alt_markets, AltMarketIndex):
+        return alt_markets.matches(ta, tb)
+    return [m for m in alt_markets
+            if fuzzy_match(ta, m.get("question", ""), ALT_MATCH_THRESHOLD)
+            and fuzzy_match(tb, m.get("question", ""), ALT_MATCH_THRESHOLD)]
+
+
 def find_draw_market(event_name: str, alt_markets: list) -> Optional[dict]:
     """ค้นหา Draw/X market บน Polymarket หรือ Kalshi สำหรับ soccer 3-way
     ค้นหา market ที่พูดถึง Draw หรือ X ของ event นี้
@@ -2252,20 +4269,17 @@ def find_draw_market(event_name: str, alt_markets: list) -> Optional[dict]:
     DRAW_KEYWORDS = ("draw", " x ", "tie", "no winner", "drawn")
 
     best, best_score = None, 0
-    for m in alt_markets:
+    for m in _alt_matches(alt_markets, ta, tb):  # P7/P26: พูดถึงทั้งสองทีมแล้ว
         tokens = m.get("tokens", [])
         if len(tokens) < 2: continue
         liquidity = m.get("_liquidity", 0)
         if liquidity < POLY_MIN_DRAW_LIQUIDITY: continue
 
         title = m.get("question", "").lower()
-        # ต้องพูดถึงทีมทั้งสอง + คำว่า draw/x/tie
-        has_ta  = fuzzy_match(ta, title, 0.3)
-        has_tb  = fuzzy_match(tb, title, 0.3)
-        has_draw = any(kw in title for kw in DRAW_KEYWORDS)
-        if not (has_ta and has_tb and has_draw): continue
+        # ต้องมีคำว่า draw/x/tie ด้วย
+        if not any(kw in title for kw in DRAW_KEYWORDS): continue
 
-        score = (1 if has_ta else 0) + (1 if has_tb else 0) + min(3, liquidity / 10000)
+        score = 2 + min(3, liquidity / 10000)
         if score > best_score:
             best_score, best = score, m
 
@@ -2290,8 +4304,13 @@ def find_draw_market(event_name: str, alt_markets: list) -> Optional[dict]:
     impact_ratio = min(est_stake_usd / liq_usd, 0.10) if liq_usd > 0 else 0.05
     impact_adj = Decimal(str(1 - impact_ratio * 0.5))
 
-    odds_raw = (Decimal("1") / pa).quantize(Decimal("0.001"))
-    odds_eff = (odds_raw * (Decimal("1") - fee_pct) * impact_adj).quantize(Decimal("0.001"))
+    depth, live = _alt_depth(best, yes_token.get("token_id", ""))  # P21/P22
+    q = exec_odds(depth, est_stake_usd, float(fee_pct)) if depth else None
+    if q:
+        odds_raw, odds_eff = q[0], q[1]
+    else:
+        odds_raw = (Decimal("1") / pa).quantize(Decimal("0.001"))
+        odds_eff = (odds_raw * (Decimal("1") - fee_pct) * impact_adj).quantize(Decimal("0.001"))
 
     is_kalshi = best.get("_kalshi", False)
     slug = best.get("slug", "")
@@ -2311,7 +4330,10 @@ def find_draw_market(event_name: str, alt_markets: list) -> Optional[dict]:
         "outcome":    "Draw",
         "odds_raw":   odds_raw,
         "odds":       odds_eff,
+        "market_id":  best.get("_ticker", slug) if is_kalshi else slug,  # P23: source id ของ registry
         "token_id":   yes_token.get("token_id", ""),
+        "depth":      depth,
+        "stream":     live,
     }
 
 
@@ -2321,7 +4343,7 @@ def find_polymarket(event_name: str, poly_markets: list) -> Optional[dict]:
     ta, tb = parts[0], parts[1]
     best, best_score = None, 0
 
-    for m in poly_markets:
+    for m in _alt_matches(poly_markets, ta, tb):  # P7/P26: พูดถึงทั้งสองทีมแล้ว
         tokens = m.get("tokens",[])
         if len(tokens) < 2: continue
 
@@ -2331,13 +4353,12 @@ def find_polymarket(event_name: str, poly_markets: list) -> Optional[dict]:
             continue
 
         title = m.get("question","")
-        if fuzzy_match(ta, title, 0.3) and fuzzy_match(tb, title, 0.3):
-            # Score = keyword match + liquidity bonus
-            kw_score = sum(1 for t in (normalize_team(ta).split()+normalize_team(tb).split()) if t in title.lower())
-            liq_bonus = min(3, liquidity / 10000)  # liquidity สูง = score สูงกว่า
-            score = kw_score + liq_bonus
-            if score > best_score:
-                best_score, best = score, m
+        # Score = keyword match + liquidity bonus
+        kw_score = sum(1 for t in (normalize_team(ta).split()+normalize_team(tb).split()) if t in title.lower())
+        liq_bonus = min(3, liquidity / 10000)  # liquidity สูง = score สูงกว่า
+        score = kw_score + liq_bonus
+        if score > best_score:
+            best_score, best = score, m
 
     if not best: return None
 
@@ -2367,26 +4388,15 @@ def find_polymarket(event_name: str, poly_markets: list) -> Optional[dict]:
         if not (ta_in_q and tb_in_q):
             log.debug(f"[PolyYesNo] skip — can't parse both teams from question: {best.get('question','')[:60]}")
             return None
-        # E2: allowlist approach — only accept clear outright winner propositions
-        # blocklist is incomplete; allowlist is safer
-        _non_h2h_terms = (
-            "cover", "spread", "handicap", "over", "under", "total",
-            "advance", "qualify", "series", "map ", "set ", "quarter",
-            "period", "first half", "game 1", "game 2", "lift the trophy",
-        )
-        if any(x in q_lower for x in _non_h2h_terms):
+        # E2/H5: proposition parse (non-H2H blocklist + Yes subject) — P20: cache ใน catalog market
+        _prop = best.get("_prop") or _poly_proposition(question)
+        if _prop["non_h2h"]:
             log.debug(f"[PolyYesNo] skip non-H2H proposition: {best.get('question','')[:60]}")
             return None
-        # H5: parse ว่า Yes = ทีมไหน — รับ beat/defeat/'win against' + fallback 'will X win'
-        # Q6: re imported at top-level
-        _pat = re.search(r'will\s+(.*?)\s+(?:beat|defeat|win against)', q_lower)
-        if not _pat:
-            # G4: fallback — 'Will X win?' format (single team, treated as Yes=X)
-            _pat = re.search(r'will\s+(.*?)\s+win\b', q_lower)
-        if not _pat:
+        subject = _prop["subject"]
+        if not subject:
             log.debug(f"[PolyYesNo] skip — can't parse Yes team from: {best.get('question','')[:60]}")
             return None
-        subject = _pat.group(1).strip()
         if fuzzy_match(subject, tb_norm, 0.5):
             yes_team, no_team = tb, ta  # Yes = away
         elif fuzzy_match(subject, ta_norm, 0.5):
@@ -2424,17 +4434,24 @@ def find_polymarket(event_name: str, poly_markets: list) -> Optional[dict]:
     # แปลง impact เป็น odds penalty (ยิ่ง impact มาก ยิ่ง odds ลด)
     impact_adj = Decimal(str(1 - impact_ratio * 0.5))  # max -5% odds
 
-    def poly_odds(p: Decimal) -> tuple[Decimal, Decimal]:
+    # P21: token ที่มี ladder (top market) → VWAP ที่ est stake แทน heuristic; scan_all reprice ที่ stake จริงอีกรอบ
+    depth_a, live_a = _alt_depth(best, tokens[0].get("token_id", ""))  # P22: stream mirror ก่อน
+    depth_b, live_b = _alt_depth(best, tokens[1].get("token_id", ""))
+
+    def poly_odds(p: Decimal, depth) -> tuple[Decimal, Decimal]:
+        q = exec_odds(depth, est_stake_usd, float(fee_pct)) if depth else None
+        if q:
+            return q[0], q[1]
         odds_raw = (Decimal("1") / p).quantize(Decimal("0.001"))
         # fee + impact cost
         odds_eff = (odds_raw * (Decimal("1") - fee_pct) * impact_adj).quantize(Decimal("0.001"))
         return odds_raw, odds_eff
 
     slug    = best.get("slug","")
-    odds_raw_a, odds_a = poly_odds(pa)
-    odds_raw_b, odds_b = poly_odds(pb)
+    odds_raw_a, odds_a = poly_odds(pa, depth_a)
+    odds_raw_b, odds_b = poly_odds(pb, depth_b)
 
-    if impact_ratio > 0.03:
+    if impact_ratio > 0.03 and not (depth_a and depth_b):
         log.info(f"[PolyImpact] {best.get('question','?')[:40]} liq=${liq_usd:.0f} impact={impact_ratio:.1%} adj={float(impact_adj):.3f}")
 
     is_kalshi = best.get("_kalshi", False)
@@ -2453,75 +4470,144 @@ def find_polymarket(event_name: str, poly_markets: list) -> Optional[dict]:
         "liquidity":    liq_usd,
         "volume_24h":   vol_24h,
         "impact_ratio": impact_ratio,
+        "market_id":    best.get("_ticker", slug) if is_kalshi else slug,  # P23
         "team_a": {"name": tokens[0].get("outcome", ta),
                    "odds_raw": odds_raw_a, "odds": odds_a,
-                   "token_id": tokens[0].get("token_id", "")},
+                   "token_id": tokens[0].get("token_id", ""), "depth": depth_a, "stream": live_a},
         "team_b": {"name": tokens[1].get("outcome", tb),
                    "odds_raw": odds_raw_b, "odds": odds_b,
-                   "token_id": tokens[1].get("token_id", "")},
+                   "token_id": tokens[1].get("token_id", ""), "depth": depth_b, "stream": live_b},
     }
 
+# ── Float pre-screen ───────────────────────────────────────────────
+# P8: float64 screen ก่อน Decimal path — event ที่ margin ไม่มีทางผ่าน MIN_PROFIT_PCT ถูกข้ามทั้ง event
+SCAN_PRESCREEN_EPS = float(_d("SCAN_PRESCREEN_EPS", "0.002"))  # เผื่อ quantize/rounding ของ apply_slippage
+def _best_float_odds(event: dict, is_soccer: bool) -> list[float]:
+    """best effective odds ต่อ outcome (float) — filter เดียวกับ scan_all ยกเว้น staleness (conservative)"""
+    lo, hi = float(MIN_ODDS_ALLOWED), float(MAX_ODDS_ALLOWED)
+    best: dict[str, float] = {}
+    for q in parse_event(event).quotes:  # P28
+        nl = q.name_lc
+        if nl in ("no contest", "nc"): continue
+        is_draw = nl in ("draw", "tie")
+        if is_draw and not is_soccer: continue
+        if not (lo <= q.price <= hi): continue
+        key = "draw" if is_draw else nl
+        eff = q.price * _books[q.bm].fee_mult_f  # P29
+        if eff > best.get(key, 0.0):
+            best[key] = eff
+    return list(best.values())
+
+def prescreen_events(odds_by_sport: dict, alt_markets: list) -> set[int]:
+    """P8: คืน id(event) ที่ *อาจ* มี arb ≥ MIN_PROFIT_PCT − SCAN_PRESCREEN_EPS
+    lower bound ของ margin = ผลรวม 1/odds ของ k outcome ที่ odds สูงสุด (k=3 soccer, 2 อื่นๆ)
+    event ที่มี alt-market candidate (Polymarket/Kalshi) ผ่านเสมอ — odds ฝั่งนั้นยังไม่รู้จนกว่าจะ find_polymarket
+    """
+    limit = 1.0 / (1.0 + float(MIN_PROFIT_PCT) - SCAN_PRESCREEN_EPS)
+    keep: set[int] = set()
+    if isinstance(alt_markets, AltMarketIndex):
+        # P26: event × market ทั้งหมดในครั้งเดียว — candidates()/matches() ข้างล่างและใน scan_all เป็น dict hit
+        alt_markets.prematch([(ev.get("home_team","").strip(), ev.get("away_team","").strip())
+                              for events in odds_by_sport.values() for ev in events])
+    rows: list[list[float]] = []
+    ks:   list[int] = []
+    ids:  list[int] = []
+    for sport_key, events in odds_by_sport.items():
+        is_soccer = sport_key.startswith(THREE_WAY_SPORTS_PREFIX)
+        k = 3 if is_soccer else 2
+        for event in events:
+            if alt_markets and (not isinstance(alt_markets, AltMarketIndex)
+                                or alt_markets.candidates(event.get("home_team","").strip(),
+                                                          event.get("away_team","").strip())):
+                keep.add(id(event))
+                continue
+            row = _best_float_odds(event, is_soccer)
+            if len(row) < k: continue
+            rows.append(row); ks.append(k); ids.append(id(event))
+    if not rows:
+        return keep
+    if _np is not None:
+        width = max(len(r) for r in rows)
+        arr = _np.zeros((len(rows), width), dtype=_np.float64)
+        for i, r in enumerate(rows):
+            arr[i, :len(r)] = r
+        with _np.errstate(divide="ignore"):
+            inv = _np.where(arr > 0, 1.0 / arr, _np.inf)
+        inv.sort(axis=1)
+        csum = _np.cumsum(inv, axis=1)
+        margin = _np.take_along_axis(csum, _np.asarray(ks)[:, None] - 1, axis=1)[:, 0]
+        keep.update(ids[i] for i in _np.flatnonzero(margin <= limit))
+    else:
+        for r, k, eid in zip(rows, ks, ids):
+            if sum(sorted(1.0 / x for x in r)[:k]) <= limit:
+                keep.add(eid)
+    return keep
+
+
 def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
     found = []
+    _cands = prescreen_events(odds_by_sport, poly_markets)  # P8
     for sport_key, events in odds_by_sport.items():
         for event in events:
-            home       = event.get("home_team","")
-            away       = event.get("away_team","")
-            event_name = f"{home} vs {away}"
-            commence   = event.get("commence_time","").replace("T"," ").rstrip("Z")  # B10: keep full ISO, no [:16]
+            if id(event) not in _cands:
+                continue  # P8: float margin ไม่ผ่าน — ไม่ต้องสร้าง Decimal
+            pe         = parse_event(event)  # P28
+            home, away = pe.home, pe.away
+            event_name = pe.name
+            commence   = pe.commence.replace("T"," ").rstrip("Z")  # B10: keep full ISO, no [:16]
 
             # 1. Staleness check
-            if is_stale(event.get("commence_time","")):
+            if stale_at(pe.commence_dt):
                 log.debug(f"[Stale] {event_name}")
                 continue
 
             is_soccer = sport_key.startswith(THREE_WAY_SPORTS_PREFIX)
             best: dict[str, OddsLine] = {}
-            for bm in event.get("bookmakers",[]):
-                bk, bn = bm.get("key",""), bm.get("title", bm.get("key",""))
-                for mkt in bm.get("markets",[]):
-                    if mkt.get("key") != "h2h": continue
-                    mkt_last_update = mkt.get("last_update", "")
-                    for out in mkt.get("outcomes",[]):
-                        name     = out.get("name","")
-                        nl = name.lower()
-                        # กรอง "no contest"/"nc" เสมอ
-                        if nl in ("no contest", "nc"): continue
-                        is_draw = nl in ("draw", "tie")
-                        # กรอง Draw สำหรับกีฬา 2-way — soccer เก็บ Draw ไว้
-                        if is_draw and not is_soccer: continue
-                        odds_raw = Decimal(str(out.get("price",1)))
-                        # 2. Odds filter
-                        if not is_valid_odds(odds_raw): continue
-                        # 1b. Odds staleness check ด้วย last_update จริง
-                        if is_stale(event.get("commence_time",""), mkt_last_update):
-                            log.debug(f"[Stale-odds] {event_name} {bn} last_update={mkt_last_update}")
-                            continue
-                        odds_eff = apply_slippage(odds_raw, bk)
-                        # Normalize Draw → "Draw" เพื่อให้ merge ได้ถูกต้อง
-                        key_name = "Draw" if is_draw else name
-                        if key_name not in best or odds_eff > best[key_name].odds:
-                            best[key_name] = OddsLine(bookmaker=bn, outcome=key_name,
-                                                      odds=odds_eff, odds_raw=odds_raw,
-                                                      raw={"bm_key":bk,"event_id":event.get("id","")},
-                                                      last_update=mkt_last_update or commence)
+            for q in pe.quotes:
+                nl = q.name_lc
+                # กรอง "no contest"/"nc" เสมอ
+                if nl in ("no contest", "nc"): continue
+                is_draw = nl in ("draw", "tie")
+                # กรอง Draw สำหรับกีฬา 2-way — soccer เก็บ Draw ไว้
+                if is_draw and not is_soccer: continue
+                odds_raw = q.odds
+                # 2. Odds filter
+                if not is_valid_odds(odds_raw): continue
+                # 1b. Odds staleness check ด้วย last_update จริง
+                if stale_at(pe.commence_dt, q.updated):
+                    log.debug(f"[Stale-odds] {event_name} {q.bm_title} last_update={q.last_update}")
+                    continue
+                odds_eff = apply_slippage(odds_raw, q.bm_key)
+                # Normalize Draw → "Draw" เพื่อให้ merge ได้ถูกต้อง
+                key_name = "Draw" if is_draw else q.name
+                if key_name not in best or odds_eff > best[key_name].odds:
+                    best[key_name] = OddsLine(bookmaker=q.bm_title, outcome=key_name,
+                                              odds=odds_eff, odds_raw=odds_raw,
+                                              raw={"bm_key":q.bm_key,"event_id":pe.id},
+                                              last_update=q.last_update or commence)
 
             poly = find_polymarket(event_name, poly_markets)
             if poly:
+                _event_registry.link(poly["bookmaker"].lower(), poly["market_id"],
+                                     _event_registry.event_id(sport_key, event))  # P23
                 for side, team in [("team_a",home),("team_b",away)]:
                     p = poly[side]
                     if not is_valid_odds(p["odds"]): continue
-                    matched = next((k for k in best if fuzzy_match(p["name"],k)), team)
+                    matched = _team_matcher.first(p["name"], best, default=team)  # P25
                     if matched not in best or p["odds"] > best[matched].odds:
                         bm_name = poly.get("bookmaker", "Polymarket")
                         best[matched] = OddsLine(bookmaker=bm_name, outcome=matched,
                                                  odds=p["odds"], odds_raw=p["odds_raw"],
                                                  market_url=poly["market_url"],
-                                                 raw={"token_id": p["token_id"]})
+                                                 raw={"token_id": p["token_id"], "depth": p.get("depth"),
+                                                      "fee_pct": poly["fee_pct"]})
 
             # Soccer 3-way: ค้นหา Draw market บน alt-markets ถ้ายังไม่มีใน best
             if is_soccer:
                 draw_mkt = find_draw_market(event_name, poly_markets)
+                if draw_mkt:
+                    _event_registry.link(draw_mkt["bookmaker"].lower(), draw_mkt["market_id"],
+                                         _event_registry.event_id(sport_key, event))  # P23
                 if draw_mkt and is_valid_odds(draw_mkt["odds"]):
                     if "Draw" not in best or draw_mkt["odds"] > best["Draw"].odds:
                         best["Draw"] = OddsLine(
@@ -2530,14 +4616,16 @@ def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
                             odds=draw_mkt["odds"],
                             odds_raw=draw_mkt["odds_raw"],
                             market_url=draw_mkt["market_url"],
-                            raw={"token_id": draw_mkt["token_id"]},
+                            raw={"token_id": draw_mkt["token_id"], "depth": draw_mkt.get("depth"),
+                                 "fee_pct": draw_mkt["fee_pct"]},
                         )
 
             if is_soccer:
                 # ══ Soccer 3-way branch: ตรวจเฉพาะ Home/Draw/Away ครบครัน ══
                 # เพิ่ม 2-way arb สำหรับ soccer ด้วย — ถ้า Draw ไม่ครบ
-                home_key = next((k for k in best if k.lower() not in ("draw",) and fuzzy_match(k, home, 0.6)), None)
-                away_key = next((k for k in best if k.lower() not in ("draw", home_key.lower() if home_key else "") and fuzzy_match(k, away, 0.6)), None)
+                home_key = _team_matcher.first(home, [k for k in best if k.lower() != "draw"], 0.6)
+                away_key = _team_matcher.first(
+                    away, [k for k in best if k.lower() not in ("draw", home_key.lower() if home_key else "")], 0.6)
                 draw_key = "Draw" if "Draw" in best else None
 
                 if home_key and away_key and draw_key:
@@ -2577,6 +4665,14 @@ def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
                                     _tt3 = sh + sd + sa
                                     _w3_min = min(sh*bh.odds, sd*bd.odds, sa*ba.odds)
                                     profit3 = (_w3_min - _tt3) / _tt3 if _tt3 > 0 else Decimal("0")
+                                if profit3 >= MIN_PROFIT_PCT and _has_depth(bh, bd, ba):
+                                    # P21: ราคา executable ที่ stake จริง — book บางเกิน → ทิ้ง
+                                    _dr = depth_reprice([bh, bd, ba], [sh, sd, sa])
+                                    if _dr is None:
+                                        log.debug(f"[Depth] {event_name} 3way book too thin for stake")
+                                        profit3 = Decimal("0")
+                                    else:
+                                        (bh, bd, ba), (sh, sd, sa), profit3 = _dr
                                 if profit3 >= MIN_PROFIT_PCT:
                                     opp = ArbOpportunity(
                                         signal_id=uuid.uuid4().hex[:8], sport=sport_key,
@@ -2618,6 +4714,13 @@ def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
                                             margin = Decimal("1")/bh.odds + Decimal("1")/ba.odds
                                             new_total = (limited_thb / USD_TO_THB) / ratio * margin
                                             profit, s_h, s_a = calc_arb_fixed(bh.odds, ba.odds, new_total)
+                                    if profit >= MIN_PROFIT_PCT and _has_depth(bh, ba):
+                                        _dr = depth_reprice([bh, ba], [s_h, s_a])  # P21
+                                        if _dr is None:
+                                            log.debug(f"[Depth] {event_name} book too thin for stake")
+                                            profit = Decimal("0")
+                                        else:
+                                            (bh, ba), (s_h, s_a), profit = _dr
                                     if profit >= MIN_PROFIT_PCT:
                                         opp = ArbOpportunity(
                                             signal_id=uuid.uuid4().hex[:8], sport=sport_key,
@@ -2664,10 +4767,19 @@ def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
                                     continue
                             else:
                                 s_a, s_b = s_a_capped, s_b_capped
+                            leg_a, leg_b = best[a], best[b]
+                            if _has_depth(leg_a, leg_b):
+                                # P21: ราคา executable ที่ stake จริง — phantom arb (top-of-book บาง) หายตรงนี้
+                                _dr = depth_reprice([leg_a, leg_b], [s_a, s_b])
+                                if _dr is None or _dr[2] < MIN_PROFIT_PCT:
+                                    log.debug(f"[Depth] {event_name} skipped at size — "
+                                              f"{'book too thin' if _dr is None else f'profit={_dr[2]:.2%}'}")
+                                    continue
+                                (leg_a, leg_b), (s_a, s_b), profit = _dr
                             opp = ArbOpportunity(
                                 signal_id=uuid.uuid4().hex[:8], sport=sport_key,
                                 event=event_name, commence=commence,
-                                leg1=best[a], leg2=best[b],
+                                leg1=leg_a, leg2=leg_b,
                                 profit_pct=profit, stake1=s_a, stake2=s_b,
                             )
                             found.append(opp)
@@ -2688,6 +4800,7 @@ def scan_all(odds_by_sport: dict, poly_markets: list) -> list[ArbOpportunity]:
 async def send_alert(opp: ArbOpportunity):
     with _data_lock:
         pending[opp.signal_id] = (opp, time.time())  # A2: store with timestamp
+    _sport_sched.note_opportunity(opp.sport)  # P18: yield ของ sport นี้
 
     # ── คำนวณ mins_to_start ก่อนใช้ ──
     try:
@@ -2714,6 +4827,7 @@ async def send_alert(opp: ArbOpportunity):
     with _data_lock:
         opportunity_log.append(entry)
         if len(opportunity_log) > 100: opportunity_log.pop(0)
+    publish_event("opportunity", entry)  # P13
     db_save_opportunity(entry)   # 💾 save to DB
 
     emoji = SPORT_EMOJI.get(opp.sport,"🏆")
@@ -2820,13 +4934,17 @@ async def send_alert(opp: ArbOpportunity):
         InlineKeyboardButton("❌ Reject",  callback_data=f"reject:{opp.signal_id}"),
     ]])
     # 9. Multi-chat (rate-limited)
+    _sent = []
     for cid in ALL_CHAT_IDS:
         try:
-            await _app.bot.send_message(chat_id=cid, text=msg, parse_mode="Markdown",
-                                        reply_markup=keyboard if cid==CHAT_ID else None)
+            _markup = keyboard if cid==CHAT_ID else None
+            _m = await _app.bot.send_message(chat_id=cid, text=msg, parse_mode="Markdown",
+                                             reply_markup=_markup)
+            _sent.append((cid, _m.message_id, _markup))
             await asyncio.sleep(1.5)  # C10: ป้องกัน Telegram Flood (20 msg/min limit per chat)
         except Exception as e:
             log.error(f"[Alert] chat {cid}: {e}")
+    track_alert(opp.signal_id, msg, _sent)  # P17: quote refresher แก้ alert นี้ได้ถ้า profit ตก
 
 
 def md_escape(text: str) -> str:
@@ -2862,80 +4980,362 @@ def parse_commence(raw: str) -> datetime:
 #  SLIPPAGE GUARD — Re-fetch live odds ก่อน execute
 # ══════════════════════════════════════════════════════════════════
 _refetch_cache: dict[str, tuple[float, list]] = {}  # C10: sport -> (ts, events)
+REFETCH_DEADLINE_SEC = _i("REFETCH_DEADLINE_SEC", 8)  # P16: deadline ร่วมของ live refetch ทุก leg ใน execute_both
+
+# refetch_live_odds() removed — was dead code (BUG8); superseded by refetch_leg_live() (P17: เดิมคือ _refetch_leg ใน execute_both)
+
 
-# refetch_live_odds() removed — was dead code (BUG8); superseded by _refetch_leg() inside execute_both()
+def _feed_cache_key(sport: str, bookmaker: str) -> str:
+    """C10/P17: key ของ _refetch_cache ตาม feed ที่ bookmaker นี้อยู่ — cloudbet native / extra / standard"""
+    bm = norm_bm_key(bookmaker)
+    if bm == "cloudbet" and USE_CLOUDBET:
+        return f"{sport}__cloudbet_native"
+    bookmakers_norm = [norm_bm_key(b) for b in BOOKMAKERS.split(",") if b.strip()]
+    return f"{sport}{'__extra' if bm not in bookmakers_norm else ''}"
 
 
-async def refetch_valuebet_odds(vb: "ValueBetSignal") -> tuple[float, bool]:
+async def refetch_valuebet_odds(vb: "ValueBetSignal", feed_ttl: float = 15) -> tuple[float, bool]:
     """B2: ดึง live odds ของ soft book ก่อน VB confirm
     G3: รวม EXTRA_BOOKMAKERS path — ถ้า bm ไม่อยู่ใน BOOKMAKERS ให้ fetch extra feed แทน
     K3: ใช้ semaphore wrapper เหมือน scan หลัก
     O1: fail-closed — Returns: (live_price, found)
     ถ้า found=False → market suspended หรือ mapping miss — caller ต้อง abort
+    P17: feed_ttl = อายุ feed ใน _refetch_cache ที่ยอมรับ (quote refresher ส่งค่ายาวกว่าเพื่อประหยัด credit)
     """
     def _search_events(events: list, bm_key_norm: str) -> float | None:
-        for event in events:
-            ename = f"{event.get('home_team','')} vs {event.get('away_team','')}"
-            if not fuzzy_match(ename, vb.event, 0.7):
-                continue
-            for bm in event.get("bookmakers", []):
-                bk = bm.get("key", "")
-                if norm_bm_key(bk) != bm_key_norm:
-                    continue
-                for mkt in bm.get("markets", []):
-                    if mkt.get("key") != "h2h": continue
-                    for out in mkt.get("outcomes", []):
-                        if fuzzy_match(out.get("name", ""), vb.outcome, 0.8):
-                            return float(out.get("price", vb.soft_odds))
+        for event in _event_registry.matches(events, vb.sport, vb.event, 0.7, vb.commence_time):  # P23
+            for q in parse_event(event).quotes:  # P28
+                if _books[q.bm].key == bm_key_norm and fuzzy_match(q.name, vb.outcome, 0.8):
+                    return q.price
         return None
 
-    try:
-        bm_key_norm = norm_bm_key(vb.bookmaker)
-        # C1 fix: use extra feed for any bm NOT in main BOOKMAKERS list
-        # (no longer requires bm to be explicitly listed in EXTRA_BOOKMAKERS env)
-        bookmakers_norm = [norm_bm_key(b) for b in BOOKMAKERS.split(",") if b.strip()]
-        use_extra = bm_key_norm not in bookmakers_norm
+    try:
+        bm_key_norm = norm_bm_key(vb.bookmaker)
+        # C1 fix: use extra feed for any bm NOT in main BOOKMAKERS list
+        # (no longer requires bm to be explicitly listed in EXTRA_BOOKMAKERS env)
+        bookmakers_norm = [norm_bm_key(b) for b in BOOKMAKERS.split(",") if b.strip()]
+        use_extra = bm_key_norm not in bookmakers_norm
+
+        # C8: Cloudbet native API path — bypass Odds API entirely
+        if bm_key_norm == "cloudbet" and USE_CLOUDBET:
+            cache_key = _feed_cache_key(vb.sport, vb.bookmaker)
+            cached_ts, cached_events = _refetch_cache.get(cache_key, (0, []))
+            if time.time() - cached_ts < feed_ttl and cached_events:
+                events = cached_events
+            else:
+                events = await _fetch_cloudbet_sf(get_http_session(), [vb.sport])
+                log.debug(f"[VBGuard] refetch Cloudbet via native API for {vb.sport}")
+                _refetch_cache[cache_key] = (time.time(), events)
+            result = _search_events(events, bm_key_norm)
+            if result is not None:
+                return result, True
+            return vb.soft_odds, False
+
+        cache_key = _feed_cache_key(vb.sport, vb.bookmaker)
+        cached_ts, cached_events = _refetch_cache.get(cache_key, (0, []))
+        if time.time() - cached_ts < feed_ttl and cached_events:
+            events = cached_events
+        else:
+            # K3: ใช้ semaphore wrapper — ไม่ยิง direct
+            session = get_http_session()  # P5: pooled — warm connection ตอน confirm
+            if use_extra:
+                events = await _fetch_extra_books_sem(session, vb.sport)
+                log.debug(f"[VBGuard] refetch via extra feed for {vb.bookmaker}")
+            else:
+                events = await _fetch_odds_sem(session, vb.sport)
+            _refetch_cache[cache_key] = (time.time(), events)
+        result = _search_events(events, bm_key_norm)
+        if result is not None:
+            return result, True
+    except Exception as e:
+        log.warning(f"[VBGuard] refetch failed: {e}")
+    return vb.soft_odds, False  # O1: not found — caller must abort
+
+
+# ══════════════════════════════════════════════════════════════════
+#  EXECUTE
+# ══════════════════════════════════════════════════════════════════
+async def refetch_leg_live(leg: OddsLine, sport: str, event: str, label: str,
+                           feed_ttl: float = 15, verbose: bool = True,
+                           stake_usd: Optional[Decimal] = None, commence: str = "") -> tuple[Decimal, bool]:
+    """P1: unified per-leg refetch — routes ตาม source (polymarket/kalshi/extra/std)
+    fail-closed: คืน (price, found=False) ถ้าหาไม่เจอ — caller ต้อง abort
+    P17: ย้ายออกจาก execute_both ให้ quote refresher ใช้ร่วม — feed_ttl = อายุ feed ใน _refetch_cache ที่ยอมรับ
+    verbose=False (refresher) → log เป็น debug ไม่ให้ log ท่วมทุกรอบ
+    P21: stake_usd → CLOB leg ใช้ VWAP ของ ladder ที่ stake นี้แทน best ask; book ไม่พอ fill → found=False
+    P23: commence = เวลาแข่งของ signal — แยก game ที่ชื่อทีมซ้ำกันข้ามวัน
+    """
+    _info = log.info if verbose else log.debug
+    _warn = log.warning if verbose else log.debug
+    _bookmakers_norm_ex = [norm_bm_key(b) for b in BOOKMAKERS.split(",") if b.strip()]
+    _bm  = leg.bookmaker.lower()
+    _tok = leg.raw.get("token_id", "") if leg.raw else ""
+    # 1) Polymarket / Kalshi — CLOB / REST API
+    # Q1: ใช้ ask side แทน mid_price — conservative execution price (buyer pays ask)
+    if _tok and ("polymarket" in _bm or "kalshi" in _bm):
+        try:
+            _s = get_http_session()  # P5: pooled — ไม่เสีย handshake ตอน confirm
+            # P22: Polymarket token ที่ stream mirror สดอยู่ → ไม่ยิง request; stream ตาย → REST
+            _book = (_book_stream.book(_tok)
+                     if "polymarket" in _bm and not is_stale("", book_token=_tok) else None)
+            if _book:
+                _info(f"[SlippageGuard] {label} stream book (age={_book_stream.age(_tok):.1f}s)")
+            else:
+                _book = (await fetch_kalshi_market_detail(_s, _tok)
+                         if "kalshi" in _bm
+                         else await fetch_poly_market_detail(_s, _tok))
+            _is_no = _tok.endswith("_no")
+            _ladder = book_asks(_book, complement=_is_no) if _book and stake_usd else []
+            if _ladder:
+                # P21: ราคา executable ที่ stake จริง — fee คิดแบบเดียวกับตอน scan
+                _fee = leg.raw.get("fee_pct")
+                _q = exec_odds(_ladder, float(stake_usd), _fee if _fee is not None else 0.0)
+                if _q and _q[2] >= 0.999:
+                    _price = _q[1] if _fee is not None else apply_slippage(_q[0], _bm)
+                    _info(f"[SlippageGuard] {label} CLOB depth refetch: {float(_price):.3f} @ ${float(stake_usd):.0f}")
+                    return _price, True
+                _warn(f"[SlippageGuard] {label} CLOB depth insufficient for ${float(stake_usd):.0f}"
+                      f" (fill={_q[2] if _q else 0:.0%})")
+                return leg.odds, False
+            if _book:
+                # Q1: prefer ask price (executable) over mid — more conservative
+                if "kalshi" in _bm:
+                    # Kalshi: yes_ask / (1-yes_ask) ฝั่ง no
+                    _ask_raw = _book.get("best_ask", 0)
+                    if _is_no:
+                        _no_ask = 1.0 - (_book.get("best_bid", 0) or _ask_raw)
+                        _exec_p = _no_ask if _no_ask > 0 else (1.0 - _ask_raw)
+                    else:
+                        _exec_p = _ask_raw
+                else:
+                    # Polymarket: best_ask ของ token นั้น
+                    _exec_p = _book.get("best_ask", 0)
+                    if _is_no:
+                        # No token ask = 1 - Yes bid
+                        _yes_bid = _book.get("best_bid", 0)
+                        _exec_p = (1.0 - _yes_bid) if _yes_bid > 0 else _exec_p
+                if _exec_p > 0.01:
+                    _price = apply_slippage(Decimal("1") / Decimal(str(_exec_p)), _bm)
+                    _info(f"[SlippageGuard] {label} CLOB ask refetch: {float(_price):.3f} (ask={_exec_p:.4f})")
+                    return _price, True
+            _warn(f"[SlippageGuard] {label} CLOB empty response")
+            return leg.odds, False
+        except Exception as _e:
+            _warn(f"[SlippageGuard] {label} CLOB failed: {_e}")
+            return leg.odds, False
+    # 2) Sportsbook (standard or extra) — Odds API feed
+    _bm_norm_leg = norm_bm_key(leg.bookmaker)
+    _is_extra = _bm_norm_leg not in _bookmakers_norm_ex
+    _bm_key   = leg.raw.get("bm_key", "") if leg.raw else ""
+    # C8: Cloudbet native API path
+    if _bm_norm_leg == "cloudbet" and USE_CLOUDBET:
+        _ck_cb = _feed_cache_key(sport, leg.bookmaker)
+        _cts_cb, _cev_cb = _refetch_cache.get(_ck_cb, (0, []))
+        try:
+            if time.time() - _cts_cb < feed_ttl and _cev_cb:
+                _events_cb = _cev_cb
+            else:
+                _events_cb = await _fetch_cloudbet_sf(get_http_session(), [sport])
+                _refetch_cache[_ck_cb] = (time.time(), _events_cb)
+        except Exception as _ece:
+            _warn(f"[SlippageGuard] {label} Cloudbet native fetch failed: {_ece}")
+            return leg.odds, False
+        for _ev in _event_registry.matches(_events_cb, sport, event, 0.7, commence):  # P23
+            for _q in parse_event(_ev).quotes:  # P28
+                if _books[_q.bm].key == "cloudbet" and fuzzy_match(_q.name, leg.outcome, 0.8):
+                    return apply_slippage(_q.odds, "cloudbet"), True
+        return leg.odds, False
+    _ck = _feed_cache_key(sport, leg.bookmaker)
+    now_ts = time.time()
+    _cts, _cev = _refetch_cache.get(_ck, (0, []))
+    try:
+        if now_ts - _cts < feed_ttl and _cev:
+            _events = _cev
+        else:
+            _s2 = get_http_session()
+            _events = (await _fetch_extra_books_sem(_s2, sport)
+                       if _is_extra else await _fetch_odds_sem(_s2, sport))
+            _refetch_cache[_ck] = (time.time(), _events)
+    except Exception as _ef:
+        _warn(f"[SlippageGuard] {label} feed fetch failed: {_ef}")
+        return leg.odds, False
+    _bm_lc = leg.bookmaker.lower()
+    for _ev in _event_registry.matches(_events, sport, event, 0.7, commence):  # P23
+        for _q in parse_event(_ev).quotes:  # P28
+            _bk = _q.bm_key
+            if not (_bk == _bm_key or _bm_lc in _bk.lower()): continue
+            if fuzzy_match(_q.name, leg.outcome, 0.8):
+                _price = apply_slippage(_q.odds, _bk)
+                _info(f"[SlippageGuard] {label} feed refetch: {float(_price):.3f}")
+                return _price, True
+    _warn(f"[SlippageGuard] {label} not found in feed (market suspended?)")
+    return leg.odds, False
+
+
+# ── P17: Quote refresher ───────────────────────────────────────────
+# signal รอใน pending ได้นานถึง SIGNAL_TTL_SEC — refresher ดึงราคา leg ของทุก signal ที่ยังเปิดอยู่เป็นระยะ
+# ให้ Confirm ตรวจกับ quote ที่อายุไม่กี่วินาทีแทนการยิง network ทุก leg ตอนกด
+# CLOB/Kalshi ฟรี → ทุก QUOTE_REFRESH_SEC | sportsbook feed กิน credit → 1 call ต่อ (sport, feed) ทุก QUOTE_FEED_REFRESH_SEC
+# แชร์ข้าม signal ผ่าน _refetch_cache + singleflight — ถ้า profit ตกต่ำกว่า threshold แก้ Telegram alert ทันที
+QUOTE_REFRESH_SEC      = _i("QUOTE_REFRESH_SEC",      15)
+QUOTE_FEED_REFRESH_SEC = _i("QUOTE_FEED_REFRESH_SEC", 60)   # 0 = refresher ไม่ยิง sportsbook feed เอง
+QUOTE_MAX_AGE_SEC      = _i("QUOTE_MAX_AGE_SEC",      20)   # quote เก่ากว่านี้ → Confirm refetch จาก network ตามเดิม
+
+_live_quotes: dict[tuple[str, str], tuple[float, object]] = {}  # (sid, leg) -> (as_of_ts, price | None=not found)
+_alert_msgs:  dict[str, tuple[str, list]] = {}  # sid -> (markdown text, [(chat_id, message_id, reply_markup)])
+_quote_state: dict[str, str] = {}               # sid -> "ok" | "decayed" | "unavailable" — แก้ alert เฉพาะตอนเปลี่ยน
+
+
+def _is_clob_leg(leg: OddsLine) -> bool:
+    _bm = leg.bookmaker.lower()
+    return bool(leg.raw and leg.raw.get("token_id")) and ("polymarket" in _bm or "kalshi" in _bm)
+
+
+def hot_quote(sid: str, key: str):
+    """P17: ราคาจาก refresher ถ้าอายุ ≤ QUOTE_MAX_AGE_SEC และหาเจอ — ไม่งั้น None (caller refetch เอง)"""
+    q = _live_quotes.get((sid, key))
+    if q is None or q[1] is None or time.time() - q[0] > QUOTE_MAX_AGE_SEC:
+        return None
+    return q[1]
+
+
+def track_alert(sid: str, text: str, messages: list) -> None:
+    """P17: จำ message ของ alert ไว้ให้ refresher แก้ได้ — messages = [(chat_id, message_id, reply_markup)]"""
+    if messages:
+        _alert_msgs[sid] = (text, messages)
+
+
+def untrack_alert(sid: str) -> None:
+    """P17: operator เริ่มกดปุ่มแล้ว — handler เป็นเจ้าของข้อความต่อ refresher ห้ามแก้ทับ"""
+    _alert_msgs.pop(sid, None)
+    _quote_state.pop(sid, None)
+
+
+async def _refresh_quote(sid: str, key: str, feed_key: Optional[str], fetch) -> None:
+    """feed_key: key ใน _refetch_cache ของ leg ที่มาจาก sportsbook feed — None = CLOB/Kalshi (ราคา ณ ตอนนี้)"""
+    try:
+        price, found = await fetch()
+    except Exception as e:
+        log.debug(f"[Quote] {sid}/{key} refresh failed: {e}")
+        return
+    now = time.time()
+    # feed leg: as_of = เวลาที่ feed ถูกดึงจริง ไม่ใช่เวลาที่อ่านจาก cache
+    as_of = _refetch_cache.get(feed_key, (now,))[0] if feed_key else now
+    _live_quotes[(sid, key)] = (as_of, price if found else None)
+
+
+async def _edit_alert(sid: str, state: str, note: str) -> None:
+    if _quote_state.get(sid, "ok") == state:
+        return
+    entry = _alert_msgs.get(sid)
+    if entry is None:
+        return
+    _quote_state[sid] = state
+    text, messages = entry
+    stamp = (datetime.now(timezone.utc) + timedelta(hours=7)).strftime("%H:%M:%S")
+    for cid, mid, markup in messages:
+        if sid not in _alert_msgs:  # operator กดปุ่มระหว่างแก้ — หยุด
+            return
+        try:
+            await _app.bot.edit_message_text(
+                chat_id=cid, message_id=mid, text=f"{text}\n\n{note} _({stamp})_",
+                parse_mode="Markdown", reply_markup=markup,
+            )
+            await asyncio.sleep(0.3)
+        except Exception as e:
+            log.debug(f"[Quote] edit alert {sid} chat {cid}: {e}")
+    log.info(f"[Quote] {sid} → {state}")
+
+
+async def _reprice_arb(sid: str, opp: ArbOpportunity) -> None:
+    keys = [("leg1", opp.leg1), ("leg2", opp.leg2)] + ([("leg3", opp.leg3)] if opp.leg3 else [])
+    quotes = [_live_quotes.get((sid, k)) for k, _ in keys]
+    if any(q is None for q in quotes):
+        return  # ยังไม่ครบทุก leg (เช่น feed ถูกข้ามเพราะ quota) — ไม่ตัดสิน
+    missing = [leg.bookmaker for (_, leg), q in zip(keys, quotes) if q[1] is None]
+    if missing:
+        await _edit_alert(sid, "unavailable",
+                          f"⚠️ *Quote update:* ดึงราคา live ไม่ได้ — {md_escape(', '.join(missing))}")
+        return
+    prices = [q[1] for q in quotes]
+    if opp.leg3:
+        live, _, _, _ = calc_arb_3way(prices[0], prices[2], prices[1])  # H, D, A
+    else:
+        live, _, _ = calc_arb(prices[0], prices[1])
+    if live < MIN_PROFIT_PCT:
+        await _edit_alert(sid, "decayed",
+                          f"📉 *Quote update:* profit {float(opp.profit_pct):.2%} → *{float(live):.2%}* "
+                          f"(ต่ำกว่า threshold {float(MIN_PROFIT_PCT):.1%})")
+    else:
+        await _edit_alert(sid, "ok", f"✅ *Quote update:* profit กลับมา *{float(live):.2%}*")
+
 
-        # C8: Cloudbet native API path — bypass Odds API entirely
-        if bm_key_norm == "cloudbet" and USE_CLOUDBET:
-            cache_key = f"{vb.sport}__cloudbet_native"
-            cached_ts, cached_events = _refetch_cache.get(cache_key, (0, []))
-            if time.time() - cached_ts < 15 and cached_events:
-                events = cached_events
-            else:
-                async with aiohttp.ClientSession() as session:
-                    events = await async_fetch_cloudbet(session, [vb.sport])
-                    log.debug(f"[VBGuard] refetch Cloudbet via native API for {vb.sport}")
-                _refetch_cache[cache_key] = (time.time(), events)
-            result = _search_events(events, bm_key_norm)
-            if result is not None:
-                return result, True
-            return vb.soft_odds, False
+async def _reprice_vb(sid: str, vb: "ValueBetSignal") -> None:
+    q = _live_quotes.get((sid, "vb"))
+    if q is None:
+        return
+    if q[1] is None:
+        await _edit_alert(sid, "unavailable",
+                          f"⚠️ *Quote update:* ดึงราคา {md_escape(vb.bookmaker)} live ไม่ได้")
+        return
+    live = float(q[1])
+    _, live_edge = calc_valuebet_kelly(vb.true_odds, live, vb.grade)
+    if live < vb.soft_odds * 0.98 or live_edge <= 0:  # เงื่อนไขเดียวกับ VB confirm guard
+        await _edit_alert(sid, "decayed",
+                          f"📉 *Quote update:* `{vb.soft_odds:.3f}` → `{live:.3f}` (edge {live_edge:.2f}%)")
+    else:
+        await _edit_alert(sid, "ok", f"✅ *Quote update:* `{live:.3f}` (edge {live_edge:.2f}%)")
 
-        cache_key = f"{vb.sport}{'__extra' if use_extra else ''}"
-        cached_ts, cached_events = _refetch_cache.get(cache_key, (0, []))
-        if time.time() - cached_ts < 15 and cached_events:
-            events = cached_events
-        else:
-            # K3: ใช้ semaphore wrapper — ไม่ยิง direct
-            async with aiohttp.ClientSession() as session:
-                if use_extra:
-                    events = await _fetch_extra_books_sem(session, vb.sport)
-                    log.debug(f"[VBGuard] refetch via extra feed for {vb.bookmaker}")
-                else:
-                    events = await _fetch_odds_sem(session, vb.sport)
-            _refetch_cache[cache_key] = (time.time(), events)
-        result = _search_events(events, bm_key_norm)
-        if result is not None:
-            return result, True
-    except Exception as e:
-        log.warning(f"[VBGuard] refetch failed: {e}")
-    return vb.soft_odds, False  # O1: not found — caller must abort
+
+async def quote_refresh_loop():
+    """P17: re-price leg ของทุก signal ใน pending/_pending_vb ทุก QUOTE_REFRESH_SEC"""
+    while not _shutdown_event.is_set():
+        await asyncio.sleep(QUOTE_REFRESH_SEC)
+        try:
+            now = time.time()
+            with _data_lock:
+                arbs = [(sid, o) for sid, (o, ts) in pending.items()
+                        if now - ts <= SIGNAL_TTL_SEC and sid not in _processing]
+                vbs  = [(sid, v) for sid, (v, ts) in _pending_vb.items()
+                        if now - ts <= SIGNAL_TTL_SEC and sid not in _processing]
+                open_sids = set(pending) | set(_pending_vb)
+            for k in [k for k in _live_quotes if k[0] not in open_sids]:
+                del _live_quotes[k]
+            for sid in [sid for sid in _alert_msgs if sid not in open_sids]:
+                untrack_alert(sid)
+            if not arbs and not vbs:
+                continue
+            feeds_ok = QUOTE_FEED_REFRESH_SEC > 0 and _quota_ok()
+            ttl = QUOTE_FEED_REFRESH_SEC
+            jobs = []
+            for sid, opp in arbs:
+                for key, leg in (("leg1", opp.leg1), ("leg2", opp.leg2), ("leg3", opp.leg3)):
+                    if leg is None:
+                        continue
+                    clob = _is_clob_leg(leg)
+                    if not clob and not feeds_ok:
+                        continue
+                    jobs.append(_refresh_quote(
+                        sid, key, None if clob else _feed_cache_key(opp.sport, leg.bookmaker),
+                        lambda leg=leg, opp=opp, key=key: refetch_leg_live(
+                            leg, opp.sport, opp.event, f"{opp.signal_id}/{key}", feed_ttl=ttl, verbose=False,
+                            stake_usd={"leg1": opp.stake1, "leg2": opp.stake2, "leg3": opp.stake3}[key],
+                            commence=opp.commence),
+                    ))
+            if feeds_ok:
+                for sid, vb in vbs:
+                    jobs.append(_refresh_quote(sid, "vb", _feed_cache_key(vb.sport, vb.bookmaker),
+                                               lambda vb=vb: refetch_valuebet_odds(vb, feed_ttl=ttl)))
+            await asyncio.gather(*jobs)
+            for sid, opp in arbs:
+                await _reprice_arb(sid, opp)
+            for sid, vb in vbs:
+                await _reprice_vb(sid, vb)
+            log.debug(f"[Quote] refreshed arbs={len(arbs)} vbs={len(vbs)} legs={len(jobs)} feeds={feeds_ok}")
+        except Exception as e:
+            log.error(f"[Quote] refresh loop error: {e}", exc_info=True)
 
 
-# ══════════════════════════════════════════════════════════════════
-#  EXECUTE
-# ══════════════════════════════════════════════════════════════════
 async def execute_both(opp: ArbOpportunity) -> str:
     is_3way = opp.leg3 is not None and opp.stake3 is not None
     _UNSET = object()  # explicit sentinel — replaces fragile locals() checks
@@ -2947,112 +5347,50 @@ async def execute_both(opp: ArbOpportunity) -> str:
     orig_profit = opp.profit_pct
     live_profit = orig_profit  # default
     slippage_warn = ""
-    # P1: unified per-leg refetch helper — routes ตาม source (polymarket/kalshi/extra/std)
-    # fail-closed: คืน (price, found=False) ถ้าหาไม่เจอ — caller ต้อง abort
-    _bookmakers_norm_ex = [norm_bm_key(b) for b in BOOKMAKERS.split(",") if b.strip()]
-    async def _refetch_leg(leg, sport: str, label: str) -> tuple[Decimal, bool]:
-        _bm  = leg.bookmaker.lower()
-        _tok = leg.raw.get("token_id", "") if leg.raw else ""
-        # 1) Polymarket / Kalshi — CLOB / REST API
-        # Q1: ใช้ ask side แทน mid_price — conservative execution price (buyer pays ask)
-        if _tok and ("polymarket" in _bm or "kalshi" in _bm):
+    # P16: refetch ทุก leg พร้อมกัน — confirm latency = max(leg) แทน sum(leg)
+    # deadline ร่วม REFETCH_DEADLINE_SEC: leg ที่ไม่ทัน/raise → found=False (fail-closed เหมือนเดิม)
+    # เวลาแต่ละ leg (ms) เก็บใน _refetch_ms → TradeRecord.refetch_ms
+    _refetch_ms: dict[str, float] = {}
+    _leg_stake = {"leg1": opp.stake1, "leg2": opp.stake2, "leg3": opp.stake3}  # P21: VWAP ที่ stake จริง
+    async def _refetch_legs(legs: list[tuple]) -> list[tuple[Decimal, bool]]:
+        t0 = time.perf_counter()
+        async def _timed(key: str, leg, label: str) -> tuple[Decimal, bool]:
             try:
-                async with aiohttp.ClientSession() as _s:
-                    _book = (await fetch_kalshi_market_detail(_s, _tok)
-                             if "kalshi" in _bm
-                             else await fetch_poly_market_detail(_s, _tok))
-                _is_no = _tok.endswith("_no")
-                if _book:
-                    # Q1: prefer ask price (executable) over mid — more conservative
-                    if "kalshi" in _bm:
-                        # Kalshi: yes_ask / (1-yes_ask) ฝั่ง no
-                        _ask_raw = _book.get("best_ask", 0)
-                        if _is_no:
-                            _no_ask = 1.0 - (_book.get("best_bid", 0) or _ask_raw)
-                            _exec_p = _no_ask if _no_ask > 0 else (1.0 - _ask_raw)
-                        else:
-                            _exec_p = _ask_raw
-                    else:
-                        # Polymarket: best_ask ของ token นั้น
-                        _exec_p = _book.get("best_ask", 0)
-                        if _is_no:
-                            # No token ask = 1 - Yes bid
-                            _yes_bid = _book.get("best_bid", 0)
-                            _exec_p = (1.0 - _yes_bid) if _yes_bid > 0 else _exec_p
-                    if _exec_p > 0.01:
-                        _price = apply_slippage(Decimal("1") / Decimal(str(_exec_p)), _bm)
-                        log.info(f"[SlippageGuard] {label} CLOB ask refetch: {float(_price):.3f} (ask={_exec_p:.4f})")
-                        return _price, True
-                log.warning(f"[SlippageGuard] {label} CLOB empty response")
-                return leg.odds, False
-            except Exception as _e:
-                log.warning(f"[SlippageGuard] {label} CLOB failed: {_e}")
-                return leg.odds, False
-        # 2) Sportsbook (standard or extra) — Odds API feed
-        _bm_norm_leg = norm_bm_key(leg.bookmaker)
-        _is_extra = _bm_norm_leg not in _bookmakers_norm_ex
-        _bm_key   = leg.raw.get("bm_key", "") if leg.raw else ""
-        # C8: Cloudbet native API path for _refetch_leg
-        if _bm_norm_leg == "cloudbet" and USE_CLOUDBET:
-            _ck_cb = f"{sport}__cloudbet_native"
-            _cts_cb, _cev_cb = _refetch_cache.get(_ck_cb, (0, []))
-            try:
-                if time.time() - _cts_cb < 15 and _cev_cb:
-                    _events_cb = _cev_cb
-                else:
-                    async with aiohttp.ClientSession() as _sc:
-                        _events_cb = await async_fetch_cloudbet(_sc, [sport])
-                    _refetch_cache[_ck_cb] = (time.time(), _events_cb)
-            except Exception as _ece:
-                log.warning(f"[SlippageGuard] {label} Cloudbet native fetch failed: {_ece}")
-                return leg.odds, False
-            for _ev in _events_cb:
-                _en = f"{_ev.get('home_team','')} vs {_ev.get('away_team','')}"
-                if not fuzzy_match(_en, opp.event, 0.7): continue
-                for _bm2 in _ev.get("bookmakers", []):
-                    if norm_bm_key(_bm2.get("key","")) != "cloudbet": continue
-                    for _mkt in _bm2.get("markets", []):
-                        if _mkt.get("key") != "h2h": continue
-                        for _out in _mkt.get("outcomes", []):
-                            if fuzzy_match(_out.get("name",""), leg.outcome, 0.8):
-                                _p = Decimal(str(_out.get("price", leg.odds)))
-                                return apply_slippage(_p, "cloudbet"), True
-            return leg.odds, False
-        _ck = f"{sport}{'__extra' if _is_extra else ''}"
-        now_ts = time.time()
-        _cts, _cev = _refetch_cache.get(_ck, (0, []))
+                _hot = hot_quote(opp.signal_id, key)  # P17: quote จาก refresher ที่ยังสด → ไม่ต้องยิง network
+                if _hot is not None:
+                    log.info(f"[SlippageGuard] {label} hot quote: {float(_hot):.3f}")
+                    return _hot, True
+                return await refetch_leg_live(leg, opp.sport, opp.event, label,
+                                              stake_usd=_leg_stake.get(key), commence=opp.commence)
+            finally:
+                _refetch_ms.setdefault(key, round((time.perf_counter() - t0) * 1000, 1))
+        tasks = [asyncio.ensure_future(_timed(key, leg, label)) for key, leg, label in legs]
         try:
-            if now_ts - _cts < 15 and _cev:
-                _events = _cev
+            _, pending = await asyncio.wait(tasks, timeout=REFETCH_DEADLINE_SEC)
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+        out: list[tuple[Decimal, bool]] = []
+        for (key, leg, label), t in zip(legs, tasks):
+            if t in pending:
+                _refetch_ms[key] = REFETCH_DEADLINE_SEC * 1000.0
+                log.warning(f"[SlippageGuard] {label} refetch missed deadline ({REFETCH_DEADLINE_SEC}s)")
+                out.append((leg.odds, False))
+            elif t.exception() is not None:
+                log.warning(f"[SlippageGuard] {label} refetch error: {t.exception()}")
+                out.append((leg.odds, False))
             else:
-                async with aiohttp.ClientSession() as _s2:
-                    _events = (await _fetch_extra_books_sem(_s2, sport)
-                               if _is_extra else await _fetch_odds_sem(_s2, sport))
-                _refetch_cache[_ck] = (time.time(), _events)
-        except Exception as _ef:
-            log.warning(f"[SlippageGuard] {label} feed fetch failed: {_ef}")
-            return leg.odds, False
-        for _ev in _events:
-            _en = f"{_ev.get('home_team','')} vs {_ev.get('away_team','')}"
-            if not fuzzy_match(_en, opp.event, 0.7): continue
-            for _bm2 in _ev.get("bookmakers", []):
-                _bk = _bm2.get("key", "")
-                if not (_bk == _bm_key or leg.bookmaker.lower() in _bk.lower()): continue
-                for _mkt in _bm2.get("markets", []):
-                    if _mkt.get("key") != "h2h": continue
-                    for _out in _mkt.get("outcomes", []):
-                        if fuzzy_match(_out.get("name", ""), leg.outcome, 0.8):
-                            _price = apply_slippage(Decimal(str(_out.get("price", 1))), _bk)
-                            log.info(f"[SlippageGuard] {label} feed refetch: {float(_price):.3f}")
-                            return _price, True
-        log.warning(f"[SlippageGuard] {label} not found in feed (market suspended?)")
-        return leg.odds, False
+                out.append(t.result())
+        _refetch_ms["total"] = round((time.perf_counter() - t0) * 1000, 1)
+        log.info(f"[SlippageGuard] refetch timings {opp.event}: {_refetch_ms}")
+        return out
 
     if is_3way:
         # P1: per-leg refetch — ทุก leg รวม leg3(Draw) — fail-closed ทั้งหมด
-        live1, _f1 = await _refetch_leg(opp.leg1, opp.sport, "leg1")
-        live2, _f2 = await _refetch_leg(opp.leg2, opp.sport, "leg2")
-        live3, _f3 = await _refetch_leg(opp.leg3, opp.sport, "leg3(Draw)")
+        (live1, _f1), (live2, _f2), (live3, _f3) = await _refetch_legs([
+            ("leg1", opp.leg1, "leg1"), ("leg2", opp.leg2, "leg2"), ("leg3", opp.leg3, "leg3(Draw)"),
+        ])
         _missing = [lg for lg, fnd in [(opp.leg1.bookmaker,_f1),(opp.leg2.bookmaker,_f2),(opp.leg3.bookmaker,_f3)] if not fnd]
         if _missing:
             log.warning(f"[SlippageGuard-3way] ABORT {opp.event} — live odds unavailable: {_missing}")
@@ -3084,8 +5422,9 @@ async def execute_both(opp: ArbOpportunity) -> str:
             slippage_warn = f"\n⚠️ *Slippage Alert*: profit ลดลง {profit_drop_3:.0%} (คาด {float(opp.profit_pct):.2%} → จริง {float(live_profit3):.2%})"
     else:
         # P1: per-leg refetch — routes ตาม source (polymarket/kalshi/extra/std) — fail-closed
-        live1, _f1 = await _refetch_leg(opp.leg1, opp.sport, "leg1")
-        live2, _f2 = await _refetch_leg(opp.leg2, opp.sport, "leg2")
+        (live1, _f1), (live2, _f2) = await _refetch_legs([
+            ("leg1", opp.leg1, "leg1"), ("leg2", opp.leg2, "leg2"),
+        ])
         _missing = [lg for lg, fnd in [(opp.leg1.bookmaker,_f1),(opp.leg2.bookmaker,_f2)] if not fnd]
         if _missing:
             log.warning(f"[SlippageGuard] ABORT {opp.event} — live odds unavailable: {_missing}")
@@ -3222,17 +5561,17 @@ async def execute_both(opp: ArbOpportunity) -> str:
         leg3_team=opp.leg3.outcome if is_3way else None,
         leg3_odds=_save_od3,
         stake3_thb=int(s3) if is_3way else None,
+        refetch_ms=json.dumps(_refetch_ms),  # P16
     )
     # D1/D4: save FIRST — critical write; then mutate memory + register; opp_log is display-only best-effort
     await _async_save_trade(tr)   # raises RuntimeError if DB write fails
     with _data_lock:
         trade_records.append(tr)  # D1: only after confirmed DB write
+        _trade_changed(tr)  # P12/P13
     register_for_settlement(tr, opp.commence)  # auto settle
     register_closing_watch(opp)               # CLV watch
-    try:  # D4: best-effort — opp_log is display concern, not critical
-        await turso_exec("UPDATE opportunity_log SET status=? WHERE id=?", ("confirmed", opp.signal_id))
-    except Exception as _oe:
-        log.warning(f"[execute_both] opp_log update failed (non-critical): {_oe}")
+    learn_confirmed_legs(opp)                 # P27
+    db_update_opp_status(opp.signal_id, "confirmed")  # D4: best-effort, P9: queue เดียวกับ INSERT
 
     sp = sport_to_path(opp.sport)
     # E3: steps() รับ display_odds เพื่อโชว์ live odds แทน odds_raw
@@ -3337,6 +5676,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
             _processing.add(sid)  # C2: claim before any read or await
             vb_entry = _pending_vb.get(sid)  # C2: read AFTER claim, under same lock
+            untrack_alert(sid)  # P17: handler เป็นเจ้าของข้อความแล้ว
         try:
             if not vb_entry:
                 try: await query.edit_message_text(orig+"\n\n⚠️ Value Bet signal หมดอายุแล้ว")
@@ -3370,7 +5710,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # B2: VB slippage guard — refetch live odds ก่อน confirm (claim already held)
             try: await query.edit_message_text(orig+"\n\n⏳ *ตรวจราคาล่าสุด...*", parse_mode="Markdown")
             except Exception: pass
-            live_soft_odds, _vb_found = await refetch_valuebet_odds(vb)
+            _hot = hot_quote(sid, "vb")  # P17: quote จาก refresher ที่ยังสด → ไม่ต้องยิง network
+            if _hot is not None:
+                live_soft_odds, _vb_found = float(_hot), True
+            else:
+                live_soft_odds, _vb_found = await refetch_valuebet_odds(vb)
             _, live_edge = calc_valuebet_kelly(vb.true_odds, live_soft_odds, vb.grade)
             _retry_kb = InlineKeyboardMarkup([[
                 InlineKeyboardButton("🔄 Retry",   callback_data=f"vb_confirm:{sid}"),
@@ -3457,6 +5801,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # D2: DB committed — now safe to mutate state and notify user
             with _data_lock:
                 trade_records.append(tr_vb)
+                _trade_changed(tr_vb)  # P12/P13
                 _pending_vb.pop(sid, None)  # D2: pop AFTER save succeeds
             if vb.commence_time:
                 register_for_settlement(tr_vb, vb.commence_time)
@@ -3510,6 +5855,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         with _data_lock:
             trade_records.append(tr_lm)
+            _trade_changed(tr_lm)  # P12/P13
             _pending_lm.pop(sid, None)
         if commence:
             register_for_settlement(tr_lm, commence)
@@ -3538,6 +5884,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         _processing.add(sid)  # C1: atomic claim before any read
         entry = pending.get(sid)  # C1: read AFTER claim, under same lock
+        untrack_alert(sid)  # P17: handler เป็นเจ้าของข้อความแล้ว
     try:
         if not entry:
             with _data_lock: _processing.discard(sid)
@@ -3577,16 +5924,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # D6: DB committed — now safe to mutate state
             with _data_lock:
                 trade_records.append(tr_rej)  # only after confirmed DB write
+                _trade_changed(tr_rej)  # P12/P13
                 pending.pop(sid, None)         # D6: pop AFTER save succeeds
             # best-effort opp_log update — display concern only
             with _data_lock:
                 for _e in opportunity_log:
                     if _e["id"] == sid:
-                        _e["status"] = "rejected"; break
-            try:
-                await turso_exec("UPDATE opportunity_log SET status=? WHERE id=?", ("rejected", sid))
-            except Exception as _oe:
-                log.warning(f"[Reject] opp_log update failed (non-critical): {_oe}")
+                        _e["status"] = "rejected"
+                        publish_event("opportunity", dict(_e)); break  # P13
+            db_update_opp_status(sid, "rejected")  # P9: queue เดียวกับ INSERT
             try: await query.edit_message_text(orig+"\n\n❌ *REJECTED*", parse_mode="Markdown")
             except Exception: pass  # C8
         finally:
@@ -3603,7 +5949,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pending.pop(sid, None)  # pop หลัง execute สำเร็จเท่านั้น
             for _e in opportunity_log:
                 if _e["id"] == sid:
-                    _e["status"] = "confirmed"; break
+                    _e["status"] = "confirmed"
+                    publish_event("opportunity", dict(_e)); break  # P13
         try: await query.edit_message_text(orig+"\n\n✅ *CONFIRMED*\n\n"+result, parse_mode="Markdown")
         except Exception: pass  # C8
     except ValueError as abort_msg:
@@ -3752,12 +6099,14 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         _pending_ct  = len(pending)
         _unsettled_ct = len(_pending_settlement) + len(_manual_review_pending)  # M1: include manual review queue
         _lm_ct       = len(line_movements)
-    # C13: rotation info
-    rotation_size = int(os.getenv("SPORT_ROTATION_SIZE", "0"))
-    if rotation_size > 0 and len(SPORTS) > rotation_size:
-        rot_str = f"Rotation    : {_sport_rotation_idx}/{len(SPORTS)} (batch {rotation_size})\n"
-    else:
-        rot_str = f"Sports      : {len(SPORTS)} (all)\n"
+    # C13/P18: scheduler info — sport ที่ถึงคิว + credit ที่วางแผนใช้ถึงวัน reset
+    _plan = _sport_sched.snapshot()
+    rot_str = (f"Sports      : {len(_sport_sched.due())}/{len(SPORTS)} due | "
+               f"plan {_plan['planned_credits']}/{_plan['spendable_credits']} cr\n")
+    _bs = _book_stream.snapshot()
+    if USE_POLY_STREAM:
+        rot_str += (f"Book stream : {'🟢' if _bs['connected'] else '🔴'} "
+                    f"{_bs['live']}/{_bs['subscribed']} live | reconnects {_bs['reconnects']}\n")
     await update.message.reply_text(
         f"📊 *Deminia Bot V.4*\n"
         f"━━━━━━━━━━━━━━━━━━━━\n"
@@ -3804,7 +6153,7 @@ async def cmd_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     _now_last_ts = time.time()
     await update.message.reply_text("🔍 *กำลังสแกน...*", parse_mode="Markdown")
-    count = await do_scan()
+    count = await do_scan(manual=True)
     msg = f"✅ พบ *{count}* opportunity" if count else f"✅ ไม่พบ > {MIN_PROFIT_PCT:.1%}"
     await update.message.reply_text(msg, parse_mode="Markdown")
 
@@ -3848,64 +6197,63 @@ async def cmd_debug(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # fetch 1 sport test
     test_sport = SPORTS[0] if SPORTS else "basketball_nba"
     try:
-        import aiohttp as _aio
-        async with _aio.ClientSession() as _sess:
-            url = f"https://api.the-odds-api.com/v4/sports/{test_sport}/odds"
-            params = {
-                "apiKey": ODDS_API_KEY, "regions": "eu,uk,au",
-                "markets": "h2h", "oddsFormat": "decimal",
-                "bookmakers": BOOKMAKERS,
-            }
-            async with _sess.get(url, params=params, timeout=_aio.ClientTimeout(total=15)) as r:
-                rem  = r.headers.get("x-requests-remaining", "?")
-                data = await r.json(content_type=None)
-                if r.status == 422:
-                    lines.append(f"❌ `{test_sport}`: sport key ไม่ถูกต้อง (422)")
-                elif r.status == 429:
-                    lines.append(f"❌ Rate limited (429) — request เร็วเกินไป")
-                elif r.status != 200:
-                    lines.append(f"❌ API Error `{r.status}`: `{data.get('message','?') if isinstance(data,dict) else '?'}`")
-                elif isinstance(data, list):
-                    bm_seen: set = set()
-                    for ev in data:
-                        for bm in ev.get("bookmakers", []):
-                            bm_seen.add(bm["key"])
-                    from decimal import Decimal as _D
-                    bm_list = [b.strip() for b in BOOKMAKERS.split(",")]
-                    arb_ct = 0
-                    best_margin = Decimal("999")
-                    for ev in data:
-                        bms = {bm["key"]: bm for bm in ev.get("bookmakers", [])}
-                        found_bms = [b for b in bm_list if b in bms]
-                        if len(found_bms) < 2: continue
-                        for bm_a in found_bms:
-                            for bm_b in found_bms:
-                                if bm_a >= bm_b: continue
-                                for mk_a in bms[bm_a].get("markets", []):
-                                    for oc_a in mk_a.get("outcomes", []):
-                                        for mk_b in bms[bm_b].get("markets", []):
-                                            for oc_b in mk_b.get("outcomes", []):
-                                                if oc_a.get("name") != oc_b.get("name"):
-                                                    oa = _D(str(oc_a.get("price", 1)))
-                                                    ob = _D(str(oc_b.get("price", 1)))
-                                                    if oa > 1 and ob > 1:
-                                                        mg = _D("1")/oa + _D("1")/ob
-                                                        if mg < best_margin: best_margin = mg
-                                                        if mg < 1: arb_ct += 1
-                    lines.append(f"*📊 {test_sport}*")
-                    lines.append(f"   Events     : *{len(data)}*")
-                    lines.append(f"   Credits    : `{rem}` remaining")
-                    lines.append(f"   BMs found  : `{', '.join(sorted(bm_seen)) if bm_seen else 'NONE'}`")
-                    miss = [b for b in bm_list if b not in bm_seen]
-                    if miss:
-                        lines.append(f"   ⚠️ Missing : `{', '.join(miss)}` — ไม่มีในภูมิภาค eu/uk/au")
-                    lines.append(f"   Arb opps   : *{arb_ct}*")
-                    if best_margin < 999 and arb_ct == 0:
-                        lines.append(f"   Best margin: `{float(best_margin):.4f}` (ต้อง <1.0 ถึงจะมี arb)")
-                    if arb_ct == 0 and len(data) > 0:
-                        lines.append(f"   ℹ️ Normal — market efficient ไม่มี arb ตอนนี้")
-                    if len(data) == 0:
-                        lines.append(f"   ⚠️ sport key `{test_sport}` ไม่มีแมตช์ในขณะนี้")
+        _sess = get_http_session()  # P5: pooled session
+        url = f"https://api.the-odds-api.com/v4/sports/{test_sport}/odds"
+        params = {
+            "apiKey": ODDS_API_KEY, "regions": "eu,uk,au",
+            "markets": "h2h", "oddsFormat": "decimal",
+            "bookmakers": BOOKMAKERS,
+        }
+        async with _sess.get(url, params=params, timeout=aiohttp.ClientTimeout(total=15)) as r:
+            rem  = r.headers.get("x-requests-remaining", "?")
+            data = await r.json(content_type=None)
+            if r.status == 422:
+                lines.append(f"❌ `{test_sport}`: sport key ไม่ถูกต้อง (422)")
+            elif r.status == 429:
+                lines.append(f"❌ Rate limited (429) — request เร็วเกินไป")
+            elif r.status != 200:
+                lines.append(f"❌ API Error `{r.status}`: `{data.get('message','?') if isinstance(data,dict) else '?'}`")
+            elif isinstance(data, list):
+                bm_seen: set = set()
+                for ev in data:
+                    for bm in ev.get("bookmakers", []):
+                        bm_seen.add(bm["key"])
+                from decimal import Decimal as _D
+                bm_list = [b.strip() for b in BOOKMAKERS.split(",")]
+                arb_ct = 0
+                best_margin = Decimal("999")
+                for ev in data:
+                    bms = {bm["key"]: bm for bm in ev.get("bookmakers", [])}
+                    found_bms = [b for b in bm_list if b in bms]
+                    if len(found_bms) < 2: continue
+                    for bm_a in found_bms:
+                        for bm_b in found_bms:
+                            if bm_a >= bm_b: continue
+                            for mk_a in bms[bm_a].get("markets", []):
+                                for oc_a in mk_a.get("outcomes", []):
+                                    for mk_b in bms[bm_b].get("markets", []):
+                                        for oc_b in mk_b.get("outcomes", []):
+                                            if oc_a.get("name") != oc_b.get("name"):
+                                                oa = _D(str(oc_a.get("price", 1)))
+                                                ob = _D(str(oc_b.get("price", 1)))
+                                                if oa > 1 and ob > 1:
+                                                    mg = _D("1")/oa + _D("1")/ob
+                                                    if mg < best_margin: best_margin = mg
+                                                    if mg < 1: arb_ct += 1
+                lines.append(f"*📊 {test_sport}*")
+                lines.append(f"   Events     : *{len(data)}*")
+                lines.append(f"   Credits    : `{rem}` remaining")
+                lines.append(f"   BMs found  : `{', '.join(sorted(bm_seen)) if bm_seen else 'NONE'}`")
+                miss = [b for b in bm_list if b not in bm_seen]
+                if miss:
+                    lines.append(f"   ⚠️ Missing : `{', '.join(miss)}` — ไม่มีในภูมิภาค eu/uk/au")
+                lines.append(f"   Arb opps   : *{arb_ct}*")
+                if best_margin < 999 and arb_ct == 0:
+                    lines.append(f"   Best margin: `{float(best_margin):.4f}` (ต้อง <1.0 ถึงจะมี arb)")
+                if arb_ct == 0 and len(data) > 0:
+                    lines.append(f"   ℹ️ Normal — market efficient ไม่มี arb ตอนนี้")
+                if len(data) == 0:
+                    lines.append(f"   ⚠️ sport key `{test_sport}` ไม่มีแมตช์ในขณะนี้")
     except Exception as e:
         lines.append(f"❌ fetch error: `{e}`")
 
@@ -4014,6 +6362,7 @@ async def cmd_trade(update: Update, context: ContextTypes.DEFAULT_TYPE):
     now_dt = datetime.now(timezone.utc)
     with _data_lock:
         trade_records.append(trade)
+        _trade_changed(trade)  # P12/P13
         _pending_settlement[sid] = (trade, now_dt)
     await update.message.reply_text(
         f"✅ *Trade บันทึกแล้ว*\n"
@@ -4146,10 +6495,203 @@ async def cmd_settle(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ══════════════════════════════════════════════════════════════════
 #  SCAN CORE
 # ══════════════════════════════════════════════════════════════════
-_sport_rotation_idx = 0  # v10-14: pointer สำหรับ rotation
+# ── P18: Adaptive sport scheduler ──────────────────────────────────
+# แทน SPORT_ROTATION_SIZE (batch ตายตัว): แบ่ง credit ตามคะแนนของแต่ละ sport
+#   yield (opportunity ใน SCHED_YIELD_DAYS วัน) + แมตช์ที่เริ่มภายใน SCHED_SOON_HOURS + line move ล่าสุด
+# budget = (api_remaining - SCHED_RESERVE_CREDITS) กระจายเท่าๆ กันจนถึงวัน reset quota (QUOTA_RESET_DAY)
+# → sport ไหนได้ share มาก interval สั้น, league ที่ไม่มีแมตช์/ไม่เคยมี arb ถูกยืดไปถึง SCHED_MAX_INTERVAL_SEC
+QUOTA_RESET_DAY        = _i("QUOTA_RESET_DAY",        1)     # วันที่ของเดือนที่ Odds API reset credit (UTC)
+SCHED_RESERVE_CREDITS  = _i("SCHED_RESERVE_CREDITS",  50)    # กันไว้ให้ confirm refetch / CLV / quote refresher
+SCHED_MAX_INTERVAL_SEC = _i("SCHED_MAX_INTERVAL_SEC", 6 * 3600)
+SCHED_YIELD_DAYS       = _i("SCHED_YIELD_DAYS",       14)
+SCHED_SOON_HOURS       = _i("SCHED_SOON_HOURS",       6)
+SCHED_VOL_HOURS        = _i("SCHED_VOL_HOURS",        3)
+# P19: kickoff-proximity tiers — steam/RLM/arb ส่วนใหญ่เกิดชั่วโมงสุดท้ายก่อน commence_time
+#   fast   = มีแมตช์เริ่มภายใน FAST_LANE_MIN นาที → interval ขั้นต่ำ FAST_SCAN_INTERVAL
+#   normal = มีแมตช์ภายใน SCHED_SOON_HOURS       → interval ขั้นต่ำ SCAN_INTERVAL
+#   slow   = แมตช์อยู่ไกลกว่านั้นทั้งหมด           → interval ขั้นต่ำ SLOW_SCAN_INTERVAL
+# ทุก tier ยังกิน budget ก้อนเดียวกัน (P18) — fast lane ได้ credit ที่ slow tier ใช้ไม่หมด ไม่ได้เพิ่ม spend รวม
+FAST_LANE_MIN          = _i("FAST_LANE_MIN",          60)
+FAST_SCAN_INTERVAL     = _i("FAST_SCAN_INTERVAL",     60)
+SLOW_SCAN_INTERVAL     = _i("SLOW_SCAN_INTERVAL",     1800)
+SCAN_TIERS             = ("fast", "normal", "slow")
+
+
+def _next_quota_reset(now: datetime) -> datetime:
+    day = max(1, min(28, QUOTA_RESET_DAY))
+    reset = now.replace(day=day, hour=0, minute=0, second=0, microsecond=0)
+    if reset <= now:
+        reset = (reset.replace(day=1) + timedelta(days=32)).replace(day=day)
+    return reset
+
+
+class SportScheduler:
+    """P18: วางแผนว่า sport ไหนถึงคิว scan — เรียกจาก main loop เท่านั้น (ไม่ต้องใช้ _data_lock)
+    score = 1 + 3·yield + 2·soon + 1·volatility + 4·fast (แต่ละตัว normalize เทียบ sport ที่มากสุด)
+    sport ที่ scan ล่าสุดไม่มี event เลย (off-season) → score × 0.25
+    P19: interval แต่ละ sport อยู่ในช่วง [floor ของ tier, SCHED_MAX_INTERVAL_SEC]
+    """
+    W_YIELD, W_SOON, W_VOL, W_FAST = 3.0, 2.0, 1.0, 4.0
+    DEAD_FACTOR = 0.25
+
+    def __init__(self):
+        self._opps:  dict[str, deque] = defaultdict(deque)   # sport → ts ของ opportunity
+        self._moves: dict[str, deque] = defaultdict(deque)   # sport → ts ของ line movement
+        self._commence: dict[str, list[float]] = {}          # sport → commence ts (sorted) จาก scan ล่าสุด
+        self._last_scan: dict[str, float] = {}
+        self._call_cost: dict[str, dict[str, int]] = defaultdict(dict)  # sport → endpoint → credit ต่อ call
+
+    # ── signals ──────────────────────────────────────────────────
+    def note_opportunity(self, sport: str, ts: Optional[float] = None):
+        self._opps[sport].append(ts if ts is not None else time.time())
+
+    def note_move(self, sport: str):
+        self._moves[sport].append(time.time())
+
+    def note_call_cost(self, endpoint: str, sport: str, credits: int):
+        """credit ที่ Odds API คิดต่อ call (header x-requests-last) — 1 scan = ผลรวมทุก endpoint ของ sport"""
+        self._call_cost[sport][endpoint] = max(0, credits)
+
+    def note_scan(self, sport: str, events: list):
+        ts = []
+        for ev in events:
+            try: ts.append(parse_commence(ev.get("commence_time", "")).timestamp())
+            except Exception: pass
+        ts.sort()
+        self._commence[sport] = ts
+        self._last_scan[sport] = time.time()
+
+    def seed_opportunities(self, rows: list):
+        """rows = [(sport, created_at)] จาก opportunity_log ใน DB — เรียกครั้งเดียวตอน startup"""
+        for sport, created in sorted(rows, key=lambda r: r[1] or ""):
+            try: self.note_opportunity(sport, _parse_settled_at(created).timestamp())
+            except Exception: pass
+
+    # ── planning ─────────────────────────────────────────────────
+    def _scan_cost(self, sport: str) -> float:
+        known = self._call_cost.get(sport)
+        if known:
+            return float(sum(known.values()))
+        return 1.0 + (1.0 if _EXTRA_ODDS_API_BMS else 0.0)  # ยังไม่เคยเห็น header — h2h 1 region ต่อ call
+
+    def _trim(self, now: float):
+        for store, horizon in ((self._opps, SCHED_YIELD_DAYS * 86400), (self._moves, SCHED_VOL_HOURS * 3600)):
+            for dq in store.values():
+                while dq and now - dq[0] > horizon:
+                    dq.popleft()
+
+    def plan(self, sports: Optional[list[str]] = None, now: Optional[float] = None) -> dict:
+        sports = list(sports if sports is not None else SPORTS)
+        now = now if now is not None else time.time()
+        self._trim(now)
+        soon_end = now + SCHED_SOON_HOURS * 3600
+        fast_end = now + FAST_LANE_MIN * 60
+        raw = {}
+        tiers: dict[str, str] = {}
+        for s in sports:
+            cts = self._commence.get(s, [])
+            i0 = bisect_left(cts, now)
+            soon = bisect_left(cts, soon_end) - i0
+            fast = bisect_left(cts, fast_end) - i0
+            raw[s] = (len(self._opps.get(s, ())), soon, len(self._moves.get(s, ())), fast)
+            # ยังไม่เคย scan → normal จนกว่าจะรู้ commence_time
+            tiers[s] = "fast" if fast else ("normal" if soon or s not in self._commence else "slow")
+        mx = [max((r[i] for r in raw.values()), default=0) or 1 for i in range(4)]
+        scores = {}
+        for s, (y, soon, vol, fast) in raw.items():
+            sc = (1.0 + self.W_YIELD * y / mx[0] + self.W_SOON * soon / mx[1]
+                  + self.W_VOL * vol / mx[2] + self.W_FAST * fast / mx[3])
+            if s in self._commence and not self._commence[s]:
+                sc *= self.DEAD_FACTOR
+            scores[s] = sc
+        reset = _next_quota_reset(datetime.now(timezone.utc))
+        secs_left = max(3600.0, reset.timestamp() - now)
+        spendable = max(0, api_remaining - SCHED_RESERVE_CREDITS)
+        rate = spendable / secs_left                      # credit/วินาที ที่ใช้ได้จนถึง reset
+        costs = {s: self._scan_cost(s) for s in sports}
+        hi = float(SCHED_MAX_INTERVAL_SEC)
+        floor = {"fast": FAST_SCAN_INTERVAL, "normal": SCAN_INTERVAL, "slow": SLOW_SCAN_INTERVAL}
+        lo = {s: min(float(floor[tiers[s]]), hi) for s in sports}
+        # water-filling: sport ที่ share ได้ interval นอกช่วง [lo, hi] ถูก pin ที่ขอบ แล้วหัก credit ส่วนนั้นออก
+        # ชน hi (share น้อยเกิน) → บังคับ scan ทุก hi, ชน lo (share เกิน floor ของ tier) → ส่วนเกินคืนให้ sport อื่น
+        # วนจนไม่มีใคร pin เพิ่ม — แผนรวมไม่เกิน budget (ยกเว้นทุกตัวชน hi)
+        intervals: dict[str, float] = {}
+        free = set(sports)
+        while free:
+            total = sum(scores[s] for s in free)
+            pinned = {}
+            for s in free:
+                iv = costs[s] * total / (rate * scores[s]) if rate > 0 else hi
+                if iv >= hi:
+                    pinned[s] = hi
+                elif iv < lo[s]:
+                    pinned[s] = lo[s]
+            if not pinned:
+                break
+            for s, iv in pinned.items():
+                intervals[s] = iv
+                rate -= costs[s] / iv
+                free.discard(s)
+        total = sum(scores[s] for s in free)
+        for s in free:
+            intervals[s] = min(max(costs[s] * total / (rate * scores[s]), lo[s]), hi)
+        out = {}
+        for s in sports:
+            cost, interval = costs[s], intervals[s]
+            last = self._last_scan.get(s)
+            y, soon, vol, fast = raw[s]
+            out[s] = {
+                "tier":           tiers[s],
+                "events_fast":    fast,
+                "score":          round(scores[s], 3),
+                "yield":          y,
+                "events_soon":    soon,
+                "volatility":     vol,
+                "credits_per_scan": round(cost, 2),
+                "interval_sec":   int(interval),
+                "last_scan":      last,
+                "next_scan":      (last + interval) if last else now,
+                "planned_credits": int(cost * secs_left / interval),
+            }
+        return out
+
+    def due(self, sports: Optional[list[str]] = None) -> list[str]:
+        now = time.time()
+        p = self.plan(sports, now)
+        return sorted((s for s, v in p.items() if v["next_scan"] <= now),
+                      key=lambda s: -p[s]["score"])
+
+    def tier_wakeups(self) -> dict[str, float]:
+        """P19: วินาทีจนถึง sport แรกที่ถึงคิวในแต่ละ tier (tier ที่ไม่มี sport ไม่อยู่ใน dict)"""
+        now = time.time()
+        out: dict[str, float] = {}
+        for v in self.plan(now=now).values():
+            wait = max(0.0, v["next_scan"] - now)
+            out[v["tier"]] = min(out.get(v["tier"], wait), wait)
+        return out
+
+    def snapshot(self) -> dict:
+        """สำหรับ /api/state — แผนราย sport + budget ถึงวัน reset"""
+        p = self.plan()
+        reset = _next_quota_reset(datetime.now(timezone.utc))
+        return {
+            "quota_reset_at":  reset.isoformat(),
+            "reserve_credits": SCHED_RESERVE_CREDITS,
+            "spendable_credits": max(0, api_remaining - SCHED_RESERVE_CREDITS),
+            "planned_credits": sum(v["planned_credits"] for v in p.values()),
+            "tiers": {t: [s for s, v in p.items() if v["tier"] == t] for t in SCAN_TIERS},  # P19
+            "sports": {s: {**v, "next_scan": datetime.fromtimestamp(v["next_scan"], timezone.utc).isoformat(),
+                           "last_scan": (datetime.fromtimestamp(v["last_scan"], timezone.utc).isoformat()
+                                         if v["last_scan"] else None)}
+                       for s, v in p.items()},
+        }
+
 
-async def do_scan() -> int:
-    global scan_count, last_scan_time, _sport_rotation_idx, _scan_in_progress, auto_scan, _last_error
+_sport_sched = SportScheduler()
+
+async def do_scan(manual: bool = False) -> int:
+    """manual=True (/now, dashboard) → scan ทุก sport; scanner_loop → เฉพาะ sport ที่ถึงคิวตาม P18 scheduler"""
+    global scan_count, last_scan_time, _scan_in_progress, auto_scan, _last_error
     # B3r: safe-mode guard — block scan when DB writes halted
     if _db_write_halted:
         log.warning("[Scan] _db_write_halted=True — scan blocked (safe-mode)")
@@ -4209,40 +6751,50 @@ async def do_scan() -> int:
                         )
                 return 0
 
-        # v10-14: Sport Rotation — scan sports เป็นกลุ่มๆ ประหยัด quota
-        rotation_size = int(os.getenv("SPORT_ROTATION_SIZE", "0"))
-        if rotation_size > 0 and len(SPORTS) > rotation_size:
-            batch = SPORTS[_sport_rotation_idx: _sport_rotation_idx + rotation_size]
-            if not batch:  # wrap around
-                _sport_rotation_idx = 0
-                batch = SPORTS[:rotation_size]
-            _sport_rotation_idx = (_sport_rotation_idx + rotation_size) % len(SPORTS)
-            scan_sports = batch
-            log.debug(f"[Rotation] scanning {scan_sports} ({_sport_rotation_idx}/{len(SPORTS)})")
-        else:
-            scan_sports = SPORTS  # scan ทั้งหมด (default)
-        odds_by_sport, poly_markets = await fetch_all_async(scan_sports)
-
-        # B7: await detect_line_movements ไม่ใช้ create_task — ป้องกัน race condition
-        await detect_line_movements(odds_by_sport, poly_markets)
-
-        all_opps = scan_all(odds_by_sport, poly_markets)
+        # P18: adaptive scheduler แทน v10-14 Sport Rotation — scan เฉพาะ sport ที่ถึงคิว
+        scan_sports = list(SPORTS) if manual else _sport_sched.due()
+        if not scan_sports:
+            log.debug("[Sched] no sport due")
+            return 0
+        log.debug(f"[Sched] scanning {scan_sports}")
         sent = 0
         _SEEN_TTL = SEEN_TTL_SEC  # อ่านจาก env SEEN_TTL_SEC (default 4h)
-        _now_ts = time.time()
-        for opp in sorted(all_opps, key=lambda x: x.profit_pct, reverse=True):
-            _mtype = "3way" if (opp.leg3 is not None) else "2way"
-            _l3bm  = opp.leg3.bookmaker if opp.leg3 else "-"
-            key = f"{_mtype}|{opp.event}|{opp.leg1.bookmaker}|{opp.leg2.bookmaker}|{_l3bm}"
-            with _data_lock:
-                last_seen = seen_signals.get(key, 0)
-                is_new = (_now_ts - last_seen) > _SEEN_TTL
+        _pinnacle_seen: set[str] = set()  # F2: สะสมข้ามทุก sport ใน scan นี้
+        # P6: streaming — วิเคราะห์ + alert ทีละ sport ทันทีที่ odds ของ sport นั้นมาถึง
+        #     sport อาจมา 2 รอบ: รอบแรก (Odds API อย่างเดียว) หาแค่ arb ระหว่าง book; line move รอรอบ final
+        #     ที่มี Polymarket liquidity — ไม่งั้น odds_history อัปเดตไปแล้ว move จะไม่ถูกจับซ้ำพร้อม liquidity
+        _early_alerted: set[tuple[str, str]] = set()  # (market type, event) ที่ alert ในรอบแรกแล้ว
+        async for sport, events, poly_markets, final in stream_fetch_async(scan_sports):
+            odds_by_sport = {sport: events}
+            if final:
+                _sport_sched.note_scan(sport, events)  # P18
+                # B7: await detect_line_movements ไม่ใช้ create_task — ป้องกัน race condition
+                await detect_line_movements(odds_by_sport, poly_markets, pinnacle_seen=_pinnacle_seen)
+
+            all_opps = scan_all(odds_by_sport, poly_markets)
+            _now_ts = time.time()
+            for opp in sorted(all_opps, key=lambda x: x.profit_pct, reverse=True):
+                _mtype = "3way" if (opp.leg3 is not None) else "2way"
+                _l3bm  = opp.leg3.bookmaker if opp.leg3 else "-"
+                key = f"{_mtype}|{opp.event}|{opp.leg1.bookmaker}|{opp.leg2.bookmaker}|{_l3bm}"
+                with _data_lock:
+                    last_seen = seen_signals.get(key, 0)
+                    is_new = (_now_ts - last_seen) > _SEEN_TTL
+                    # alert รอบแรกของ event/market นี้ยืนแทน — combo ใหม่ในรอบ final (Polymarket/Cloudbet leg)
+                    # ไม่ alert ซ้ำ แต่จำ key ไว้ไม่ให้ scan ถัดไปเด้งเป็น signal ใหม่
+                    if is_new:
+                        seen_signals[key] = _now_ts
+                if is_new and final and (_mtype, opp.event) in _early_alerted:
+                    log.debug(f"[Scan] {opp.event} already alerted from early pass — skip {key}")
+                    continue
+                if is_new and not final:
+                    _early_alerted.add((_mtype, opp.event))
                 if is_new:
-                    seen_signals[key] = _now_ts
-            if is_new:
-                await send_alert(opp)
-                await asyncio.sleep(1)
-                sent += 1
+                    await send_alert(opp)
+                    await asyncio.sleep(1)
+                    sent += 1
+        await detect_pinnacle_suspensions(_pinnacle_seen)
+        _now_ts = time.time()
         with _data_lock:
             # prune expired entries เพื่อไม่ให้ dict โต
             expired = [k for k, ts in seen_signals.items() if (_now_ts - ts) > _SEEN_TTL]
@@ -4251,6 +6803,7 @@ async def do_scan() -> int:
         scan_count    += 1
         last_scan_time = datetime.now(timezone.utc).strftime("%d/%m %H:%M UTC")
         _last_error = ""  # F4: เคลียร์ error เก่าหลัง scan สำเร็จ
+        publish_scan_completed()  # P13
         save_snapshot()   # 💾 บันทึก state
         return sent
     except Exception as e:
@@ -4258,6 +6811,7 @@ async def do_scan() -> int:
         log.error(f"[Scan] error: {e}", exc_info=True)
         return 0
     finally:
+        _alias_store.flush()  # P27: alias ที่เรียนระหว่าง scan มีผลตั้งแต่ scan ถัดไป
         _scan_lock.release()  # B2: always release manually-acquired lock
 
 
@@ -4291,34 +6845,31 @@ async def watch_closing_lines():
                 await asyncio.sleep(300)
                 continue
             if to_fetch:
-                async with aiohttp.ClientSession() as session:
-                    for key, info in to_fetch:
-                        sport  = info["sport"]
-                        # L6: fetch standard + extra (Odds API stake) + Cloudbet native for closing lines
-                        std_ev   = await _fetch_odds_sem(session, sport)
-                        extra_ev = await _fetch_extra_books_sem(session, sport) if _EXTRA_ODDS_API_BMS else []
-                        # C9: fetch Cloudbet native for CLV
-                        cb_ev    = await async_fetch_cloudbet(session, [sport]) if USE_CLOUDBET else []
-                        # R2: fuzzy merge extra + cloudbet events
-                        events = list(std_ev)
-                        for _ex_ev in (extra_ev + cb_ev):
-                            _ex_name = f"{_ex_ev.get('home_team','')} vs {_ex_ev.get('away_team','')}"
-                            _merged = False
-                            for _st_ev in events:
-                                _st_name = f"{_st_ev.get('home_team','')} vs {_st_ev.get('away_team','')}"
-                                if fuzzy_match(_ex_name, _st_name, 0.80):
-                                    _exist_bms = {_b["key"] for _b in _st_ev.get("bookmakers", [])}
-                                    for _b in _ex_ev.get("bookmakers", []):
-                                        if _b["key"] not in _exist_bms:
-                                            _st_ev.setdefault("bookmakers", []).append(_b)
-                                    _merged = True
-                                    break
-                            if not _merged:
-                                events.append(_ex_ev)
-                        matched_any = False       # S4: aggregate flags แทน per-event
-                        pinnacle_found_any = False  # S4: ถ้ามี Pinnacle ใน event ใดก็ตาม → True
-                        for event in events:
-                            ename = f"{event.get('home_team','')} vs {event.get('away_team','')}"
+                session = get_http_session()  # P5: pooled
+                for key, info in to_fetch:
+                    sport  = info["sport"]
+                    # L6: fetch standard + extra (Odds API stake) + Cloudbet native for closing lines
+                    std_ev   = await _fetch_odds_sem(session, sport)
+                    extra_ev = await _fetch_extra_books_sem(session, sport) if _EXTRA_ODDS_API_BMS else []
+                    # C9: fetch Cloudbet native for CLV
+                    cb_ev    = await _fetch_cloudbet_sf(session, [sport]) if USE_CLOUDBET else []
+                    # R2/P23: merge extra + cloudbet events ผ่าน registry (ฟังก์ชันเดียวกับ scan)
+                    _by_sport = {sport: std_ev}
+                    _merge_extra_events(_by_sport, {sport: extra_ev + cb_ev})
+                    events = _by_sport[sport]
+                    matched_any = False       # S4: aggregate flags แทน per-event
+                    pinnacle_found_any = False  # S4: ถ้ามี Pinnacle ใน event ใดก็ตาม → True
+                    _commence = info["commence_dt"].isoformat()
+                    _cid = _event_registry.lookup_name(sport, info["event"], _commence)  # P23
+                    _hits = {id(e) for e in events if _cid is not None and _event_registry.cid_of(e) == _cid}
+                    for event in events:
+                        pe    = parse_event(event)  # P28
+                        ename = pe.name
+                        if _hits:
+                            if id(event) not in _hits: continue
+                        elif not _event_registry.same_slot(_commence, event.get("commence_time", "")):
+                            continue  # P23: game อื่นของคู่เดียวกัน
+                        else:
                             # E6: fuzzy match — ตรวจ token overlap แทน string ตรง ทน alias/punctuation
                             _tgt = info["event"].lower()
                             _src = ename.lower()
@@ -4326,34 +6877,28 @@ async def watch_closing_lines():
                             _src_tokens = set(re.split(r'[\s\-_/]+', _src))
                             _overlap = len(_tgt_tokens & _src_tokens) / max(len(_tgt_tokens), 1)
                             if _overlap < 0.6 and ename != info["event"]: continue
-                            _ev_pinnacle = False
-                            for bm in event.get("bookmakers", []):
-                                bk = bm.get("key","")
-                                for mkt in bm.get("markets",[]):
-                                    if mkt.get("key") != "h2h": continue
-                                    for out in mkt.get("outcomes",[]):
-                                        price = Decimal(str(out.get("price",1)))
-                                        # M2: canonical key; N3: normalize Draw/Tie outcome
-                                        _out_name = out.get("name", "")
-                                        _norm_name = "Draw" if str(_out_name).strip().lower() in ("draw", "tie", "x") else _out_name
-                                        update_clv(info["event"], _norm_name, bk, price)
-                                        if bk == "pinnacle":
-                                            _ev_pinnacle = True
-                            matched_any = True
-                            if _ev_pinnacle:
-                                pinnacle_found_any = True
-                            if not _ev_pinnacle:
-                                log.warning(f"[CLV] ⚠️ Pinnacle closing line missing for {ename} — CLV benchmark unreliable")
-                            log.info(f"[CLV] closing line saved: {ename} (pinnacle={'✅' if _ev_pinnacle else '❌'})")
-                        # S4/R3: mark done ต่อเมื่อ match >=1 event AND มี Pinnacle ใน event ใดก็ตาม
-                        if matched_any and pinnacle_found_any:
-                            with _data_lock:
-                                if key in _closing_line_watch:
-                                    _closing_line_watch[key]["done"] = True
-                        elif matched_any and not pinnacle_found_any:
-                            log.warning(f"[CLV] Pinnacle line missing for {info['event']} — will retry next window")
-                        else:
-                            log.warning(f"[CLV] fetch returned no match for {info['event']} — will retry")
+                        _ev_pinnacle = False
+                        for q in pe.quotes:
+                            # M2: canonical key; N3: normalize Draw/Tie outcome
+                            _norm_name = "Draw" if q.name_lc.strip() in ("draw", "tie", "x") else q.name
+                            update_clv(info["event"], _norm_name, q.bm_key, q.odds)
+                            if q.bm_key == "pinnacle":
+                                _ev_pinnacle = True
+                        matched_any = True
+                        if _ev_pinnacle:
+                            pinnacle_found_any = True
+                        if not _ev_pinnacle:
+                            log.warning(f"[CLV] ⚠️ Pinnacle closing line missing for {ename} — CLV benchmark unreliable")
+                        log.info(f"[CLV] closing line saved: {ename} (pinnacle={'✅' if _ev_pinnacle else '❌'})")
+                    # S4/R3: mark done ต่อเมื่อ match >=1 event AND มี Pinnacle ใน event ใดก็ตาม
+                    if matched_any and pinnacle_found_any:
+                        with _data_lock:
+                            if key in _closing_line_watch:
+                                _closing_line_watch[key]["done"] = True
+                    elif matched_any and not pinnacle_found_any:
+                        log.warning(f"[CLV] Pinnacle line missing for {info['event']} — will retry next window")
+                    else:
+                        log.warning(f"[CLV] fetch returned no match for {info['event']} — will retry")
         except Exception as e:
             log.error(f"[CLV] watch_closing_lines crash: {e}", exc_info=True)
 
@@ -4434,10 +6979,7 @@ async def fetch_scores(sport: str, session: Optional[aiohttp.ClientSession] = No
             data = await r.json(content_type=None)
             return data if isinstance(data, list) else []
     try:
-        if session:
-            return await _fetch(session)
-        async with aiohttp.ClientSession() as s:
-            return await _fetch(s)
+        return await _fetch(session or get_http_session())
     except Exception as e:
         log.error(f"[Settle] fetch_scores {sport}: {e}")
         return []
@@ -4599,6 +7141,7 @@ async def _commit_settlement(trade: "TradeRecord", actual_profit: int) -> "Trade
         if not _found:  # R2: fallback append — only if signal truly absent (avoid dup on trim race)
             if not any(r.signal_id == saved.signal_id for r in trade_records):
                 trade_records.append(saved)
+        _trade_changed(saved)  # P12/P13
         if saved.signal_id in _pending_settlement:
             _old_dt = _pending_settlement[saved.signal_id][1]
             _pending_settlement[saved.signal_id] = (saved, _old_dt)
@@ -4626,6 +7169,7 @@ async def _commit_manual_review(trade: "TradeRecord", commence_dt: "datetime") -
         if not _found:  # R2: fallback append — only if signal truly absent (avoid dup on trim race)
             if not any(r.signal_id == saved.signal_id for r in trade_records):
                 trade_records.append(saved)
+        _trade_changed(saved)  # P12/P13
         _pending_settlement.pop(saved.signal_id, None)
         _manual_review_pending[saved.signal_id] = (saved, commence_dt)
     return saved
@@ -4670,11 +7214,11 @@ async def settle_completed_trades():
             sports_needed = set(trade.sport for trade, _ in ready.values())
             all_scores: dict[str, list] = {}
 
-            async with aiohttp.ClientSession() as session:
-                for sport in sports_needed:
-                    scores = await fetch_scores(sport, session=session)
-                    all_scores[sport] = scores
-                    await asyncio.sleep(1)  # ไม่ spam API
+            session = get_http_session()  # P5: pooled
+            for sport in sports_needed:
+                scores = await fetch_scores(sport, session=session)
+                all_scores[sport] = scores
+                await asyncio.sleep(1)  # ไม่ spam API
 
             processed_ids = []  # trades removed from _pending_settlement this cycle (settled or escalated)
             for signal_id in list(ready):
@@ -4701,7 +7245,22 @@ async def settle_completed_trades():
                     # หา event ที่ตรงกัน
                     sport_scores = all_scores.get(trade.sport, [])
                     matched_event = None
-                    for ev in sport_scores:
+                    # P23: scores ใช้ Odds API id ชุดเดียวกับ odds → canonical id เป็น dict hit
+                    _cid = _event_registry.lookup_name(trade.sport, trade.event, trade.commence_time)
+                    if _cid is not None:
+                        matched_event = next((ev for ev in sport_scores
+                                              if _event_registry.cid_of(ev) == _cid), None)
+                        _ev_parts = trade.event.split(" vs ")
+                        if matched_event is not None and len(_ev_parts) == 2:
+                            # P27: registry exact (id ของ scores ผูกกับ cid ของ trade) — เรียน alias ได้
+                            _alias_store.learn_pair(matched_event.get("home_team", ""),
+                                                    matched_event.get("away_team", ""),
+                                                    _ev_parts[0].strip(), _ev_parts[1].strip(), "settle")
+                            _alias_flush_if_idle()
+                    # scores id ยังไม่ผูกกับ cid (event มาจาก source อื่น) → fuzzy fallback พร้อม commence guard
+                    for ev in (sport_scores if matched_event is None else ()):
+                        if not _event_registry.same_slot(trade.commence_time, ev.get("commence_time", "")):
+                            continue  # P23: ชื่อทีมเดียวกันคนละวัน (series) — ไม่ใช่ game ของ trade นี้
                         home = ev.get("home_team", "")
                         away = ev.get("away_team", "")
                         # R6/Issue29: guard ก่อน split — event อาจไม่มี " vs " (Tennis/MMA)
@@ -4713,7 +7272,7 @@ async def settle_completed_trades():
                         _away_part = _ev_parts[-1].strip()
                         if fuzzy_match(home, _home_part, 0.5) and \
                            fuzzy_match(away, _away_part, 0.5):
-                            matched_event = ev
+                            matched_event = ev  # P27: ไม่ learn alias — 0.5 หลวมเกินจะจำถาวร
                             break
 
                     if not matched_event:
@@ -4900,6 +7459,7 @@ def periodic_cleanup():
     with _data_lock:
         # trim trade_records ใน memory (DB ยังเก็บทั้งหมด)
         if len(trade_records) > 500:
+            _stats_agg.remove_trades(trade_records[:-500])  # P12
             trade_records[:] = trade_records[-500:]
         # ลบ cooldown entries ที่หมดอายุ
         expired = [k for k, v in alert_cooldown.items()
@@ -4923,11 +7483,15 @@ def periodic_cleanup():
             keys_to_remove = list(closing_odds.keys())[:-500]
             for k in keys_to_remove:
                 del closing_odds[k]
+            for ev in {k.rsplit("|", 1)[0] for k in keys_to_remove}:
+                _stats_agg.closing_changed(ev)  # P12
         # S6/Issue32: prune seen_signals ใน periodic_cleanup ด้วย (ป้องกัน leak เมื่อ scan lock ค้าง)
         _now_ts_pc = time.time()
         _seen_exp = [k for k, ts in seen_signals.items() if (_now_ts_pc - ts) > SEEN_TTL_SEC]
         for k in _seen_exp:
             del seen_signals[k]
+        # P23: event registry เก็บแค่ EVENT_REGISTRY_DAYS
+        _event_registry.prune()
         # trim _refetch_cache — ลบ entries ที่เกิน 30 วินาที
         now_ts = time.time()
         expired_rc = [k for k, (ts, _) in _refetch_cache.items() if now_ts - ts > 30]
@@ -4958,15 +7522,22 @@ async def scanner_loop():
     global _scan_wakeup
     _scan_wakeup = asyncio.Event()
     await asyncio.sleep(3)
-    log.info(f"[Scanner] v2.0 | interval={SCAN_INTERVAL}s | sports={len(SPORTS)}")
+    log.info(f"[Scanner] v2.0 | interval={SCAN_INTERVAL}s | fast={FAST_SCAN_INTERVAL}s/{FAST_LANE_MIN}m | sports={len(SPORTS)}")
+    _last_housekeep = 0.0
+    _tier = "normal"
     while True:
         # S7: log auto_scan state every loop to trace silent stops
-        log.info(f"[Scanner] tick | auto_scan={auto_scan} | db_halted={_db_write_halted} | api={api_remaining}")
+        log.info(f"[Scanner] tick ({_tier}) | auto_scan={auto_scan} | db_halted={_db_write_halted} | api={api_remaining}")
         if auto_scan:
             try: await do_scan()
             except Exception as e: log.error(f"[Scanner] {e}")
         else:
             log.warning("[Scanner] auto_scan=False — skipping scan this tick")
+        # P19: fast lane ตื่นถี่กว่า SCAN_INTERVAL — housekeeping ยังทำตามจังหวะ SCAN_INTERVAL เดิม
+        if time.time() - _last_housekeep < SCAN_INTERVAL:
+            _tier = await _scanner_wait()
+            continue
+        _last_housekeep = time.time()
         periodic_cleanup()
         # D1: pending TTL cleanup — ลบ signal เก่าเกิน TTL หรือเลยเวลาแข่งแล้ว
         _ttl = SIGNAL_TTL_SEC  # F7
@@ -4997,25 +7568,32 @@ async def scanner_loop():
                     for opp_rec in opportunity_log:
                         if opp_rec.get("id") == _sid:
                             opp_rec["status"] = "expired"
+                            publish_event("opportunity", dict(opp_rec))  # P13
                             break
             log.info(f"[Pending] expired {len(expired)} signal(s)")
-            # S1: split-brain guard — ถ้า writes halted ห้าม fallback SQLite
-            # C3: ใช้ turso_exec เสมอ — มัน route ไป SQLite เองถ้า _turso_ok=False
-            #     ไม่ใช้ sqlite3.connect() โดยตรงเพราะ turso_exec มี fallback ครบแล้ว
-            if not _db_write_halted:
-                async def _expire_db(_sids=list(expired)):
-                    for _sid in _sids:
-                        try:
-                            await turso_exec("UPDATE opportunity_log SET status='expired' WHERE id=?", (_sid,))
-                        except Exception: pass
-                asyncio.get_running_loop().create_task(_expire_db())
-        # v10-1: รอแบบ ถ้า apply_runtime_config เปลี่ยน interval/auto_scan จะปลุก event นี้เพื่อตื่นทันที
-        _scan_wakeup.clear()
-        try:
-            await asyncio.wait_for(_scan_wakeup.wait(), timeout=SCAN_INTERVAL)
-            log.info("[Scanner] woken up by config change")
-        except asyncio.TimeoutError:
-            pass
+            # S1: split-brain guard — halted → spill (ไม่ fallback SQLite); C3: Turso ล่ม → turso_exec route ไป SQLite
+            # P9: ผ่าน queue เดียวกับ INSERT — turso_exec ตรงจะถูก INSERT OR REPLACE ที่ค้างใน queue ทับ
+            for _sid in expired:
+                db_update_opp_status(_sid, "expired")
+        _tier = await _scanner_wait()
+
+
+async def _scanner_wait() -> str:
+    """P19: per-tier wake-up — รอจน tier ใดก็ตามมี sport ถึงคิว (fast lane ตื่นเองโดยไม่รอ SCAN_INTERVAL)
+    v10-1: apply_runtime_config ปลุก _scan_wakeup เพื่อตื่นทันทีเมื่อ interval/auto_scan เปลี่ยน
+    คืนชื่อ tier ที่ปลุก ("config" ถ้าถูกปลุกโดย config)
+    """
+    _scan_wakeup.clear()
+    wakeups = _sport_sched.tier_wakeups()
+    tier = min(wakeups, key=wakeups.get) if wakeups else "normal"
+    # ไม่เกิน SCAN_INTERVAL เพื่อให้ housekeeping เดินตามรอบ; ขั้นต่ำ 5s กัน busy-loop
+    wait = min(SCAN_INTERVAL, max(5.0, wakeups.get(tier, SCAN_INTERVAL)))
+    try:
+        await asyncio.wait_for(_scan_wakeup.wait(), timeout=wait)
+        log.info("[Scanner] woken up by config change")
+        return "config"
+    except asyncio.TimeoutError:
+        return tier if wait < SCAN_INTERVAL else "normal"
 
 
 async def keep_alive_ping():
@@ -5026,9 +7604,8 @@ async def keep_alive_ping():
     log.info(f"[KeepAlive] self-ping loop started → {url}")
     while True:
         try:
-            async with aiohttp.ClientSession() as s:
-                async with s.get(url, timeout=aiohttp.ClientTimeout(total=10)) as r:
-                    log.debug(f"[KeepAlive] ping {r.status}")
+            async with get_http_session().get(url, timeout=aiohttp.ClientTimeout(total=10)) as r:
+                log.debug(f"[KeepAlive] ping {r.status}")
         except Exception as e:
             log.debug(f"[KeepAlive] ping failed: {e}")
         await asyncio.sleep(14 * 60)  # ทุก 14 นาที
@@ -5048,141 +7625,378 @@ except FileNotFoundError:
 
 
 
-_stats_cache: dict = {"data": None, "ts": 0}
-_stats_cache_lock = threading.Lock()  # B3: protect _stats_cache read/write across ThreadingHTTPServer threads
+def _lm_to_dict(m: LineMovement) -> dict:
+    return {"event":m.event,"bookmaker":m.bookmaker,"outcome":m.outcome,
+            "odds_before":float(m.odds_before),"odds_after":float(m.odds_after),
+            "pct_change":float(m.pct_change),"direction":m.direction,
+            "is_steam":m.is_steam,"is_rlm":m.is_rlm,"ts":m.ts}
+
+def _trade_to_dict(t: TradeRecord, clv: tuple) -> dict:
+    """serialize trade สำหรับ dashboard (Force Settle UI) — C8: CLV จาก closing line ไม่ใช่ field เก่า"""
+    c1, c2, c3 = clv
+    return {
+        "signal_id":  t.signal_id,
+        "event":      t.event,
+        "sport":      t.sport,
+        "leg1_bm":    t.leg1_bm,
+        "leg2_bm":    t.leg2_bm,
+        "leg1_team":  t.leg1_team,
+        "leg2_team":  t.leg2_team,
+        "leg1_odds":  t.leg1_odds,
+        "leg2_odds":  t.leg2_odds,
+        "stake1_thb": t.stake1_thb,
+        "stake2_thb": t.stake2_thb,
+        "profit_pct": t.profit_pct,
+        "status":     t.status,
+        "clv_leg1":   c1,
+        "clv_leg2":   c2,
+        "clv_leg3":   c3,
+        "actual_profit_thb": t.actual_profit_thb,
+        "settled_at": t.settled_at,
+        "created_at": t.created_at,
+        "commence_time": t.commence_time,
+        "leg3_bm":    t.leg3_bm,
+        "leg3_team":  t.leg3_team,
+        "leg3_odds":  t.leg3_odds,
+        "stake3_thb": t.stake3_thb,
+        "refetch_ms": json.loads(t.refetch_ms) if t.refetch_ms else None,  # P16
+    }
+
+# ── Dashboard push channel (P13) ──────────────────────────────────
+# /api/stream (SSE): push delta ทันทีที่เกิด แทนการ poll /api/state ทุก 20s
+# serialize ครั้งเดียว แล้วแจกเข้า queue ของแต่ละ client — P14: ทุกอย่างอยู่บน main loop
+SSE_CLIENT_QUEUE = _i("SSE_CLIENT_QUEUE", 256)  # client อ่านช้ากว่านี้ → ตัดทิ้ง ให้ reconnect + resync
+SSE_BACKLOG      = _i("SSE_BACKLOG",      200)  # event ล่าสุดที่เก็บไว้ให้ resume ด้วย Last-Event-ID
+SSE_PING_SEC     = 15                           # comment frame กัน proxy ตัด idle connection
+
+class _SSEClient:
+    __slots__ = ("q", "dropped")
+    def __init__(self):
+        self.q       = asyncio.Queue(maxsize=SSE_CLIENT_QUEUE)
+        self.dropped = False
+
+_sse_clients: set[_SSEClient] = set()
+_sse_backlog: deque = deque(maxlen=SSE_BACKLOG)  # (seq, frame)
+_sse_seq     = 0
+_SSE_RESYNC  = b"event: resync\ndata: {}\n\n"  # client โหลด /api/state + /api/stats ใหม่ทั้งก้อน
+
+def publish_event(kind: str, payload: dict):
+    """ส่ง event ให้ทุก dashboard ที่เปิด /api/stream อยู่ (เรียกบน main loop เท่านั้น)"""
+    global _sse_seq
+    _sse_seq += 1
+    frame = f"id: {_sse_seq}\nevent: {kind}\ndata: {json.dumps(payload, default=str)}\n\n".encode()
+    _sse_backlog.append((_sse_seq, frame))
+    for c in list(_sse_clients):
+        try:
+            c.q.put_nowait(frame)
+        except asyncio.QueueFull:
+            c.dropped = True
+            _sse_clients.discard(c)
+
+def sse_subscribe(last_event_id: str = "") -> _SSEClient:
+    """Last-Event-ID อยู่ใน backlog → ส่ง event ที่พลาดไปต่อ; ไม่งั้นสั่ง resync"""
+    c = _SSEClient()
+    if last_event_id:
+        try: lid = int(last_event_id)
+        except ValueError: lid = -1
+        missed = [f for seq, f in _sse_backlog if seq > lid]
+        gap = lid < 0 or lid > _sse_seq or (_sse_backlog and _sse_backlog[0][0] > lid + 1)
+        if gap or len(missed) >= SSE_CLIENT_QUEUE:
+            c.q.put_nowait(_SSE_RESYNC)
+        else:
+            for f in missed: c.q.put_nowait(f)
+    _sse_clients.add(c)
+    return c
+
+def sse_unsubscribe(c: _SSEClient):
+    _sse_clients.discard(c)
+
+def sse_close_all():
+    """shutdown — ปลุกทุก stream ให้จบ loop"""
+    for c in list(_sse_clients):
+        c.dropped = True
+        try: c.q.put_nowait(b": bye\n\n")
+        except asyncio.QueueFull: pass
+    _sse_clients.clear()
+
+def _trade_changed(t: TradeRecord):
+    """เรียกภายใต้ _data_lock ทุกครั้งที่มี trade ใหม่หรือถูก replace() (settle / manual review)"""
+    _stats_agg.put_trade(t)
+    publish_event("trade", _trade_to_dict(t, _stats_agg.clv_of(t)))
+
+def publish_scan_completed():
+    with _data_lock:
+        stats      = _stats_agg.summary()
+        pending_ct = len(pending)
+    publish_event("scan", {
+        "state": {
+            "auto_scan":        auto_scan,
+            "scan_count":       scan_count,
+            "last_scan_time":   last_scan_time,
+            "api_remaining":    api_remaining,
+            "pending_count":    pending_ct,
+            "confirmed_trades": stats["confirmed_trades"],
+            "pnl":              stats["pnl"],
+        },
+        "stats": stats,
+    })
+
+# ── Incremental stats (P12) ───────────────────────────────────────
+# นับสถิติตอน trade/move เข้า-ออก memory window แทนการวนทั้งหมดทุกครั้งที่ dashboard ขอ
+# move ↔ trade เชื่อมผ่าน index ตาม event — ไม่ต้องเทียบทุก move กับทุก trade
+def _parse_stats_ts(s: str) -> Optional[datetime]:
+    # G9: กัน naive vs aware datetime TypeError
+    try:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except Exception:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+class StatsAggregator:
+    """P12: ตัวนับสถิติ /api/stats แบบ incremental — ทุก method ต้องเรียกภายใต้ _data_lock
+    trade เป็น immutable (replace()) → put_trade() ถอด contribution ตัวเก่าแล้วใส่ตัวใหม่
+    """
+    LINK_WINDOW_SEC = 1800  # move → trade ภายใน 30 นาที ถือว่าสัญญาณนั้น convert
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.version  = 0
+        self._seq     = 0
+        self._trades: dict[str, tuple] = {}            # signal_id → (trade, seq, ts, clv)
+        self._moves:  dict[int, tuple] = {}            # id(move) → (move, ts, link)
+        self._trades_by_event: dict[str, set] = defaultdict(set)
+        self._moves_by_event:  dict[str, set] = defaultdict(set)
+        self.status_n     = defaultdict(int)
+        self.n_moves      = 0
+        self.n_rlm        = 0
+        self.n_steam      = 0
+        self.bm_total     = defaultdict(int)
+        self.bm_sharp     = defaultdict(int)
+        # per kind ("rlm"/"steam"): [moves with ts, converted, linked settled, wins]
+        self.link         = {"rlm": [0, 0, 0, 0], "steam": [0, 0, 0, 0]}
+        self.sport_profit = defaultdict(float)
+        self.sport_stake  = defaultdict(int)
+        self.arb_n        = 0
+        self.arb_pct_sum  = 0.0
+        self.est_profit   = 0.0
+        self.clv_sorted: list[float] = []
+        self.clv_sum      = 0.0
+        self.clv_pos      = 0
+        self.clv_neg      = 0
+
+    def rebuild(self, trades: list, moves: list):
+        self.reset()
+        for t in trades: self.put_trade(t)
+        for m in moves:  self.add_move(m)
+
+    # ── trades ────────────────────────────────────────────────────
+    def _apply_trade(self, t: TradeRecord, clv: tuple, sign: int):
+        self.status_n[t.status] += sign
+        if t.status != "confirmed":
+            return
+        for c in clv:
+            if c is None: continue
+            if sign > 0: insort(self.clv_sorted, c)
+            else:        del self.clv_sorted[bisect_left(self.clv_sorted, c)]
+            self.clv_sum += sign * c
+            if c > 0: self.clv_pos += sign
+            if c < 0: self.clv_neg += sign
+        if t.stake2_thb == 0 and t.leg2_team == "-":
+            return  # I2: value bet — ไม่นับใน ROI / P&L arb
+        stake = t.stake1_thb + t.stake2_thb + (t.stake3_thb or 0)
+        self.sport_profit[t.sport] += sign * t.profit_pct * stake
+        self.sport_stake[t.sport]  += sign * stake
+        if not self.sport_stake[t.sport]:
+            self.sport_stake.pop(t.sport); self.sport_profit.pop(t.sport, None)
+        self.arb_n       += sign
+        self.arb_pct_sum += sign * t.profit_pct
+        if t.actual_profit_thb is None:
+            self.est_profit += sign * t.profit_pct * stake
+
+    def put_trade(self, t: TradeRecord):
+        """trade ใหม่ หรือ trade ที่ถูก replace() (settle / manual review) — upsert ตาม signal_id"""
+        old = self._trades.get(t.signal_id)
+        seq = old[1] if old else self._seq
+        if old:
+            self._apply_trade(old[0], old[3], -1)
+            self._trades_by_event[old[0].event].discard(t.signal_id)
+        else:
+            self._seq += 1
+        clv = calc_clv(t, closing_odds)
+        self._trades[t.signal_id] = (t, seq, _parse_stats_ts(t.created_at), clv)
+        self._trades_by_event[t.event].add(t.signal_id)
+        self._apply_trade(t, clv, +1)
+        self._relink(t.event)
+        if old and old[0].event != t.event:
+            self._relink(old[0].event)
+        self.version += 1
+
+    def remove_trades(self, trades: list):
+        """trade ที่หลุด window (trim) — ถอดเฉพาะ object ที่ยังเป็นตัวปัจจุบันของ signal_id นั้น"""
+        events = set()
+        for t in trades:
+            cur = self._trades.get(t.signal_id)
+            if not cur or cur[0] is not t: continue
+            self._apply_trade(t, cur[3], -1)
+            del self._trades[t.signal_id]
+            self._trades_by_event[t.event].discard(t.signal_id)
+            events.add(t.event)
+        for e in events:
+            self._relink(e)
+        self.version += 1
+
+    def closing_changed(self, event: str):
+        """closing_odds ของ event เปลี่ยน → คำนวณ CLV เฉพาะ trade ของ event นั้นใหม่"""
+        for sid in self._trades_by_event.get(event, ()):
+            t, seq, ts, clv = self._trades[sid]
+            new = calc_clv(t, closing_odds)
+            if new == clv: continue
+            self._apply_trade(t, clv, -1)
+            self._trades[sid] = (t, seq, ts, new)
+            self._apply_trade(t, new, +1)
+        self.version += 1
+
+    def clv_of(self, t: TradeRecord) -> tuple:
+        cur = self._trades.get(t.signal_id)
+        return cur[3] if cur and cur[0] is t else calc_clv(t, closing_odds)
+
+    # ── line movements ────────────────────────────────────────────
+    def _link_move(self, m: LineMovement, ts: Optional[datetime]) -> Optional[tuple]:
+        """(converted, win) — win = None ถ้าไม่มี trade ที่ settled แล้ว match"""
+        if ts is None or not (m.is_rlm or m.is_steam):
+            return None
+        converted, first = False, None
+        for sid in self._trades_by_event.get(m.event, ()):
+            t, seq, t_ts, _ = self._trades[sid]
+            if t.status != "confirmed" or t_ts is None:
+                continue
+            if abs((t_ts - ts).total_seconds()) >= self.LINK_WINDOW_SEC:
+                continue
+            converted = True
+            if t.actual_profit_thb is not None and (first is None or seq < first[1]):
+                first = (t, seq)
+        return converted, (None if first is None else first[0].actual_profit_thb >= 0)
+
+    def _apply_link(self, m: LineMovement, link: Optional[tuple], sign: int):
+        if link is None: return
+        converted, win = link
+        for kind, on in (("rlm", m.is_rlm), ("steam", m.is_steam)):
+            if not on: continue
+            c = self.link[kind]
+            c[0] += sign
+            c[1] += sign * converted
+            if win is not None:
+                c[2] += sign
+                c[3] += sign * win
+
+    def _relink(self, event: str):
+        for mid in self._moves_by_event.get(event, ()):
+            m, ts, link = self._moves[mid]
+            new = self._link_move(m, ts)
+            if new == link: continue
+            self._apply_link(m, link, -1)
+            self._apply_link(m, new, +1)
+            self._moves[mid] = (m, ts, new)
+
+    def _apply_move(self, m: LineMovement, sign: int):
+        self.n_moves += sign
+        self.n_rlm   += sign * m.is_rlm
+        self.n_steam += sign * m.is_steam
+        self.bm_total[m.bookmaker] += sign
+        if m.pct_change < -0.03:
+            self.bm_sharp[m.bookmaker] += sign
+        if not self.bm_total[m.bookmaker]:
+            self.bm_total.pop(m.bookmaker); self.bm_sharp.pop(m.bookmaker, None)
+
+    def add_move(self, m: LineMovement):
+        ts = _parse_stats_ts(m.ts)
+        link = self._link_move(m, ts)
+        self._moves[id(m)] = (m, ts, link)
+        self._moves_by_event[m.event].add(id(m))
+        self._apply_move(m, +1)
+        self._apply_link(m, link, +1)
+        self.version += 1
+
+    def remove_moves(self, moves: list):
+        for m in moves:
+            cur = self._moves.pop(id(m), None)
+            if cur is None: continue
+            self._moves_by_event[m.event].discard(id(m))
+            self._apply_move(m, -1)
+            self._apply_link(m, cur[2], -1)
+        self.version += 1
+
+    # ── read side ─────────────────────────────────────────────────
+    def pnl(self) -> dict:
+        avg_clv    = self.clv_sum / len(self.clv_sorted) if self.clv_sorted else None
+        avg_profit = self.arb_pct_sum / self.arb_n * 100 if self.arb_n else None
+        return {
+            "confirmed":  self.status_n["confirmed"],
+            "rejected":   self.status_n["rejected"],
+            "est_profit": round(self.est_profit),
+            "avg_profit": round(avg_profit,2) if avg_profit is not None else None,
+            "avg_clv":    round(avg_clv,2) if avg_clv is not None else None,
+        }
+
+    def summary(self) -> dict:
+        def _rate(num, den):
+            return num / den * 100 if den > 0 else None
+        rlm, steam = self.link["rlm"], self.link["steam"]
+        arb_total  = self.status_n["confirmed"] + self.status_n["rejected"]
+        avg_clv    = self.clv_sum / len(self.clv_sorted) if self.clv_sorted else None
+        best_clv   = self.clv_sorted[-1] if self.clv_sorted else None
+        sharp_count = self.n_rlm + self.n_steam
+        return {
+            "rlm_conversion_rate":   _rate(rlm[1], rlm[0]),
+            "rlm_win_rate":          _rate(rlm[3], rlm[2]),
+            "rlm_count":             rlm[0],
+            "steam_conversion_rate": _rate(steam[1], steam[0]),
+            "steam_win_rate":        _rate(steam[3], steam[2]),
+            "steam_count":           steam[0],
+            "confirm_rate":    _rate(self.status_n["confirmed"], arb_total),
+            "confirmed_trades":self.status_n["confirmed"],
+            "sharp_count":     sharp_count,
+            "public_count":    max(0, self.n_moves - sharp_count),
+            # D7: % ของ moves ที่ดู "sharp" (odds ลด > 3%) ไม่ใช่ accuracy vs ผลจริง
+            "bm_sharp_move_rate": {bm: self.bm_sharp[bm] / n for bm, n in self.bm_total.items() if n >= 3},
+            "roi_by_sport":    {s: self.sport_profit[s] / st for s, st in self.sport_stake.items() if st > 0},
+            "clv": {
+                "avg":      round(avg_clv,2) if avg_clv is not None else None,
+                "positive": self.clv_pos,
+                "negative": self.clv_neg,
+                "best":     round(best_clv,2) if best_clv is not None else None,
+            },
+            "pnl": self.pnl(),
+        }
+
+_stats_agg = StatsAggregator()
+
+_stats_cache: dict = {"data": None, "ts": 0, "version": -1}
+_stats_cache_lock = threading.Lock()  # B3: protect _stats_cache read/write (calc_stats_cached อาจถูกเรียกนอก loop)
 
 def calc_stats_cached() -> dict:
-    """calc_stats พร้อม cache 15 วินาที — ลดภาระ CPU ตอน dashboard refresh"""
-    # G1/Issue43: short-lock check, compute outside lock, short-lock write
-    # avoids blocking dashboard threads during heavy calc_stats() computation
+    """calc_stats พร้อม cache — P12: สร้างใหม่เฉพาะเมื่อ aggregator เปลี่ยน (version)"""
+    with _data_lock:
+        version = _stats_agg.version
     with _stats_cache_lock:
-        if time.time() - _stats_cache["ts"] < 15 and _stats_cache["data"] is not None:
+        if _stats_cache["version"] == version and _stats_cache["data"] is not None:
             return _stats_cache["data"]
     result = calc_stats()
     with _stats_cache_lock:
-        _stats_cache["data"] = result
-        _stats_cache["ts"]   = time.time()
+        _stats_cache["data"]    = result
+        _stats_cache["ts"]      = time.time()
+        _stats_cache["version"] = version
     return result
 
 def calc_stats() -> dict:
-    """คำนวณสถิติทั้งหมดสำหรับ /api/stats"""
-    # v10-12: snapshot ด้วย lock ก่อนประมวลผล
-    # I6/C6: snapshot closing_odds here once — avoids per-call re-lock inside calc_clv
+    """สถิติทั้งหมดสำหรับ /api/stats — P12: อ่านจาก _stats_agg (ไม่วน moves × trades)"""
     with _data_lock:
-        confirmed    = [t for t in trade_records if t.status == "confirmed"]
-        rejected     = [t for t in trade_records if t.status == "rejected"]
-        rlm_moves    = [m for m in line_movements if m.is_rlm]
-        steam_moves  = [m for m in line_movements if m.is_steam]
-        lm_snap      = list(line_movements)
-        tr_snap      = list(trade_records[-30:])
-        closing_snap = {k: dict(v) for k, v in closing_odds.items()}  # I6: shallow copy under lock
-
-    # ── Win Rate ──────────────────────────────────────────────────
-
-    # เชื่อม RLM กับ trade ที่เกิดขึ้นหลังสัญญาณ (ภายใน 30 นาที)
-    # C2: แยก signal_conversion_rate (signal → confirmed) vs settled_win_rate (actual outcome)
-    # G9: helper กัน naive vs aware datetime TypeError
-    def _parse_ts(s: str) -> datetime:
-        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
-        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-
-    def signal_conversion_rate(moves):
-        """วัด % ของ line-move signals ที่ถูก confirm เป็น trade ภายใน 30 นาที"""
-        if not moves: return None, len(moves)
-        converted = 0
-        total_m = 0
-        for m in moves:
-            try: m_ts = _parse_ts(m.ts)
-            except Exception: continue
-            total_m += 1
-            for t in confirmed:
-                try: t_ts = _parse_ts(t.created_at)
-                except Exception: continue
-                if abs((t_ts - m_ts).total_seconds()) < 1800 and (m.event in t.event or t.event in m.event):
-                    converted += 1
-                    break
-        return (converted / total_m * 100 if total_m > 0 else None), total_m
-
-    def signal_win_rate(moves):
-        """C2: วัด % ที่ trade ที่ match สัญญาณนั้น settled ด้วยกำไร (actual_profit_thb >= 0)"""
-        if not moves: return None, len(moves)
-        wins = 0
-        total = 0
-        settled_confirmed = [t for t in confirmed if t.actual_profit_thb is not None]
-        for m in moves:
-            try: m_ts = _parse_ts(m.ts)
-            except Exception: continue
-            for t in settled_confirmed:
-                try: t_ts = _parse_ts(t.created_at)
-                except Exception: continue
-                if abs((t_ts - m_ts).total_seconds()) < 1800 and (m.event in t.event or t.event in m.event):
-                    total += 1
-                    if t.actual_profit_thb >= 0:
-                        wins += 1
-                    break
-        return (wins / total * 100 if total > 0 else None), len(moves)
-
-    rlm_conv,   rlm_cnt   = signal_conversion_rate(rlm_moves)
-    steam_conv, steam_cnt = signal_conversion_rate(steam_moves)
-    rlm_wr,   _   = signal_win_rate(rlm_moves)
-    steam_wr, _   = signal_win_rate(steam_moves)
-    arb_total    = len(confirmed) + len(rejected)
-    confirm_rate = (len(confirmed) / arb_total * 100) if arb_total > 0 else None
-
-    # I2/I3: define once — used in ROI, P&L, and est_profit
-    arb_confirmed = [t for t in confirmed if not (t.stake2_thb == 0 and t.leg2_team == "-")]
-
-    # ── Sharp vs Public ───────────────────────────────────────────
-    sharp_count  = len(rlm_moves) + len(steam_moves)
-    public_count = max(0, len(lm_snap) - sharp_count)
-
-    # ── Bookmaker Accuracy ────────────────────────────────────────
-    # วัดจาก: ถ้า Pinnacle ขยับ odds ฝั่งไหน แล้ว outcome นั้นชนะบ่อยแค่ไหน
-    # ใช้ line_movements เพื่อดูว่า bookmaker ไหน "รู้ก่อน" (odds ลดลง = favourite จริง)
-    bm_correct = defaultdict(int)
-    bm_total   = defaultdict(int)
-    for m in lm_snap:
-        bm_total[m.bookmaker] += 1
-        # ถ้า odds ลด = เว็บเชื่อว่าจะชนะมากขึ้น = "sharp signal"
-        if m.pct_change < -0.03:
-            bm_correct[m.bookmaker] += 1
-    # D7: เปลี่ยนชื่อ metric ให้ตรงความหมาย — นี่คือ % ของ moves ที่ดู "sharp" ไม่ใช่ accuracy vs ผลจริง
-    bm_sharp_move_rate = {bm: bm_correct[bm]/bm_total[bm]
-                          for bm in bm_total if bm_total[bm] >= 3}
-
-    # ── ROI per Sport ─────────────────────────────────────────────
-    # I2: ROI = arb only (profit_pct * stake is meaningful for arb, not VB edge)
-    sport_profit = defaultdict(float)
-    sport_stake  = defaultdict(float)
-    for t in arb_confirmed:
-        est = t.profit_pct * (t.stake1_thb + t.stake2_thb + (t.stake3_thb or 0))
-        sport_profit[t.sport] += est
-        sport_stake[t.sport]  += (t.stake1_thb + t.stake2_thb + (t.stake3_thb or 0))
-    roi_by_sport = {s: sport_profit[s]/sport_stake[s]
-                    for s in sport_stake if sport_stake[s] > 0}
-
-    # ── CLV Summary ───────────────────────────────────────────────
-    clv_values = []
-    for t in confirmed:
-        c1, c2, c3 = calc_clv(t, closing_snap)
-        if c1 is not None: clv_values.append(c1)
-        if c2 is not None: clv_values.append(c2)
-        if c3 is not None: clv_values.append(c3)
-    avg_clv = sum(clv_values)/len(clv_values) if clv_values else None
-    clv_positive = len([c for c in clv_values if c > 0])
-    clv_negative = len([c for c in clv_values if c < 0])
-    best_clv     = max(clv_values) if clv_values else None
-
-    # ── P&L ───────────────────────────────────────────────────────
-    # I3: est_profit = unsettled arb only (arb_confirmed defined above)
-    unsettled_arb_snap = [t for t in arb_confirmed if t.actual_profit_thb is None]
-    est_profit = sum(t.profit_pct*(t.stake1_thb+t.stake2_thb+(t.stake3_thb or 0)) for t in unsettled_arb_snap)
-    avg_profit = (sum(t.profit_pct for t in arb_confirmed)/len(arb_confirmed)*100) if arb_confirmed else None
-
-    # ── Trade records สำหรับ table ────────────────────────────────
+        data    = _stats_agg.summary()
+        tr_snap = [(t, _stats_agg.clv_of(t)) for t in trade_records[-30:]]
     trade_list = []
-    for t in tr_snap:  # C6: ใช้ tr_snap (snapshot ใน lock) ไม่ใช่ trade_records โดยตรง
-        c1, c2, c3 = calc_clv(t, closing_snap)  # I6: pass snapshot — no per-call lock
+    for t, (c1, c2, c3) in tr_snap:
         trade_list.append({
             "signal_id": t.signal_id, "event": t.event, "sport": t.sport,
             "leg1_bm": t.leg1_bm, "leg2_bm": t.leg2_bm,
@@ -5194,36 +8008,8 @@ def calc_stats() -> dict:
             "leg3_odds": t.leg3_odds, "stake3_thb": t.stake3_thb,
             "created_at": t.created_at,
         })
-
-    return {
-        "rlm_conversion_rate":  rlm_conv,
-        "rlm_win_rate":          rlm_wr,
-        "rlm_count":             rlm_cnt,
-        "steam_conversion_rate": steam_conv,
-        "steam_win_rate":        steam_wr,
-        "steam_count":           steam_cnt,
-        "confirm_rate":    confirm_rate,  # L5: ลบ arb_win_rate (ทำให้สับสน) — ใช้ confirm_rate เอก
-
-        "confirmed_trades":len(confirmed),
-        "sharp_count":     sharp_count,
-        "public_count":    public_count,
-        "bm_sharp_move_rate": bm_sharp_move_rate,
-        "roi_by_sport":    roi_by_sport,
-        "clv": {
-            "avg":      round(avg_clv,2) if avg_clv is not None else None,
-            "positive": clv_positive,
-            "negative": clv_negative,
-            "best":     round(best_clv,2) if best_clv is not None else None,
-        },
-        "pnl": {
-            "confirmed":  len(confirmed),
-            "rejected":   len(rejected),
-            "est_profit": round(est_profit),
-            "avg_profit": round(avg_profit,2) if avg_profit is not None else None,
-            "avg_clv":    round(avg_clv,2) if avg_clv is not None else None,
-        },
-        "trade_records": trade_list,
-    }
+    data["trade_records"] = trade_list
+    return data
 
 
 
@@ -5269,386 +8055,334 @@ def apply_runtime_config(key: str, value: str) -> tuple[bool, str]:
             # B3r: block scan_now in safe-mode
             if _db_write_halted:
                 return False, "🚨 DB write halted — scan blocked (safe-mode)"
-            # trigger scan ทันที — ส่งผ่าน _main_loop เพราะ HTTP thread ไม่มี running loop
-            if _main_loop and _main_loop.is_running():
-                asyncio.run_coroutine_threadsafe(do_scan(), _main_loop)
+            # trigger scan ทันที — P14: dashboard อยู่บน main loop แล้ว → create_task ผ่าน _schedule_coro
+            _schedule_coro(do_scan(manual=True))
             return True, "scan triggered"
         elif key == "clear_seen":
             with _data_lock:
                 seen_signals.clear()  # clear dict — reset all TTL timers
             return True, "seen_signals cleared"
+        elif key == "alias_add":
+            # P27: value = "alias=canonical" เช่น "man utd=Manchester United"
+            alias, sep, canonical = value.partition("=")
+            if not sep:
+                return False, "value must be alias=canonical"
+            ok, msg = _alias_store.add(alias, canonical, "operator")
+            _alias_flush_if_idle()
+            return ok, msg
+        elif key == "alias_remove":
+            ok, msg = _alias_store.remove(value)
+            _alias_flush_if_idle()
+            return ok, msg
         else:
             return False, f"unknown key: {key}"
     except Exception as e:
         return False, str(e)
 
-class DashboardHandler(BaseHTTPRequestHandler):
-    def log_message(self, *args): pass
+# ── Dashboard web app (P14) ───────────────────────────────────────
+# aiohttp บน main event loop — ไม่มี thread ต่อ request, handler อ่าน state ตรงๆ บน loop เดียวกับ scanner
+SSE_MAX_CLIENTS = _i("SSE_MAX_CLIENTS", 20)  # จำกัดจำนวน /api/stream ที่ค้างพร้อมกัน
 
-    def _check_auth(self) -> bool:
-        """ตรวจ Dashboard token (ถ้าตั้งไว้)
-        J7: รองรับทั้ง Bearer header และ ?token= query param
-        """
-        if not DASHBOARD_TOKEN:
-            # I5: allow only if ALLOW_INSECURE_DASHBOARD=true is explicitly set
-            _ALLOW_INSECURE = os.getenv("ALLOW_INSECURE_DASHBOARD", "").lower() == "true"
-            if _ALLOW_INSECURE:
-                return True
-            # block and return 401 — production-safe by default
-            self.send_response(401)
-            body = b'{"error":"DASHBOARD_TOKEN not set. Set ALLOW_INSECURE_DASHBOARD=true to allow unauthenticated access."}'
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", len(body))
-            self.end_headers()
-            self.wfile.write(body)
-            return False
-        # C6: Bearer header หรือ ?token= query param
-        auth = self.headers.get("Authorization", "")
-        if auth == f"Bearer {DASHBOARD_TOKEN}":
-            return True
-        # J7: รองรับ ?token= ด้วย — สะดวกเปิดจาก browser โดยตรง
-        qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-        if qs.get("token", [""])[0] == DASHBOARD_TOKEN:
-            return True
-        self.send_response(401)
-        body = b'{"error":"unauthorized"}'
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", len(body))
-        self.end_headers()
-        self.wfile.write(body)
-        return False
+_dash_runner: Optional[web.AppRunner] = None
 
-    def do_POST(self):
-        """รับ POST จาก Dashboard UI Controls"""
-        if not self._check_auth(): return
-        # Fix 2: strip query params so ?token=xxx doesn't break path matching
-        from urllib.parse import urlparse as _urlparse
-        _clean = _urlparse(self.path).path
-        if _clean == "/api/control":
-            try:
-                length = int(self.headers.get("Content-Length", 0))
-                body   = json.loads(self.rfile.read(length))
-                key    = body.get("key","")
-                value  = str(body.get("value",""))
-                ok, msg = apply_runtime_config(key, value)
-                # save ลง DB ด้วย
-                # R5: one-shot actions ไม่ควร save เป็น persistent cfg_*
-                _non_persistent = {"scan_now", "clear_seen"}
-                if ok and key not in _non_persistent:
-                    db_save_state(f"cfg_{key}", value)
-                    # G6: clear stats cache เมื่อ config เปลี่ยน
-                    with _stats_cache_lock:
-                        _stats_cache["data"] = None
-                        _stats_cache["ts"]   = 0
-                resp = json.dumps({"ok": ok, "msg": msg}).encode()
-                self.send_response(200 if ok else 400)
-                self.send_header("Content-Type","application/json")
-                self.send_header("Content-Length",len(resp))
-                self.end_headers()
-                self.wfile.write(resp)
-            except Exception as e:
-                err = json.dumps({"ok":False,"msg":str(e)}).encode()
-                self.send_response(500)
-                self.send_header("Content-Type","application/json")
-                self.send_header("Content-Length",len(err))
-                self.end_headers()
-                self.wfile.write(err)
-        elif _clean == "/api/settle":
-            # v10-9: Manual Settlement จาก Dashboard
-            _api_sid = None
-            try:
-                # B3: safe-mode guard
-                if _db_write_halted:
-                    raise ValueError("🚨 DB write halted — ระบบ safe-mode ไม่รับ settle")
-                length = int(self.headers.get("Content-Length", 0))
-                body   = json.loads(self.rfile.read(length))
-                sid    = body.get("signal_id", "").strip()
-                result = body.get("result", "").strip().lower()  # leg1|leg2|draw|void
-                if not sid or result not in ("leg1","leg2","draw","void"):
-                    raise ValueError("signal_id and result (leg1/leg2/draw/void) required")
-                # R3: claim _settling — mutual exclusion with cmd_settle and auto-settle
-                with _data_lock:
-                    if sid in _settling:
-                        raise ValueError(f"signal_id '{sid}' is already being settled — retry shortly")
-                    _settling.add(sid)
-                _api_sid = sid  # track for finally release
-                # C2: peek+validate AFTER claim — save must succeed before queue removal
-                with _data_lock:
-                    entry = _pending_settlement.get(sid) or _manual_review_pending.get(sid)
-                    if not entry:
-                        raise ValueError(f"signal_id '{sid}' not found in pending settlement")
-                    t, _cdt_api = entry
-                    if t.status != "confirmed":
-                        raise ValueError(f"Trade {sid} status='{t.status}' — only confirmed trades can be settled")
-                    if t.actual_profit_thb is not None or t.settled_at is not None:
-                        raise ValueError(f"signal_id '{sid}' already settled (P&L={t.actual_profit_thb:+,})")
-                tt = t.stake1_thb + t.stake2_thb + (t.stake3_thb or 0)
-                if result == "leg1":
-                    actual = int(t.leg1_odds * t.stake1_thb) - tt
-                elif result == "leg2":
-                    actual = int(t.leg2_odds * t.stake2_thb) - tt
-                elif result == "draw":
-                    if t.leg3_team and t.leg3_team.lower() == "draw" and t.leg3_odds and t.stake3_thb:
-                        actual = int(t.leg3_odds * t.stake3_thb) - tt
-                    elif t.leg1_team and t.leg1_team.lower() == "draw":
-                        actual = int(t.leg1_odds * t.stake1_thb) - tt
-                    elif t.leg2_team and t.leg2_team.lower() == "draw":
-                        actual = int(t.leg2_odds * t.stake2_thb) - tt
-                    else:
-                        actual = 0
-                else:  # void
-                    actual = 0
-                # S3: use _commit_settlement() — save-before-mutate via run_coroutine_threadsafe
-                try:
-                    if _main_loop and not _main_loop.is_closed():
-                        saved_t = asyncio.run_coroutine_threadsafe(
-                            _commit_settlement(t, actual), _main_loop
-                        ).result(timeout=10)
-                    else:
-                        raise RuntimeError("main loop unavailable")
-                except Exception as _save_err:
-                    raise ValueError(f"DB write failed — settle not committed: {_save_err}") from _save_err
-                # S3: DB committed — now pop queues and clear alert flags atomically
-                with _data_lock:
-                    _pending_settlement.pop(sid, None)
-                    _manual_review_pending.pop(sid, None)
-                    _settle_alerted.discard(sid)          # S2: clear immediately on manual settle
-                    _manual_review_alerted.discard(sid)   # S2: clear immediately on manual settle
-                resp = json.dumps({"ok": True, "msg": f"Settled {result.upper()} | P&L: {actual:+,}", "actual": actual}).encode()
-                self.send_response(200)
-                self.send_header("Content-Type","application/json")
-                self.send_header("Content-Length",len(resp))
-                self.end_headers()
-                self.wfile.write(resp)
-            except Exception as e:
-                err = json.dumps({"ok": False, "msg": str(e)}).encode()
-                self.send_response(400)
-                self.send_header("Content-Type","application/json")
-                self.send_header("Content-Length",len(err))
-                self.end_headers()
-                self.wfile.write(err)
-            finally:
-                # R3: always release settle claim
-                if _api_sid:
-                    with _data_lock:
-                        _settling.discard(_api_sid)
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def do_GET(self):
-        # Health check endpoint สำหรับ Railway (ไม่ต้อง auth) — D2: richer
-        from urllib.parse import urlparse as _up_health
-        _req_path = _up_health(self.path).path
-        # E4: /ready = readiness probe — returns 503 when DB is halted (for Railway/Render health checks)
-        if _req_path == "/ready":
-            body = json.dumps({"ready": not _db_write_halted}).encode()
-            self.send_response(200 if not _db_write_halted else 503)
-            self.send_header("Content-Type","application/json")
-            self.send_header("Content-Length",len(body))
-            self.end_headers()
-            self.wfile.write(body)
-            return
-        if _req_path == "/health":
-            uptime_s = int(time.time() - _bot_start_ts)
-            uptime_str = f"{uptime_s//3600}h{(uptime_s%3600)//60}m"
-            # C5: /health is public (Railway check) — minimal response only, no internal telemetry
-            health = {
-                "status":  "ok" if not _db_write_halted else "degraded",
-                "uptime":  uptime_str,
-            }
-            body = json.dumps(health).encode()
-            # G2: /health = liveness (process alive) → always 200; /ready = readiness → 503 when DB halted
-            self.send_response(200)
-            self.send_header("Content-Type","application/json")
-            self.send_header("Content-Length",len(body))
-            self.end_headers()
-            self.wfile.write(body)
-            return
+def _json(data, status: int = 200) -> web.Response:
+    return web.Response(text=json.dumps(data, default=str), status=status, content_type="application/json")
 
-        # strip query params for path matching
-        from urllib.parse import urlparse
-        clean_path = urlparse(self.path).path
+def _dash_auth_error(request: web.Request) -> Optional[web.Response]:
+    """ตรวจ Dashboard token (ถ้าตั้งไว้) — คืน response 401 ถ้าไม่ผ่าน
+    J7: รองรับทั้ง Bearer header และ ?token= query param
+    """
+    if not DASHBOARD_TOKEN:
+        # I5: allow only if ALLOW_INSECURE_DASHBOARD=true is explicitly set
+        if os.getenv("ALLOW_INSECURE_DASHBOARD", "").lower() == "true":
+            return None
+        # block and return 401 — production-safe by default
+        return _json({"error": "DASHBOARD_TOKEN not set. Set ALLOW_INSECURE_DASHBOARD=true to allow unauthenticated access."}, 401)
+    # C6: Bearer header หรือ ?token= query param
+    if request.headers.get("Authorization", "") == f"Bearer {DASHBOARD_TOKEN}":
+        return None
+    if request.query.get("token", "") == DASHBOARD_TOKEN:
+        return None
+    return _json({"error": "unauthorized"}, 401)
+
+@web.middleware
+async def _dash_auth_middleware(request: web.Request, handler):
+    # J4/C3: protect ALL non-health paths — both /api/* and HTML page
+    if request.path not in ("/health", "/ready"):
+        denied = _dash_auth_error(request)
+        if denied is not None:
+            return denied
+    return await handler(request)
+
+async def _dash_ready(request: web.Request) -> web.Response:
+    # E4: /ready = readiness probe — returns 503 when DB is halted (for Railway/Render health checks)
+    return _json({"ready": not _db_write_halted}, 200 if not _db_write_halted else 503)
+
+async def _dash_health(request: web.Request) -> web.Response:
+    uptime_s = int(time.time() - _bot_start_ts)
+    # C5: /health is public (Railway check) — minimal response only, no internal telemetry
+    # G2: /health = liveness (process alive) → always 200; /ready = readiness → 503 when DB halted
+    return _json({
+        "status":  "ok" if not _db_write_halted else "degraded",
+        "uptime":  f"{uptime_s//3600}h{(uptime_s%3600)//60}m",
+    })
+
+async def _dash_state(request: web.Request) -> web.Response:
+    with _data_lock:
+        lm_snap    = list(line_movements[-50:])
+        opp_snap   = list(opportunity_log[-50:])
+        tr_snap    = [(t, _stats_agg.clv_of(t)) for t in trade_records[-30:]]
+        ps_snap    = list(_pending_settlement.values())
+        mr_snap    = list(_manual_review_pending.values())  # K3: manual review queue
+        pending_ct = len(pending)
+        pnl_snap   = _stats_agg.pnl()  # P12: est_profit/avg_profit/avg_clv นับ incremental แล้ว
+        _vb_snap   = list(_pending_vb.items())  # D6
+    lm_list = [_lm_to_dict(m) for m in lm_snap]
+    tr_list = [_trade_to_dict(t, clv) for t, clv in tr_snap]
+
+    data = {
+        "auto_scan":       auto_scan,
+        "scan_count":      scan_count,
+        "last_scan_time":  last_scan_time,
+        "pending_count":   pending_ct,
+        "api_remaining":   api_remaining,
+        "quota_warn_at":   QUOTA_WARN_AT,
+        "total_stake_thb": int(TOTAL_STAKE_THB),
+        "min_profit_pct":  float(MIN_PROFIT_PCT),
+        "max_odds":        float(MAX_ODDS_ALLOWED),
+        "scan_interval":   SCAN_INTERVAL,
+        "scan_plan":       _sport_sched.snapshot(),  # P18: next scan + credit plan ราย sport
+        "book_stream":     _book_stream.snapshot(),  # P22: Polymarket book mirror
+        "name_matcher":    _team_matcher.cache_info(),  # P25: LRU hit rate ของ fuzzy engine
+        "aliases":         _alias_store.snapshot(),     # P27: learned/operator aliases
+        "bookmakers":      _books.snapshot(),           # P29: id / fee / cap / metadata ที่ resolve แล้ว
+        "db_mode":         "turso" if _turso_ok else ("halted" if _db_write_halted else "sqlite"),
+        "db_write_halted": _db_write_halted,
+        "line_move_count": len(lm_snap),
+        "confirmed_trades":pnl_snap["confirmed"],
+        "manual_review_count": len(mr_snap),  # K3
+        "opportunities":   opp_snap,
+        "line_movements":  lm_list,
+        "trade_records":   tr_list,
+        "unsettled_trades": [
+            {
+                "signal_id":  t.signal_id,
+                "event":      t.event,
+                "leg1_bm":    t.leg1_bm,
+                "leg2_bm":    t.leg2_bm,
+                "profit_pct": t.profit_pct,
+                "stake1_thb": t.stake1_thb,
+                "stake2_thb": t.stake2_thb,
+                "created_at": t.created_at,
+                "commence_time": t.commence_time,
+                "leg3_bm":    t.leg3_bm,
+                "leg3_team":  t.leg3_team,
+                "leg3_odds":  t.leg3_odds,
+                "stake3_thb": t.stake3_thb,
+            }
+            for t, _dt in ps_snap
+        ],
+        "manual_review_trades": [  # L2: full details for dashboard Force Settle UI
+            {
+                "signal_id":  t.signal_id,
+                "event":      t.event,
+                "sport":      t.sport,
+                "leg1_bm":    t.leg1_bm,
+                "leg2_bm":    t.leg2_bm,
+                "leg1_team":  t.leg1_team,
+                "leg2_team":  t.leg2_team,
+                "leg1_odds":  t.leg1_odds,
+                "leg2_odds":  t.leg2_odds,
+                "profit_pct": t.profit_pct,
+                "stake1_thb": t.stake1_thb,
+                "stake2_thb": t.stake2_thb,
+                "created_at": t.created_at,
+                "commence_time": t.commence_time,
+                "leg3_bm":    t.leg3_bm,
+                "leg3_team":  t.leg3_team,
+                "leg3_odds":  t.leg3_odds,
+                "stake3_thb": t.stake3_thb,
+                "needs_manual_review": True,
+            }
+            for t, _dt in mr_snap
+        ],
+        "pnl":             pnl_snap,
+        "pending_valuebets": [
+            {
+                "signal_id": sid,
+                "event":     vb.event,
+                "bookmaker": vb.bookmaker,
+                "outcome":   vb.outcome,
+                "grade":     vb.grade,
+                "edge_pct":  vb.edge_pct,
+                "stake":     vb.rec_stake_thb,
+                "soft_odds": vb.soft_odds,
+            }
+            for sid, (vb, _ts) in _vb_snap
+        ],
+    }
+    return _json(data)
+
+async def _dash_stats(request: web.Request) -> web.Response:
+    return _json(calc_stats_cached())
+
+async def _dash_stream(request: web.Request) -> web.StreamResponse:
+    """P13: SSE — ค้าง connection ไว้ ส่ง event จาก publish_event() จน client หลุด/ถูกตัด"""
+    if len(_sse_clients) >= SSE_MAX_CLIENTS:
+        return _json({"error": "too many live streams"}, 503)
+    client = sse_subscribe(request.headers.get("Last-Event-ID", ""))
+    resp = web.StreamResponse(headers={
+        "Content-Type":      "text/event-stream",
+        "Cache-Control":     "no-cache",
+        "X-Accel-Buffering": "no",  # proxy ห้าม buffer stream
+    })
+    try:
+        await resp.prepare(request)
+        await resp.write(b"retry: 3000\n\n")
+        while not client.dropped:
+            try:
+                frame = await asyncio.wait_for(client.q.get(), SSE_PING_SEC)
+            except asyncio.TimeoutError:
+                frame = b": ping\n\n"
+            await resp.write(frame)
+    except (ConnectionResetError, ConnectionError):
+        pass  # client ปิด tab / network หลุด
+    finally:
+        sse_unsubscribe(client)
+    return resp
 
-        # J4/C3: protect ALL non-health paths — both /api/* and HTML page
-        # _check_auth() blocks if no token and ALLOW_INSECURE_DASHBOARD!=true
-        if not self._check_auth(): return
+async def _dash_control(request: web.Request) -> web.Response:
+    """รับ POST จาก Dashboard UI Controls"""
+    try:
+        body   = await request.json()
+        key    = body.get("key","")
+        value  = str(body.get("value",""))
+        ok, msg = apply_runtime_config(key, value)
+        # R5: one-shot actions ไม่ควร save เป็น persistent cfg_*
+        _non_persistent = {"scan_now", "clear_seen", "alias_add", "alias_remove"}  # P27: alias อยู่ใน team_aliases แล้ว
+        if ok and key not in _non_persistent:
+            db_save_state(f"cfg_{key}", value)
+            # G6: clear stats cache เมื่อ config เปลี่ยน
+            with _stats_cache_lock:
+                _stats_cache["data"] = None
+                _stats_cache["ts"]   = 0
+        return _json({"ok": ok, "msg": msg}, 200 if ok else 400)
+    except Exception as e:
+        return _json({"ok": False, "msg": str(e)}, 500)
 
-        if clean_path == "/api/state":
+async def _dash_settle(request: web.Request) -> web.Response:
+    """v10-9: Manual Settlement จาก Dashboard"""
+    _api_sid = None
+    try:
+        # B3: safe-mode guard
+        if _db_write_halted:
+            raise ValueError("🚨 DB write halted — ระบบ safe-mode ไม่รับ settle")
+        body   = await request.json()
+        sid    = body.get("signal_id", "").strip()
+        result = body.get("result", "").strip().lower()  # leg1|leg2|draw|void
+        if not sid or result not in ("leg1","leg2","draw","void"):
+            raise ValueError("signal_id and result (leg1/leg2/draw/void) required")
+        # R3: claim _settling — mutual exclusion with cmd_settle and auto-settle
+        with _data_lock:
+            if sid in _settling:
+                raise ValueError(f"signal_id '{sid}' is already being settled — retry shortly")
+            _settling.add(sid)
+        _api_sid = sid  # track for finally release
+        # C2: peek+validate AFTER claim — save must succeed before queue removal
+        with _data_lock:
+            entry = _pending_settlement.get(sid) or _manual_review_pending.get(sid)
+            if not entry:
+                raise ValueError(f"signal_id '{sid}' not found in pending settlement")
+            t, _cdt_api = entry
+            if t.status != "confirmed":
+                raise ValueError(f"Trade {sid} status='{t.status}' — only confirmed trades can be settled")
+            if t.actual_profit_thb is not None or t.settled_at is not None:
+                raise ValueError(f"signal_id '{sid}' already settled (P&L={t.actual_profit_thb:+,})")
+        tt = t.stake1_thb + t.stake2_thb + (t.stake3_thb or 0)
+        if result == "leg1":
+            actual = int(t.leg1_odds * t.stake1_thb) - tt
+        elif result == "leg2":
+            actual = int(t.leg2_odds * t.stake2_thb) - tt
+        elif result == "draw":
+            if t.leg3_team and t.leg3_team.lower() == "draw" and t.leg3_odds and t.stake3_thb:
+                actual = int(t.leg3_odds * t.stake3_thb) - tt
+            elif t.leg1_team and t.leg1_team.lower() == "draw":
+                actual = int(t.leg1_odds * t.stake1_thb) - tt
+            elif t.leg2_team and t.leg2_team.lower() == "draw":
+                actual = int(t.leg2_odds * t.stake2_thb) - tt
+            else:
+                actual = 0
+        else:  # void
+            actual = 0
+        def _settled():
+            # S3: DB committed — now pop queues and clear alert flags atomically
             with _data_lock:
-                confirmed  = [t for t in trade_records if t.status=="confirmed"]
-                rejected   = [t for t in trade_records if t.status=="rejected"]
-                lm_snap    = list(line_movements[-50:])
-                opp_snap   = list(opportunity_log[-50:])
-                tr_snap    = list(trade_records[-30:])
-                ps_snap    = list(_pending_settlement.values())
-                mr_snap    = list(_manual_review_pending.values())  # K3: manual review queue
-                pending_ct = len(pending)
-            # J3/I3: est_profit = unsettled arb only (matches calc_stats logic)
-            _arb_confirmed = [t for t in confirmed if not (t.stake2_thb == 0 and t.leg2_team == "-")]
-            _unsettled_arb = [t for t in _arb_confirmed if t.actual_profit_thb is None]
-            est_profit = sum(t.profit_pct*(t.stake1_thb+t.stake2_thb+(t.stake3_thb or 0)) for t in _unsettled_arb)
-            avg_profit = (sum(t.profit_pct for t in _arb_confirmed)/len(_arb_confirmed)*100) if _arb_confirmed else None
-            clv_values = []
-            for t in confirmed:
-                c1, c2, c3 = calc_clv(t)
-                if c1 is not None: clv_values.append(c1)
-                if c2 is not None: clv_values.append(c2)
-                if c3 is not None: clv_values.append(c3)
-            avg_clv = sum(clv_values)/len(clv_values) if clv_values else None
-
-            lm_list = [{"event":m.event,"bookmaker":m.bookmaker,"outcome":m.outcome,
-                        "odds_before":float(m.odds_before),"odds_after":float(m.odds_after),
-                        "pct_change":float(m.pct_change),"direction":m.direction,
-                        "is_steam":m.is_steam,"is_rlm":m.is_rlm,"ts":m.ts}
-                       for m in lm_snap]
-
-            # serialize trade_records for dashboard Force Settle UI
-            def _tr_to_dict(t: TradeRecord) -> dict:
-                c1, c2, c3 = calc_clv(t)  # C8: use computed CLV not stale field
-                return {
-                    "signal_id":  t.signal_id,
-                    "event":      t.event,
-                    "sport":      t.sport,
-                    "leg1_bm":    t.leg1_bm,
-                    "leg2_bm":    t.leg2_bm,
-                    "leg1_team":  t.leg1_team,
-                    "leg2_team":  t.leg2_team,
-                    "leg1_odds":  t.leg1_odds,
-                    "leg2_odds":  t.leg2_odds,
-                    "stake1_thb": t.stake1_thb,
-                    "stake2_thb": t.stake2_thb,
-                    "profit_pct": t.profit_pct,
-                    "status":     t.status,
-                    "clv_leg1":   c1,
-                    "clv_leg2":   c2,
-                    "clv_leg3":   c3,
-                    "actual_profit_thb": t.actual_profit_thb,
-                    "settled_at": t.settled_at,
-                    "created_at": t.created_at,
-                    "commence_time": t.commence_time,
-                    "leg3_bm":    t.leg3_bm,
-                    "leg3_team":  t.leg3_team,
-                    "leg3_odds":  t.leg3_odds,
-                    "stake3_thb": t.stake3_thb,
-                }
-            tr_list = [_tr_to_dict(t) for t in tr_snap]
-            # D6: snapshot _pending_vb ใต้ _data_lock กัน race condition
+                _pending_settlement.pop(sid, None)
+                _manual_review_pending.pop(sid, None)
+                _settle_alerted.discard(sid)          # S2: clear immediately on manual settle
+                _manual_review_alerted.discard(sid)   # S2: clear immediately on manual settle
+        # S3: save-before-mutate — P14: await ตรงบน loop (ไม่ต้อง run_coroutine_threadsafe)
+        # shield: timeout แค่ตอบ dashboard — ไม่ cancel write กลางทาง (DB ลงแล้วแต่ memory ไม่ swap)
+        commit = asyncio.ensure_future(_commit_settlement(t, actual))
+        try:
+            await asyncio.wait_for(asyncio.shield(commit), 10)
+        except asyncio.TimeoutError:
+            def _finish(f: asyncio.Future, _sid=sid):
+                try:
+                    if f.cancelled() or f.exception() is not None:
+                        log.error(f"[Settle] {_sid} background commit failed: "
+                                  f"{'cancelled' if f.cancelled() else f.exception()!r}")
+                    else:
+                        _settled()
+                        log.info(f"[Settle] {_sid} background commit done")
+                finally:
+                    with _data_lock:
+                        _settling.discard(_sid)  # R3: ถือ claim จน write จบจริง
+            commit.add_done_callback(_finish)
+            _api_sid = None  # claim ปล่อยโดย _finish
+            return _json({"ok": False, "pending": True,
+                          "msg": f"DB write ยังไม่เสร็จใน 10s — settle {sid} จะ commit ต่อเบื้องหลัง (อย่ากดซ้ำ)"}, 202)
+        except Exception as _save_err:
+            raise ValueError(f"DB write failed — settle not committed: {_save_err}") from _save_err
+        _settled()
+        return _json({"ok": True, "msg": f"Settled {result.upper()} | P&L: {actual:+,}", "actual": actual})
+    except Exception as e:
+        return _json({"ok": False, "msg": str(e)}, 400)
+    finally:
+        # R3: always release settle claim
+        if _api_sid:
             with _data_lock:
-                _vb_snap = list(_pending_vb.items())
-
-            data = {
-                "auto_scan":       auto_scan,
-                "scan_count":      scan_count,
-                "last_scan_time":  last_scan_time,
-                "pending_count":   pending_ct,
-                "api_remaining":   api_remaining,
-                "quota_warn_at":   QUOTA_WARN_AT,
-                "total_stake_thb": int(TOTAL_STAKE_THB),
-                "min_profit_pct":  float(MIN_PROFIT_PCT),
-                "max_odds":        float(MAX_ODDS_ALLOWED),
-                "scan_interval":   SCAN_INTERVAL,
-                "db_mode":         "turso" if _turso_ok else ("halted" if _db_write_halted else "sqlite"),
-                "db_write_halted": _db_write_halted,
-                "line_move_count": len(lm_snap),
-                "confirmed_trades":len(confirmed),
-                "manual_review_count": len(mr_snap),  # K3
-                "opportunities":   opp_snap,
-                "line_movements":  lm_list,
-                "trade_records":   tr_list,
-                "unsettled_trades": [
-                    {
-                        "signal_id":  t.signal_id,
-                        "event":      t.event,
-                        "leg1_bm":    t.leg1_bm,
-                        "leg2_bm":    t.leg2_bm,
-                        "profit_pct": t.profit_pct,
-                        "stake1_thb": t.stake1_thb,
-                        "stake2_thb": t.stake2_thb,
-                        "created_at": t.created_at,
-                        "commence_time": t.commence_time,
-                        "leg3_bm":    t.leg3_bm,
-                        "leg3_team":  t.leg3_team,
-                        "leg3_odds":  t.leg3_odds,
-                        "stake3_thb": t.stake3_thb,
-                    }
-                    for t, _dt in ps_snap
-                ],
-                "manual_review_trades": [  # L2: full details for dashboard Force Settle UI
-                    {
-                        "signal_id":  t.signal_id,
-                        "event":      t.event,
-                        "sport":      t.sport,
-                        "leg1_bm":    t.leg1_bm,
-                        "leg2_bm":    t.leg2_bm,
-                        "leg1_team":  t.leg1_team,
-                        "leg2_team":  t.leg2_team,
-                        "leg1_odds":  t.leg1_odds,
-                        "leg2_odds":  t.leg2_odds,
-                        "profit_pct": t.profit_pct,
-                        "stake1_thb": t.stake1_thb,
-                        "stake2_thb": t.stake2_thb,
-                        "created_at": t.created_at,
-                        "commence_time": t.commence_time,
-                        "leg3_bm":    t.leg3_bm,
-                        "leg3_team":  t.leg3_team,
-                        "leg3_odds":  t.leg3_odds,
-                        "stake3_thb": t.stake3_thb,
-                        "needs_manual_review": True,
-                    }
-                    for t, _dt in mr_snap
-                ],
-                "pnl": {
-                    "confirmed":  len(confirmed),
-                    "rejected":   len(rejected),
-                    "est_profit": round(est_profit),
-                    "avg_profit": round(avg_profit,2) if avg_profit is not None else None,
-                    "avg_clv":    round(avg_clv,2) if avg_clv is not None else None,
-                },
-                "pending_valuebets": [
-                    {
-                        "signal_id": sid,
-                        "event":     vb.event,
-                        "bookmaker": vb.bookmaker,
-                        "outcome":   vb.outcome,
-                        "grade":     vb.grade,
-                        "edge_pct":  vb.edge_pct,
-                        "stake":     vb.rec_stake_thb,
-                        "soft_odds": vb.soft_odds,
-                    }
-                    for sid, (vb, _ts) in _vb_snap
-                ],
-            }
-            body = json.dumps(data, default=str).encode()
-            self.send_response(200)
-            self.send_header("Content-Type","application/json")
-            self.send_header("Content-Length",len(body))
-            self.end_headers()
-            self.wfile.write(body)
-        elif clean_path == "/api/stats":
-            body = json.dumps(calc_stats_cached(), default=str).encode()
-            self.send_response(200)
-            self.send_header("Content-Type","application/json")
-            self.send_header("Content-Length",len(body))
-            self.end_headers()
-            self.wfile.write(body)
-        else:
-            body = DASHBOARD_HTML.encode()
-            self.send_response(200)
-            self.send_header("Content-Type","text/html; charset=utf-8")
-            self.send_header("Content-Length",len(body))
-            self.end_headers()
-            self.wfile.write(body)
-
-
-class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
-    """Thread-per-request HTTP server — prevents Dashboard from blocking"""
-    daemon_threads = True
-
-def start_dashboard():
-    server = ThreadingHTTPServer(("0.0.0.0", PORT), DashboardHandler)
-    log.info(f"[Dashboard] http://0.0.0.0:{PORT} (ThreadingHTTPServer)")
-    server.serve_forever()
+                _settling.discard(_api_sid)
+
+async def _dash_index(request: web.Request) -> web.Response:
+    return web.Response(text=DASHBOARD_HTML, content_type="text/html", charset="utf-8")
+
+def build_dashboard_app() -> web.Application:
+    app = web.Application(middlewares=[_dash_auth_middleware], client_max_size=64 * 1024)
+    app.router.add_get("/ready",        _dash_ready)
+    app.router.add_get("/health",       _dash_health)
+    app.router.add_get("/api/state",    _dash_state)
+    app.router.add_get("/api/stats",    _dash_stats)
+    app.router.add_get("/api/stream",   _dash_stream)
+    app.router.add_post("/api/control", _dash_control)
+    app.router.add_post("/api/settle",  _dash_settle)
+    app.router.add_get("/{tail:.*}",    _dash_index)  # path อื่นทั้งหมด → dashboard HTML
+    return app
+
+async def start_dashboard():
+    """เรียกใน post_init() — serve บน main loop"""
+    global _dash_runner
+    _dash_runner = web.AppRunner(build_dashboard_app(), access_log=None)
+    await _dash_runner.setup()
+    await web.TCPSite(_dash_runner, "0.0.0.0", PORT, shutdown_timeout=5).start()
+    log.info(f"[Dashboard] http://0.0.0.0:{PORT} (aiohttp)")
+
+async def stop_dashboard():
+    global _dash_runner
+    runner, _dash_runner = _dash_runner, None
+    if runner is None: return
+    sse_close_all()  # ปลด /api/stream ที่ค้างอยู่ ไม่ให้ถ่วง shutdown
+    await runner.cleanup()
 
 
 # ══════════════════════════════════════════════════════════════════
@@ -5662,29 +8396,28 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def post_init(app: Application):
-    global trade_records, opportunity_log, line_movements, scan_count, auto_scan, last_scan_time, api_remaining, _main_loop, _scan_lock, _ODDS_API_SEM
+    global trade_records, opportunity_log, line_movements, scan_count, auto_scan, last_scan_time, api_remaining, _main_loop, _scan_lock, _ODDS_API_SEM, _replica_lock
     # B1: สร้าง asyncio.Lock ใน event loop ที่ถูกต้อง
     _scan_lock    = asyncio.Lock()
+    _replica_lock = asyncio.Lock()  # P11
     # F5: สร้าง Semaphore ที่นี่เลย — ไม่ lazy-init ใน fetch_all_async (กัน race condition)
     _ODDS_API_SEM = asyncio.Semaphore(5)
     # #33 บันทึก main event loop สำหรับ cross-thread db saves
     _main_loop = asyncio.get_running_loop()
+    # P9: write-behind queue ต้องพร้อมก่อน turso_init (มี db_save_state ข้างใน)
+    start_write_queue()
+    # P5: pooled HTTP session ผูกกับ main loop — ทุก fetch path ใช้ตัวนี้
+    get_http_session()
 
     # ── init DB ──
     db_init()                     # SQLite local (sync, fallback)
     await turso_init()            # Turso cloud (async)
 
-    # โหลด bot state จาก Turso (persistent) → fallback local SQLite
-    if _turso_ok:
-        scan_count     = int(await db_load_state_async("scan_count", "0"))
-        last_scan_time = await db_load_state_async("last_scan_time", "ยังไม่ได้สแกน")
-        api_remaining  = int(await db_load_state_async("api_remaining", "500"))
-        saved_scan     = await db_load_state_async("auto_scan", "")
-    else:
-        scan_count     = int(db_load_state("scan_count", "0"))
-        last_scan_time = db_load_state("last_scan_time", "ยังไม่ได้สแกน")
-        api_remaining  = int(db_load_state("api_remaining", "500"))
-        saved_scan     = db_load_state("auto_scan", "")
+    # โหลด bot state — P11: Turso mode อ่านจาก replica local ที่เพิ่ง reconcile (ไม่ยิง remote ทีละ key)
+    scan_count     = int(await db_load_state_async("scan_count", "0"))
+    last_scan_time = await db_load_state_async("last_scan_time", "ยังไม่ได้สแกน")
+    api_remaining  = int(await db_load_state_async("api_remaining", "500"))
+    saved_scan     = await db_load_state_async("auto_scan", "")
     # default = True: first deploy (no key in DB) starts scanning automatically
     # If saved value is "False" it may have been written by a DB halt — turso_init()
     # will override it back to True once the connection is confirmed healthy.
@@ -5694,7 +8427,7 @@ async def post_init(app: Application):
     _cfg_keys = ["min_profit_pct", "scan_interval", "max_odds", "min_odds",
                  "cooldown", "total_stake", "kelly_fraction", "use_kelly"]
     for _ck in _cfg_keys:
-        _cv = (await db_load_state_async(f"cfg_{_ck}", "")) if _turso_ok else db_load_state(f"cfg_{_ck}", "")
+        _cv = await db_load_state_async(f"cfg_{_ck}", "")
         if _cv:
             ok, msg = apply_runtime_config(_ck, _cv)
             log.info(f"[Config] restored cfg_{_ck}={_cv} → {msg}" if ok else f"[Config] cfg_{_ck} restore failed: {msg}")
@@ -5704,6 +8437,35 @@ async def post_init(app: Application):
     trade_records.extend(loaded_trades)
     opportunity_log.extend(loaded_opps)
     line_movements.extend(lms)
+    with _data_lock:
+        _stats_agg.rebuild(trade_records, line_movements)  # P12
+    # P18: seed yield ของ scheduler จาก opportunity_log ย้อนหลัง SCHED_YIELD_DAYS วัน (in-memory เก็บแค่ 100)
+    try:
+        _since = (datetime.now(timezone.utc) - timedelta(days=SCHED_YIELD_DAYS)).isoformat()
+        _sport_sched.seed_opportunities(await turso_query(
+            "SELECT sport, created_at FROM opportunity_log WHERE created_at >= ?", (_since,)))
+    except Exception as e:
+        log.warning(f"[Sched] seed yield failed: {e}")
+
+    # P27: learned aliases ก่อน registry — team key ของ event ใหม่ต้องใช้ alias ชุดเดียวกัน
+    try:
+        _alias_store.load(await turso_query("SELECT alias,canonical,source FROM team_aliases"))
+        log.info(f"[Alias] loaded {_alias_store.snapshot()}")
+    except Exception as e:
+        log.warning(f"[Alias] load failed: {e}")
+
+    # P23: event registry — เฉพาะ event ในช่วง EVENT_REGISTRY_DAYS
+    try:
+        _cut = int(time.time() - EVENT_REGISTRY_DAYS * 86400) // EVENT_BUCKET_SEC
+        _event_registry.load(
+            await turso_query("SELECT cid,sport,home,away,commence,bucket,teams FROM event_registry "
+                              "WHERE bucket < 0 OR bucket >= ?", (_cut,)),
+            await turso_query("SELECT s.source,s.source_id,s.cid FROM event_sources s "
+                              "JOIN event_registry e ON e.cid = s.cid WHERE e.bucket < 0 OR e.bucket >= ?", (_cut,)),
+        )
+        log.info(f"[Registry] loaded {_event_registry.snapshot()}")
+    except Exception as e:
+        log.warning(f"[Registry] load failed: {e}")
 
     db_mode = "☁️ Turso" if _turso_ok else "💾 SQLite local (data resets on deploy!)"
     log.info(f"[DB] {db_mode} | trades={len(trade_records)}, opps={len(opportunity_log)}, moves={len(line_movements)}, scans={scan_count}")
@@ -5753,7 +8515,7 @@ async def post_init(app: Application):
     log.info(f"[Settle] restored {len(_pending_settlement)} auto + {len(_manual_review_pending)} manual-review trades | CLV watch={len(_closing_line_watch)}")
 
     app.add_error_handler(error_handler)
-    threading.Thread(target=start_dashboard, daemon=True).start()
+    await start_dashboard()  # P14: aiohttp บน main loop
 
     is_restored = len(trade_records) > 0 or scan_count > 0
     db_mode_str  = "☁️ Turso ✅" if _turso_ok else "⚠️ SQLite (resets on deploy)"
@@ -5776,10 +8538,24 @@ async def post_init(app: Application):
     asyncio.create_task(scanner_loop())
     asyncio.create_task(watch_closing_lines())  # 📌 auto CLV
     asyncio.create_task(settle_completed_trades())  # 🏆 auto settle
+    asyncio.create_task(quote_refresh_loop())  # P17: keep pending legs hot
+    if USE_POLY_STREAM:
+        asyncio.create_task(_book_stream.run())  # P22: Polymarket book mirror
+    if _turso_ok:
+        asyncio.create_task(replica_sync_loop())  # P11: reconcile replica เป็นระยะ
     if os.getenv("KEEP_ALIVE", "true").lower() in ("true","1","yes"):  # v10-15: optional
         asyncio.create_task(keep_alive_ping())
 
 
+async def post_shutdown(app: Application):
+    """P5/P9/P14: ปิด dashboard + flush write-behind queue + ปิด pooled HTTP session ตอน Application หยุด"""
+    await stop_dashboard()
+    await _book_stream.close()
+    await drain_write_queue()
+    await close_turso_session()
+    await close_http_session()
+
+
 def handle_shutdown(signum, frame):
     """G7: save state — SQLite sync ก่อนเสมอ (fast, signal-safe), Turso เฉพาะ loop ไม่วิ่ง"""
     log.info("[Shutdown] กำลังบันทึก state...")
@@ -5798,6 +8574,8 @@ def handle_shutdown(signum, frame):
         log.info("[Shutdown] saved to SQLite")
     except Exception as ex:
         log.error(f"[Shutdown] sqlite save failed: {ex}")
+    # P9: write-behind ที่ยังไม่ flush → spill file (replay ตอน start รอบหน้า)
+    spill_write_queue_sync({f"state:{k}" for k, _ in state_pairs})
     # 2) Turso — P3: ยิง sync เสมอ ไม่เช็ค loop (ใช้ urllib sync ตรงๆ กัน state rollback)
     _url   = _turso_url or TURSO_URL.replace("libsql://", "https://").replace("wss://", "https://")
     _token = _turso_token or TURSO_TOKEN
@@ -5833,6 +8611,7 @@ if __name__ == "__main__":
         Application.builder()
         .token(TELEGRAM_TOKEN)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
     app.add_handler(CallbackQueryHandler(button_handler))
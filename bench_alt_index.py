@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# bench_alt_index.py
+# Benchmark: scan_all / find_polymarket / find_draw_market — linear list vs AltMarketIndex (+ NumPy prematch)
+# Usage: python bench_alt_index.py [events] [markets]   (default 2000 x 500, run from same dir as arb_bot.py)
+import os, random, sys, time
+from datetime import datetime, timezone, timedelta
+
+# arb_bot validates these at import — dummy values are fine for an offline benchmark
+for _k in ("ODDS_API_KEY", "TELEGRAM_TOKEN", "CHAT_ID"):
+    os.environ.setdefault(_k, "bench")
+os.environ.setdefault("ALLOW_INSECURE_DASHBOARD", "true")
+
+import logging
+import arb_bot as bot
+logging.getLogger().setLevel(logging.WARNING)
+
+N_EVENTS  = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+N_MARKETS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+rng = random.Random(42)
+
+_CITIES = ["Boston", "Denver", "Austin", "Madrid", "Lisbon", "Porto", "Munich", "Leeds", "Derby",
+           "Osaka", "Seoul", "Lagos", "Quito", "Cairo", "Dakar", "Perth", "Cork", "Bergen",
+           "Malmo", "Graz", "Lyon", "Nantes", "Turin", "Genoa", "Bilbao", "Sevilla", "Ghent"]
+_NICKS  = ["Falcons", "Rovers", "Wanderers", "Comets", "Hawks", "Tigers", "Sharks", "Wolves",
+           "Rangers", "Pirates", "Titans", "Stallions", "Vikings", "Dragons", "Knights", "Hornets"]
+
+def _team(i: int) -> str:
+    return f"{_CITIES[i % len(_CITIES)]} {_NICKS[(i // len(_CITIES)) % len(_NICKS)]} {i}"
+
+commence = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+last_upd = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+pairs = [(_team(2 * i), _team(2 * i + 1)) for i in range(N_EVENTS)]
+sports = ["basketball_nba", "soccer_epl"]
+odds_by_sport: dict[str, list] = {s: [] for s in sports}
+for i, (home, away) in enumerate(pairs):
+    sport = sports[i % 2]
+    outcomes = [{"name": home, "price": round(rng.uniform(1.6, 2.6), 2)},
+                {"name": away, "price": round(rng.uniform(1.6, 2.6), 2)}]
+    if sport.startswith("soccer"):
+        outcomes.append({"name": "Draw", "price": round(rng.uniform(3.0, 3.8), 2)})
+    odds_by_sport[sport].append({
+        "id": f"ev{i}", "home_team": home, "away_team": away, "commence_time": commence,
+        "bookmakers": [
+            {"key": bk, "title": bk.title(), "markets": [{"key": "h2h", "last_update": last_upd,
+             "outcomes": [{**o, "price": round(o["price"] * rng.uniform(0.97, 1.03), 2)} for o in outcomes]}]}
+            for bk in ("pinnacle", "onexbet")
+        ],
+    })
+
+markets: list[dict] = []
+for j in range(N_MARKETS):
+    home, away = pairs[rng.randrange(N_EVENTS)]
+    if j % 3 == 0:
+        q = f"Will {home} vs {away} end in a draw?"
+        toks = [{"outcome": "Yes", "price": 0.27, "token_id": f"t{j}y"},
+                {"outcome": "No",  "price": 0.73, "token_id": f"t{j}n"}]
+    else:
+        q = f"{home} vs {away}"
+        toks = [{"outcome": home, "price": 0.52, "token_id": f"t{j}a"},
+                {"outcome": away, "price": 0.48, "token_id": f"t{j}b"}]
+    markets.append({"question": q, "slug": f"m{j}", "tokens": toks,
+                    "_liquidity": 50000, "_fee_pct": 0.02, "_sport": "basketball"})
+
+
+def _timed(label: str, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    print(f"  {label:<34} {dt * 1000:10.1f} ms")
+    return out, dt
+
+
+print(f"events={N_EVENTS} alt_markets={N_MARKETS}")
+index, t_build = _timed("AltMarketIndex build", lambda: bot.AltMarketIndex(markets))
+names = [f"{h} vs {a}" for h, a in pairs]
+
+lin_poly, t_lp = _timed("find_polymarket  linear", lambda: [bot.find_polymarket(n, markets) for n in names])
+idx_poly, t_ip = _timed("find_polymarket  indexed", lambda: [bot.find_polymarket(n, index) for n in names])
+lin_draw, t_ld = _timed("find_draw_market linear", lambda: [bot.find_draw_market(n, markets) for n in names])
+idx_draw, t_id = _timed("find_draw_market indexed", lambda: [bot.find_draw_market(n, index) for n in names])
+
+pm_index = bot.AltMarketIndex(markets)
+_timed("AltMarketIndex prematch (NumPy)", lambda: pm_index.prematch(pairs))
+pm_poly, _ = _timed("find_polymarket  prematched", lambda: [bot.find_polymarket(n, pm_index) for n in names])
+pm_draw, _ = _timed("find_draw_market prematched", lambda: [bot.find_draw_market(n, pm_index) for n in names])
+
+def _scan(alt):
+    bot.alert_cooldown.clear()
+    return bot.scan_all(odds_by_sport, alt)
+
+lin_opps, t_ls = _timed("scan_all linear", lambda: _scan(markets))
+idx_opps, t_is = _timed("scan_all indexed (incl. build)", lambda: _scan(bot.AltMarketIndex(markets)))
+
+same = (
+    [p and p["market_url"] for p in lin_poly] == [p and p["market_url"] for p in idx_poly]
+    and [d and d["market_url"] for d in lin_draw] == [d and d["market_url"] for d in idx_draw]
+    and [p and p["market_url"] for p in lin_poly] == [p and p["market_url"] for p in pm_poly]
+    and [d and d["market_url"] for d in lin_draw] == [d and d["market_url"] for d in pm_draw]
+    and len(lin_opps) == len(idx_opps)
+)
+print(f"  results identical: {same}")
+print(f"  speedup scan_all: x{t_ls / t_is:.1f}" if t_is > 0 else "")
@@ -0,0 +1,63 @@
+"""AltMarketIndex ต้องให้ผลเหมือน linear fuzzy scan ทุกกรณี (รวมกฎ substring กลางคำ)
+Run: python -m unittest discover -s tests   (จาก directory เดียวกับ arb_bot.py)
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# arb_bot validates these at import — dummy values are fine offline
+for _k in ("ODDS_API_KEY", "TELEGRAM_TOKEN", "CHAT_ID"):
+    os.environ.setdefault(_k, "test")
+os.environ.setdefault("ALLOW_INSECURE_DASHBOARD", "true")
+
+import logging
+import arb_bot as bot
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def _linear(markets, ta, tb):
+    return [m["slug"] for m in bot._alt_matches(list(markets), ta, tb)]
+
+
+def _indexed(index, ta, tb):
+    return [m["slug"] for m in bot._alt_matches(index, ta, tb)]
+
+
+class AltMarketIndexTest(unittest.TestCase):
+
+    def _assert_same(self, markets, pairs):
+        plain = bot.AltMarketIndex(markets)
+        pre = bot.AltMarketIndex(markets)
+        pre.prematch(pairs)
+        for ta, tb in pairs:
+            want = _linear(markets, ta, tb)
+            self.assertEqual(_indexed(plain, ta, tb), want, (ta, tb))
+            self.assertEqual(_indexed(pre, ta, tb), want, (ta, tb))
+
+    def test_mid_word_substring(self):
+        markets = [{"question": "Borussia Monchengladbach vs Bayern Munich", "slug": "bmg"},
+                   {"question": "Borussia Dortmund vs Bayern Munich", "slug": "bvb"}]
+        self.assertEqual(_linear(markets, "Gladbach", "Bayern Munich"), ["bmg"])
+        self._assert_same(markets, [("Gladbach", "Bayern Munich"), ("Bayern Munich", "Gladbach")])
+
+    def test_question_inside_team_name(self):
+        markets = [{"question": "Napoli", "slug": "nap"}, {"question": "Inter", "slug": "int"}]
+        self._assert_same(markets, [("SSC Napoli", "Napoli Women"), ("Inter Milan", "Internazionale")])
+
+    def test_random_names_match_linear(self):
+        rng = random.Random(7)
+        words = ["united", "city", "real", "sporting", "athletic", "gladbach", "monchengladbach", "borussia",
+                 "inter", "internazionale", "milan", "ac", "fc", "rangers", "islanders", "new york", "san",
+                 "santos", "antos", "madrid", "atletico", "bayern", "munich", "wolves", "wolverhampton"]
+        def name():
+            return " ".join(rng.sample(words, rng.randint(1, 3)))
+        markets = [{"question": f"Will {name()} beat {name()}?" if i % 2 else f"{name()} vs {name()}",
+                    "slug": f"m{i}"} for i in range(300)]
+        pairs = [(name(), name()) for _ in range(300)]
+        self._assert_same(markets, pairs)
+
+
+if __name__ == "__main__":
+    unittest.main()
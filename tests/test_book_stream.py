@@ -0,0 +1,156 @@
+"""BookStream ผ่าน replay transport — snapshot, delta, gap → resync, unsubscribe, stream ตาย → stale
+Run: python -m unittest discover -s tests   (จาก directory เดียวกับ arb_bot.py)
+"""
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# arb_bot validates these at import — dummy values are fine offline
+for _k in ("ODDS_API_KEY", "TELEGRAM_TOKEN", "CHAT_ID"):
+    os.environ.setdefault(_k, "test")
+os.environ.setdefault("ALLOW_INSECURE_DASHBOARD", "true")
+
+import logging
+import arb_bot as bot
+logging.getLogger().setLevel(logging.WARNING)
+
+
+class ReplayTransport:
+    """transport ของ BookStream ที่ส่ง frame ตามที่ test ป้อน — ไม่ตอบ PING (จำลอง stream เงียบ)"""
+
+    def __init__(self):
+        self.frames: asyncio.Queue = asyncio.Queue()
+        self.sent: list = []
+
+    async def connect(self):
+        pass
+
+    async def send(self, text: str):
+        self.sent.append(text if text == "PING" else json.loads(text))
+
+    async def recv(self):
+        return await self.frames.get()
+
+    async def close(self):
+        pass
+
+    def push(self, *msgs):
+        for m in msgs:
+            self.frames.put_nowait(json.dumps(m))
+
+    def subs(self) -> list:
+        return [m for m in self.sent if m != "PING"]
+
+
+def _book(tid, ts, bids, asks):
+    return {"event_type": "book", "asset_id": tid, "timestamp": str(ts),
+            "bids": [{"price": str(p), "size": str(s)} for p, s in bids],
+            "asks": [{"price": str(p), "size": str(s)} for p, s in asks]}
+
+
+def _delta(tid, ts, side, price, size):
+    return {"event_type": "price_change", "timestamp": str(ts),
+            "price_changes": [{"asset_id": tid, "side": side, "price": str(price), "size": str(size)}]}
+
+
+class BookStreamReplayTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._saved = (bot.POLY_STREAM_STALE_SEC, bot.POLY_STREAM_PING_SEC)
+        bot.POLY_STREAM_STALE_SEC, bot.POLY_STREAM_PING_SEC = 0.3, 0.05
+        self.t = ReplayTransport()
+        self.stream = bot.BookStream(transport_factory=lambda: self.t)
+        self.stream.subscribe(["A", "B"])
+        self.task = asyncio.create_task(self.stream.run())
+        await self._until(lambda: self.t.subs())
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        bot.POLY_STREAM_STALE_SEC, bot.POLY_STREAM_PING_SEC = self._saved
+
+    async def _until(self, cond, timeout=2.0):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while not cond():
+            self.assertLess(loop.time(), end, "condition not reached")
+            await asyncio.sleep(0.01)
+
+    async def test_snapshot_delta_gap_resync_stale(self):
+        t, s = self.t, self.stream
+        self.assertEqual(t.subs()[0], {"assets_ids": ["A", "B"], "type": "market"})
+
+        # snapshot
+        t.push(_book("A", 1000, [(0.48, 100), (0.47, 50)], [(0.52, 80)]))
+        await self._until(lambda: s.book("A") is not None)
+        self.assertEqual(s.book("A")["best_bid"], 0.48)
+        self.assertEqual(s.book("A")["best_ask"], 0.52)
+
+        # delta: best bid ใหม่ + ลบ level
+        t.push(_delta("A", 1001, "BUY", 0.49, 30), _delta("A", 1002, "BUY", 0.47, 0))
+        await self._until(lambda: s.book("A")["best_bid"] == 0.49)
+        self.assertEqual([p for p, _ in s.book("A")["bids"]], [0.49, 0.48])
+
+        # gap: delta ย้อนเวลา → ทิ้ง book แล้ว subscribe ใหม่
+        t.push(_delta("A", 990, "SELL", 0.51, 10))
+        await self._until(lambda: {"assets_ids": ["A"], "operation": "subscribe"} in t.subs())
+        self.assertIsNone(s.book("A"))
+        self.assertEqual(s.resyncs, 1)
+        # delta ระหว่างรอ snapshot ไม่ขอซ้ำ
+        t.push(_delta("A", 1003, "BUY", 0.50, 5))
+        await asyncio.sleep(0.05)
+        self.assertEqual(s.resyncs, 1)
+        t.push(_book("A", 1004, [(0.50, 10)], [(0.53, 10)]))
+        await self._until(lambda: s.book("A") is not None)
+        self.assertEqual(s.book("A")["best_bid"], 0.50)
+
+        # gap: delta ของ token ที่ยังไม่มี snapshot หลัง subscribe ครั้งแรกมาแล้ว
+        t.push(_book("B", 1005, [(0.30, 10)], [(0.70, 10)]))
+        await self._until(lambda: s.book("B") is not None)
+        s._books.pop("B")  # จำลอง snapshot หาย
+        t.push(_delta("B", 1006, "BUY", 0.31, 10))
+        await self._until(lambda: {"assets_ids": ["B"], "operation": "subscribe"} in t.subs())
+        self.assertEqual(s.resyncs, 2)
+
+        # token หลุดจากชุด → unsubscribe
+        s.subscribe(["A"])
+        await self._until(lambda: {"assets_ids": ["B"], "operation": "unsubscribe"} in t.subs())
+        self.assertFalse(s.tracks("B"))
+
+        # stream เงียบ (PING ไม่มีใครตอบ) → stale
+        await self._until(lambda: s.book("A") is None)
+        self.assertTrue(s.is_stale("A"))
+        self.assertIn("PING", t.sent)
+
+
+class BookStreamSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (bot.POLY_STREAM_MAX_TOKENS, bot._book_stream)
+        bot.POLY_STREAM_MAX_TOKENS = 2
+        bot._book_stream = bot.BookStream(transport_factory=ReplayTransport)
+
+    def tearDown(self):
+        bot.POLY_STREAM_MAX_TOKENS, bot._book_stream = self._saved
+
+    def test_cap_keeps_caller_order(self):
+        s = bot._book_stream
+        s.subscribe(["C", "", "A", "C", "B"])
+        self.assertTrue(s.tracks("C") and s.tracks("A"))
+        self.assertFalse(s.tracks("B"))
+
+    def test_stale_mirror_falls_back_to_rest_depth(self):
+        bot._book_stream.subscribe(["A"])
+        market = {"_depth": {"A": [(0.55, 100)]}}
+        self.assertTrue(bot._book_stream.is_stale("A"))
+        self.assertEqual(bot._alt_depth(market, "A"), ([(0.55, 100)], False))
+
+
+if __name__ == "__main__":
+    unittest.main()